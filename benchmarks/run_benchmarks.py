@@ -0,0 +1,217 @@
+"""
+End-to-end timings of the context pipeline on synthetic corpora.
+
+For every scale (a multiple of the Tao Analysis size) a corpus is generated
+with ``synthetic_corpus.py`` and the stages of ``main.py --method jixia_gpt``
+are timed separately: preprocessing (cold, and warm from the pickle cache),
+closure computation, topological sort, rendering, output writing, and the
+whole ``build_jixia_context`` call. Each scale runs in its own process, so
+peak RSS is per scale and a scale that crashes or times out is recorded
+instead of ending the suite. One JSON line per scale is appended to
+``--out`` for regression tracking.
+
+Example:
+    python run_benchmarks.py --scales 1,10,100 --out results/pipeline.jsonl
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import asdict, replace
+from typing import Any, Dict, Iterator, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from synthetic_corpus import TAO_ANALYSIS, generate_corpus
+from jixia_lean_utils import preprocess_lean_analysis
+from build_jixia_context import RenderedContextCache, build_jixia_context, collect_closure, query_initial_refs, render_jixia_context, topological_sort
+from prompt_budget import build_symbol_section_index, pack_section_dependencies
+from utils import sort_by_section
+
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "pipeline.jsonl")
+
+
+class StageTimer:
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+def summarize(values: List[int]) -> Dict[str, float]:
+    if not values:
+        return {"mean": 0, "max": 0}
+    return {"mean": round(sum(values) / len(values), 2), "max": max(values)}
+
+def run_stages(corpus: Dict[str, Any], work_dir: str, timer: StageTimer, end_to_end: bool, workers: int | None = None) -> Dict[str, Any]:
+    """Run the pipeline stage by stage on ``corpus``; returns size metrics of the output."""
+    jixia_table = corpus["jixia_table"]
+    aggregated_baseline_data = corpus["aggregated_baseline_data"]
+    cache_dir = os.path.join(work_dir, "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with timer.stage("preprocess_cold"):
+        preprocess_lean_analysis(jixia_table, force_reprocess=True, cache_dir=cache_dir, book_dir=corpus["book_dir"], workers=workers)
+    with timer.stage("preprocess_warm"):
+        mapped_lean_analysis_data, global_symbol_table, global_dependency_table = preprocess_lean_analysis(
+            jixia_table, cache_dir=cache_dir, book_dir=corpus["book_dir"]
+        )
+
+    symbol_section_index = build_symbol_section_index(mapped_lean_analysis_data)
+    render_cache = RenderedContextCache(global_symbol_table)
+    closure_sizes: List[int] = []
+    dependency_files: List[int] = []
+    output_path = os.path.join(work_dir, "processed_data_jixia_gpt.jsonl")
+    with open(output_path, "w") as f:
+        for section in sort_by_section(aggregated_baseline_data.keys()):
+            data = mapped_lean_analysis_data[section]
+            for content in aggregated_baseline_data[section]:
+                query_name = tuple(content["name"])
+                with timer.stage("closure"):
+                    closure = collect_closure(query_initial_refs(data["sym"][query_name]), global_symbol_table)
+                with timer.stage("toposort"):
+                    sorted_symbols = topological_sort(closure, global_symbol_table, query_name)
+                with timer.stage("render"):
+                    lean_context = render_jixia_context(sorted_symbols, global_symbol_table, query_name, content["content"], data["imports"], cache=render_cache)
+                    packed = pack_section_dependencies(section, query_name, mapped_lean_analysis_data, symbol_section_index)
+                with timer.stage("write"):
+                    f.write(json.dumps({"chapter_name": section, "FQN": ".".join(query_name), "content": lean_context, **packed}) + "\n")
+                closure_sizes.append(len(closure))
+                dependency_files.append(len(packed["dependency_files"]))
+
+    if end_to_end:
+        with timer.stage("build_jixia_context"):
+            build_jixia_context(aggregated_baseline_data, mapped_lean_analysis_data, global_symbol_table, global_dependency_table)
+
+    return {
+        "distinct_contexts": render_cache.misses,
+        "closure_size": summarize(closure_sizes),
+        "dependency_files": summarize(dependency_files),
+        "output_bytes": os.path.getsize(output_path),
+    }
+
+def parse_scale(text: str) -> int | float:
+    """``"10"`` -> 10, ``"0.1"`` -> 0.1; integral scales stay ints so record labels read ``x10``."""
+    scale = float(text)
+    return int(scale) if scale.is_integer() else scale
+
+def run_scale(scale: int | float, args: argparse.Namespace) -> Dict[str, Any]:
+    spec = replace(TAO_ANALYSIS.scaled(scale), local_refs=args.local_refs, decls_per_section=args.decls_per_section, seed=args.seed)
+    record: Dict[str, Any] = {
+        "suite": "pipeline",
+        "timestamp": time.time(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "scale": scale,
+        "spec": asdict(spec),
+        "status": "ok",
+    }
+    timer = StageTimer()
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"bench_x{scale}_", dir=args.work_dir)
+    stage = "generate"
+    try:
+        with timer.stage("generate"):
+            corpus = generate_corpus(spec, os.path.join(work_dir, "corpus"))
+        record["corpus"] = corpus["stats"]
+        stage = "pipeline"
+        record.update(run_stages(corpus, work_dir, timer, end_to_end=not args.no_end_to_end, workers=args.workers))
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = {"stage": stage, "type": type(e).__name__, "message": str(e)[:2000], "traceback": traceback.format_exc()[-4000:]}
+    finally:
+        if not args.keep_corpus:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    record["timings_s"] = {name: round(seconds, 4) for name, seconds in timer.timings.items()}
+    record["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return record
+
+def append_record(path: str, record: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def print_record(record: Dict[str, Any]) -> None:
+    corpus = record.get("corpus", {})
+    print(f"x{record['scale']}: {record['status']} ({corpus.get('sections', '?')} sections, {corpus.get('declarations', '?')} declarations, {corpus.get('queries', '?')} queries), peak RSS {record.get('peak_rss_mb', '?')} MB")
+    for name, seconds in record.get("timings_s", {}).items():
+        print(f"  {name:<22}{seconds:>10.3f}s")
+    if record["status"] != "ok":
+        print(f"  failed: {record.get('error', {}).get('type', '')} {record.get('error', {}).get('message', '')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the context pipeline on synthetic corpora.")
+    parser.add_argument("--scales", type=str, default="1,10,100", help="Comma-separated multiples of the Tao Analysis size; fractions such as 0.1 make a quick smoke test.")
+    parser.add_argument("--out", type=str, default=DEFAULT_OUT, help="Results JSONL (appended).")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-scale timeout in seconds.")
+    parser.add_argument("--local-refs", type=float, default=TAO_ANALYSIS.local_refs, help="Mean textbook references per declaration.")
+    parser.add_argument("--decls-per-section", type=int, default=TAO_ANALYSIS.decls_per_section)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="Pass 1 worker processes for the cold preprocess (default: one per CPU).")
+    parser.add_argument("--no-end-to-end", action="store_true", help="Skip the extra full build_jixia_context run.")
+    parser.add_argument("--work-dir", type=str, default=None, help="Where corpora are generated (default: system temp).")
+    parser.add_argument("--keep-corpus", action="store_true")
+    parser.add_argument("--in-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    scales = [parse_scale(s) for s in args.scales.split(",") if s.strip()]
+    if args.in_process:
+        for scale in scales:
+            append_record(args.out, run_scale(scale, args))
+        sys.exit(0)
+
+    # One process per scale: isolated peak RSS, and crashes (e.g. MemoryError
+    # or the OOM killer) are recorded rather than ending the suite.
+    child_args = sys.argv[1:]
+    for scale in scales:
+        command = [sys.executable, os.path.abspath(__file__), *child_args, "--scales", str(scale), "--in-process"]
+        try:
+            proc = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout)
+            failure = None if proc.returncode == 0 else {"type": "ProcessExit", "message": f"exit {proc.returncode}: {proc.stderr[-2000:]}"}
+        except subprocess.TimeoutExpired:
+            failure = {"type": "Timeout", "message": f"scale did not finish in {args.timeout}s"}
+        if failure is not None:
+            append_record(args.out, {
+                "suite": "pipeline",
+                "timestamp": time.time(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "scale": scale,
+                "status": "error",
+                "error": {"stage": "process", **failure},
+            })
+        with open(args.out) as f:
+            print_record(json.loads(f.readlines()[-1]))
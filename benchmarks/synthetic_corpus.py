@@ -0,0 +1,217 @@
+"""
+Synthetic jixia corpora for benchmarking the context pipeline.
+
+Writes ``<out>/processed/<Section>/<Section>.{mod,decl,sym}.json`` in the
+layout of ``processed_analysis`` and ``<out>/book/<Section>.lean`` with
+matching ``ref.range`` byte offsets, plus the aggregated baseline queries
+that ``build_jixia_context`` consumes. The default spec is roughly the size of
+the Tao Analysis corpus (65 sections, ~2600 declarations, 150 queries).
+
+Example:
+    python synthetic_corpus.py /tmp/corpus --scale 10
+"""
+
+import argparse
+import json
+import os
+import random
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, List, Tuple
+
+# Kinds that other declarations can refer to in their types.
+DEFINITION_KINDS = ("definition", "abbrev", "instance", "structure", "inductive")
+HUB_SKEW = 3
+EXTERNAL_NAMESPACES = ("Nat", "Int", "Real", "Set", "Finset", "Function", "le_refl", "Eq")
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    sections: int = 65
+    sections_per_chapter: int = 6
+    decls_per_section: int = 40
+    queries: int = 150
+    # Every section imports the previous section of its chapter; each one
+    # also imports a random earlier section with this probability.
+    cross_imports: float = 0.3
+    # Mean references per declaration to textbook declarations (the graph
+    # density the closure walks) and to Mathlib/Init names (which it skips).
+    # ``locality`` is the share of textbook references into the same section.
+    local_refs: float = 4.0
+    external_refs: float = 20.0
+    locality: float = 0.85
+    theorem_fraction: float = 0.65
+    seed: int = 0
+
+    def scaled(self, factor: float) -> "CorpusSpec":
+        """
+        Same per-section shape with ``factor`` times as many sections and
+        queries; a fractional ``factor`` (e.g. 0.1 for a smoke test) keeps at
+        least one of each.
+        """
+        return replace(self, sections=max(1, round(self.sections * factor)), queries=max(1, round(self.queries * factor)))
+
+
+TAO_ANALYSIS = CorpusSpec()
+
+
+def section_name(i: int, spec: CorpusSpec) -> str:
+    return f"Section_{2 + i // spec.sections_per_chapter}_{1 + i % spec.sections_per_chapter}"
+
+def _count(rng: random.Random, mean: float) -> int:
+    return rng.randint(0, max(0, round(2 * mean)))
+
+def _pick(rng: random.Random, own: List[Tuple[str, ...]], imported: List[Tuple[str, ...]], locality: float, count: int) -> List[Tuple[str, ...]]:
+    picks = []
+    for _ in range(count):
+        pool = own if own and (not imported or rng.random() < locality) else imported
+        if pool:
+            # Skewed towards the first declarations of a pool: a few
+            # foundational definitions are referenced by most later ones.
+            picks.append(pool[int(len(pool) * rng.random() ** HUB_SKEW)])
+    return picks
+
+def _decl_text(kind: str, short: str, type_refs: List[Tuple[str, ...]], value_refs: List[Tuple[str, ...]], doc: bool) -> str:
+    header = f"/-- {kind.capitalize()} {short}, see the text for details. -/\n" if doc else ""
+    type_part = " ∧ ".join(f"{'.'.join(r[1:])} n = n" for r in type_refs) or "n = n"
+    value_part = ", ".join(".".join(r[1:]) for r in value_refs)
+    if kind == "theorem":
+        return f"{header}theorem {short} (n : Nat) : {type_part} := by\n  simp [{value_part}]\n  -- the remaining goals are closed by omega\n  all_goals omega"
+    if kind == "structure":
+        return f"{header}structure {short} where\n  val : Nat\n  -- invariant: {type_part}\n  prop : val = val"
+    if kind == "inductive":
+        return f"{header}inductive {short} where\n  | zero : {short}\n  | succ : {short} → {short}"
+    keyword = {"definition": "def", "abbrev": "abbrev", "instance": "instance"}[kind]
+    body = " + ".join(f"{'.'.join(r[1:])} n" for r in value_refs) or "n"
+    return f"{header}{keyword} {short} (n : Nat) : Nat :=\n  -- {type_part}\n  {body}"
+
+def generate_corpus(spec: CorpusSpec, out_dir: str) -> Dict[str, Any]:
+    """
+    Write a corpus for ``spec`` under ``out_dir`` and return ``jixia_table``,
+    ``book_dir``, ``aggregated_baseline_data`` and size ``stats``.
+    """
+    rng = random.Random(spec.seed)
+    processed_dir = os.path.join(out_dir, "processed")
+    book_dir = os.path.join(out_dir, "book")
+    os.makedirs(book_dir, exist_ok=True)
+    external = [(ns, f"ext_{k}") for ns in EXTERNAL_NAMESPACES for k in range(25)]
+
+    jixia_table: Dict[str, Dict[str, str]] = {}
+    theorems: List[Tuple[str, Tuple[str, ...], str]] = []
+    definitions_by_section: List[List[Tuple[str, ...]]] = []
+    everything_by_section: List[List[Tuple[str, ...]]] = []
+    stats = {"sections": spec.sections, "declarations": 0, "symbols": 0, "references": 0, "book_bytes": 0}
+
+    for i in range(spec.sections):
+        section = section_name(i, spec)
+        chapter = f"Chapter{2 + i // spec.sections_per_chapter}"
+        imported = set()
+        if i % spec.sections_per_chapter:
+            imported.add(i - 1)
+        if i and rng.random() < spec.cross_imports:
+            imported.add(rng.randrange(i))
+        imports = [["Init"], ["Mathlib", "Tactic"]] + [["Analysis", section_name(j, spec)] for j in sorted(imported)]
+
+        definitions = [name for j in sorted(imported) for name in definitions_by_section[j]]
+        everything = [name for j in sorted(imported) for name in everything_by_section[j]]
+        own_definitions: List[Tuple[str, ...]] = []
+        own_everything: List[Tuple[str, ...]] = []
+        decls, syms, texts = [], [], []
+        offset = len("\n".join(f"import {'.'.join(m)}" for m in imports[1:]).encode("utf-8")) + len(f"\n\nnamespace {chapter}\n\n".encode("utf-8"))
+
+        for j in range(spec.decls_per_section):
+            kind = "theorem" if rng.random() < spec.theorem_fraction else rng.choice(DEFINITION_KINDS[:3] if rng.random() < 0.9 else DEFINITION_KINDS)
+            short = f"x{i}_{j}"
+            name = (chapter, short)
+            type_refs = _pick(rng, own_definitions, definitions, spec.locality, _count(rng, spec.local_refs / 2))
+            # Proofs mostly unfold definitions and sometimes use earlier theorems.
+            if kind == "theorem" and rng.random() < 0.3:
+                value_refs = _pick(rng, own_everything, everything, spec.locality, _count(rng, spec.local_refs / 2))
+            else:
+                value_refs = _pick(rng, own_definitions, definitions, spec.locality, _count(rng, spec.local_refs / 2))
+            type_external = [rng.choice(external) for _ in range(_count(rng, spec.external_refs / 2))]
+            value_external = [rng.choice(external) for _ in range(_count(rng, spec.external_refs / 2))]
+            text = _decl_text(kind, short, type_refs, value_refs, doc=rng.random() < 0.3)
+            size = len(text.encode("utf-8"))
+
+            decl: Dict[str, Any] = {
+                "name": list(name),
+                "kind": kind,
+                "modifiers": None,
+                "params": [],
+                "ref": {"range": {"start": offset, "stop": offset + size}, "pp": text, "original": True},
+            }
+            if kind == "structure":
+                decl["fields"] = [{"name": [chapter, short, "val"]}, {"name": [chapter, short, "prop"]}]
+            if kind == "inductive":
+                decl["constructors"] = [{"name": [chapter, chapter, short, c]} for c in ("zero", "succ")]
+            decls.append(decl)
+            syms.append({
+                "name": list(name),
+                "kind": kind,
+                "type": "Nat → Prop" if kind == "theorem" else "Nat → Nat",
+                "isProp": kind == "theorem",
+                "typeReferences": [list(r) for r in type_refs + type_external] or None,
+                "valueReferences": [list(r) for r in value_refs + value_external] or None,
+            })
+            texts.append(text)
+            offset += size + 2
+            stats["references"] += len(type_refs) + len(value_refs)
+
+            own_everything.append(name)
+            if kind == "theorem":
+                theorems.append((section, name, text))
+            else:
+                own_definitions.append(name)
+
+        definitions_by_section.append(own_definitions)
+        everything_by_section.append(own_everything)
+
+        source = "\n".join(f"import {'.'.join(m)}" for m in imports[1:]) + f"\n\nnamespace {chapter}\n\n" + "\n\n".join(texts) + f"\n\nend {chapter}\n"
+        with open(os.path.join(book_dir, f"{section}.lean"), "w", encoding="utf-8") as f:
+            f.write(source)
+
+        section_dir = os.path.join(processed_dir, section)
+        os.makedirs(section_dir, exist_ok=True)
+        paths = {kind: os.path.join(section_dir, f"{section}.{kind}.json") for kind in ("mod", "decl", "sym")}
+        for kind, payload in (("mod", {"imports": imports, "docstring": []}), ("decl", decls), ("sym", syms)):
+            with open(paths[kind], "w") as f:
+                json.dump(payload, f)
+        jixia_table[section] = paths
+        stats["declarations"] += len(decls)
+        stats["symbols"] += len(syms)
+        stats["book_bytes"] += len(source.encode("utf-8"))
+
+    aggregated_baseline_data: Dict[str, List[Dict[str, Any]]] = {}
+    for idx, (section, name, text) in enumerate(sorted(rng.sample(theorems, min(spec.queries, len(theorems))))):
+        statement = text.split(":= by", 1)[0].split("-/\n")[-1]
+        aggregated_baseline_data.setdefault(section, []).append({
+            "idx": idx,
+            "content": f"{statement}:= by\n  sorry",
+            "name": list(name),
+        })
+    stats["queries"] = sum(len(v) for v in aggregated_baseline_data.values())
+
+    return {
+        "jixia_table": jixia_table,
+        "book_dir": book_dir,
+        "aggregated_baseline_data": aggregated_baseline_data,
+        "stats": stats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic jixia corpus.")
+    parser.add_argument("out_dir", type=str)
+    parser.add_argument("--scale", type=float, default=1, help="Multiple of the Tao Analysis size (may be fractional, e.g. 0.1).")
+    parser.add_argument("--decls-per-section", type=int, default=TAO_ANALYSIS.decls_per_section)
+    parser.add_argument("--local-refs", type=float, default=TAO_ANALYSIS.local_refs, help="Mean textbook references per declaration.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = replace(TAO_ANALYSIS.scaled(args.scale), decls_per_section=args.decls_per_section, local_refs=args.local_refs, seed=args.seed)
+    corpus = generate_corpus(spec, args.out_dir)
+    with open(os.path.join(args.out_dir, "aggregated_baseline_data.json"), "w") as f:
+        json.dump(corpus["aggregated_baseline_data"], f)
+    with open(os.path.join(args.out_dir, "spec.json"), "w") as f:
+        json.dump({"spec": asdict(spec), "stats": corpus["stats"]}, f, indent=2)
+    print(json.dumps(corpus["stats"]))
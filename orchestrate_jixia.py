@@ -1,9 +1,15 @@
+import argparse
 import os
-import subprocess
 import shutil
+import sys
+import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import partial
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+import profiling
+from subprocess_telemetry import run_command
+
 TEXTBOOK_PATH = "/Users/alextaylor/Desktop/lean_prover/analysis/analysis/Analysis"
 JIXIA_EXECUTABLE = "/Users/alextaylor/Desktop/lean_prover/jixia/.lake/build/bin/jixia"
 ANALYSIS_WORKSPACE = "/Users/alextaylor/Desktop/lean_prover/analysis/analysis"
@@ -26,7 +32,7 @@ def clean_textbook_filepaths(path: str):
     return section_files
 
 
-def compile_lean_file(file_path: str, section_key: str):
+def compile_lean_file(file_path: str, section_key: str, metrics_path: str | None = None, timeout: float | None = None):
     module_file_path = file_path.replace(".lean", ".mod.json")
     declaration_file_path = file_path.replace(".lean", ".decl.json")
     symbol_file_path = file_path.replace(".lean", ".sym.json")
@@ -35,7 +41,7 @@ def compile_lean_file(file_path: str, section_key: str):
     ast_file_path = file_path.replace(".lean", ".ast.json")
 
     # Run jixia
-    proc = subprocess.run(
+    proc = run_command(
         [
             "lake",
             "env",
@@ -55,9 +61,11 @@ def compile_lean_file(file_path: str, section_key: str):
             ast_file_path,
             file_path,
         ],
+        label="jixia_section",
         cwd=ANALYSIS_WORKSPACE,
-        capture_output=True,
-        text=True,
+        timeout=timeout,
+        metrics_path=metrics_path,
+        section=section_key,
     )
     
     if proc.returncode != 0:
@@ -98,13 +106,15 @@ def compile_lean_file(file_path: str, section_key: str):
     }
 
 
-def _compile_one(file_path: str):
+def _compile_one(file_path: str, metrics_path: str | None = None, timeout: float | None = None):
     section_key = os.path.basename(file_path).replace(".lean", "")
-    result = compile_lean_file(file_path, section_key)
-    return section_key, result
+    # Wall-clock stamps and pid let the parent put worker runs on the trace.
+    started_at = time.time()
+    result = compile_lean_file(file_path, section_key, metrics_path=metrics_path, timeout=timeout)
+    return section_key, result, (started_at, time.time(), os.getpid())
 
 
-def main():
+def main(metrics_path: str | None = None, timeout: float | None = None):
     os.makedirs(PROCESSED_ANALYSIS_WORKSPACE, exist_ok=True)
     section_files = clean_textbook_filepaths(TEXTBOOK_PATH)
     processed_data = {}
@@ -115,14 +125,20 @@ def main():
     # If Lake/Jixia thrashes your disk/cores, tune this down (e.g., 2–4)
     # max_workers = 4
 
+    # Workers do not share module state, so metrics path and timeout travel with each call.
+    compile_one = partial(_compile_one, metrics_path=metrics_path, timeout=timeout)
+
     if parallelized:
         with ProcessPoolExecutor(max_workers=max_workers) as ex:
-            futures = {ex.submit(_compile_one, fp): fp for fp in section_files}
+            futures = {ex.submit(compile_one, fp): fp for fp in section_files}
             for fut in as_completed(futures):
                 fp = futures[fut]
                 try:
-                    section_key, section_data = fut.result()
+                    section_key, section_data, (started_at, finished_at, pid) = fut.result()
                     processed_data[section_key] = section_data
+                    profiling.add_event(f"jixia:{section_key}", started_at, finished_at, tid=pid)
+                    # Counted here: the worker's run_command counted in its own process.
+                    profiling.count("subprocesses")
                     print(f"Done: {section_key}")
                 except Exception as e:
                     # Keep going; log the failure
@@ -133,8 +149,10 @@ def main():
             if section_key != "Section_3_1":
                 continue
             try:
-                section_key, section_data = _compile_one(fp)
+                section_key, section_data, (started_at, finished_at, pid) = compile_one(fp)
                 processed_data[section_key] = section_data
+                # run_command already counted this subprocess in this process.
+                profiling.add_event(f"jixia:{section_key}", started_at, finished_at, tid=pid)
                 print(section_data)
                 print(f"Done: {section_key}")
             except Exception as e:
@@ -147,4 +165,16 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", type=str, nargs="?", const="", default=None, help="Record one span per jixia run into this directory (default: <processed workspace>/profile) and write a Chrome trace.")
+    parser.add_argument("--profiler", type=str, default="none", choices=list(profiling.PROFILERS), help="Profiler for the orchestrating process; the jixia runs themselves are timed only.")
+    parser.add_argument("--subprocess-metrics", type=str, default=None, help="Append wall/CPU time, peak RSS and exit code of every jixia run to this JSONL.")
+    parser.add_argument("--timeout", type=float, default=None, help="Kill a jixia run after this many seconds.")
+    args = parser.parse_args()
+    if args.profile is not None:
+        profiling.enable(args.profile or os.path.join(PROCESSED_ANALYSIS_WORKSPACE, "profile"), args.profiler)
+    try:
+        with profiling.span("orchestrate_jixia", stage=True):
+            main(metrics_path=args.subprocess_metrics, timeout=args.timeout)
+    finally:
+        profiling.finish()
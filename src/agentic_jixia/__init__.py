@@ -4,21 +4,35 @@ but package the results as reusable lookup tools for an interactive agent.
 """
 
 from .workflow import AgenticJixiaWorkflow, AgenticTask, AgenticToolset
+from .compile_check import CompileCheckTool, CompileResult, Diagnostic, LeanReplPool
+from .file_store import FileStore, get_file_store
 from .toolbox import (
     FileLookupTool,
     DeclarationLookupTool,
+    SymbolIndex,
     SymbolLookupTool,
+    ReferenceCandidate,
     ReferenceLookupTool,
     ReferenceResult,
+    ReferenceScoring,
 )
 
 __all__ = [
     "AgenticJixiaWorkflow",
     "AgenticTask",
     "AgenticToolset",
+    "CompileCheckTool",
+    "CompileResult",
+    "Diagnostic",
+    "LeanReplPool",
+    "FileStore",
+    "get_file_store",
     "FileLookupTool",
     "DeclarationLookupTool",
+    "SymbolIndex",
     "SymbolLookupTool",
+    "ReferenceCandidate",
     "ReferenceLookupTool",
     "ReferenceResult",
+    "ReferenceScoring",
 ]
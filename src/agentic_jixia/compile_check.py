@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from globals import LEAN_PROJECT_DIR, LEAN_REPL_EXECUTABLE
+from lean_diagnostics import Diagnostic, parse_lean_output
+from lean_text import iter_tokens
+from subprocess_telemetry import run_command
+
+
+# The header build_jixia_context gives every generated file; the warm
+# environment is only used for files importing exactly this.
+DEFAULT_PRELOAD_IMPORTS: Tuple[str, ...] = ("Mathlib.Tactic",)
+
+
+@dataclass
+class CompileResult:
+    ok: bool
+    diagnostics: List[Diagnostic]
+    elapsed_s: float
+    backend: str
+    cached: bool = False
+    timed_out: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "diagnostics": [asdict(d) for d in self.diagnostics],
+            "elapsed_s": round(self.elapsed_s, 3),
+            "backend": self.backend,
+            "cached": self.cached,
+            "timed_out": self.timed_out,
+        }
+
+
+def split_imports(source: str) -> Tuple[List[str], str]:
+    """
+    Separate the leading ``import`` commands from ``source``. Comments (line
+    and nested block) in the header are skipped; the import tokens are
+    blanked rather than removed so diagnostic positions stay valid.
+    """
+    imports: List[str] = []
+    spans: List[Tuple[int, int]] = []
+    in_import = False
+    for token in iter_tokens(source):
+        if token.value == "import":
+            in_import = True
+        elif in_import and token.kind == "ident" and not token.line_start:
+            imports.append(token.value)
+        else:
+            break
+        spans.append((token.start, token.stop))
+    pieces = []
+    last = 0
+    for start, stop in spans:
+        pieces.append(source[last:start])
+        pieces.append(" " * (stop - start))
+        last = stop
+    pieces.append(source[last:])
+    return imports, "".join(pieces)
+
+
+def _repl_diagnostics(response: Dict[str, Any]) -> List[Diagnostic]:
+    diagnostics = []
+    for message in response.get("messages") or []:
+        pos = message.get("pos") or {}
+        end = message.get("endPos") or {}
+        diagnostics.append(Diagnostic(
+            line=pos.get("line", 0),
+            col=pos.get("column", 0),
+            severity=message.get("severity", "error"),
+            message=message.get("data", ""),
+            end_line=end.get("line"),
+            end_col=end.get("column"),
+        ))
+    if "message" in response and "env" not in response:
+        # REPL-level failure (e.g. unknown environment) rather than a Lean message.
+        diagnostics.append(Diagnostic(line=0, col=0, severity="error", message=response["message"]))
+    return diagnostics
+
+
+class LeanReplProcess:
+    """
+    One long-lived ``lake env repl`` process. The preload imports are
+    elaborated once at startup and every check runs in that environment, so a
+    check costs only the elaboration of the snippet itself.
+    """
+
+    def __init__(
+        self,
+        preload_imports: Sequence[str] = DEFAULT_PRELOAD_IMPORTS,
+        *,
+        repl_executable: str = LEAN_REPL_EXECUTABLE,
+        project_dir: str = LEAN_PROJECT_DIR,
+        startup_timeout: float = 600.0,
+    ):
+        self.preload_imports = tuple(preload_imports)
+        self.checks = 0
+        self._proc = subprocess.Popen(
+            ["lake", "env", repl_executable],
+            cwd=project_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._pump, daemon=True).start()
+        header = "\n".join(f"import {module}" for module in self.preload_imports)
+        response = self._send({"cmd": header}, timeout=startup_timeout)
+        if "env" not in response:
+            self.close()
+            raise RuntimeError(f"Lean REPL failed to load {self.preload_imports}: {response}")
+        self.base_env = response["env"]
+
+    def _pump(self) -> None:
+        for line in self._proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def _send(self, payload: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        # The REPL reads one JSON command per blank-line-terminated block and
+        # answers the same way.
+        self._proc.stdin.write(json.dumps(payload) + "\n\n")
+        self._proc.stdin.flush()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        chunks: List[str] = []
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                line = self._lines.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError(f"Lean REPL did not answer within {timeout}s")
+            if line is None:
+                raise RuntimeError("Lean REPL exited")
+            if not line.strip():
+                if chunks:
+                    return json.loads("".join(chunks))
+                continue
+            chunks.append(line)
+
+    def check(self, body: str, timeout: Optional[float]) -> List[Diagnostic]:
+        self.checks += 1
+        return _repl_diagnostics(self._send({"cmd": body, "env": self.base_env}, timeout=timeout))
+
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def close(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+
+
+class LeanReplPool:
+    """
+    Fixed-size pool of warm :class:`LeanReplProcess` es. Processes are started
+    in the background on construction; a process that times out or dies is
+    replaced, and each one is recycled after ``max_checks_per_process`` checks
+    because the REPL keeps every environment it has produced in memory.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        preload_imports: Sequence[str] = DEFAULT_PRELOAD_IMPORTS,
+        *,
+        repl_executable: str = LEAN_REPL_EXECUTABLE,
+        project_dir: str = LEAN_PROJECT_DIR,
+        max_checks_per_process: int = 200,
+    ):
+        self.size = size
+        self.preload_imports = tuple(preload_imports)
+        self.repl_executable = repl_executable
+        self.project_dir = project_dir
+        self.max_checks_per_process = max_checks_per_process
+        self._idle: "queue.Queue[Optional[LeanReplProcess]]" = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._spawn_async()
+
+    def covers(self, imports: Sequence[str]) -> bool:
+        """
+        Whether ``imports`` are exactly the preloaded modules (``Init`` aside).
+        A file importing less, e.g. only ``Mathlib.Tactic`` or nothing, would
+        see declarations in the warm environment that it cannot see when
+        compiled on its own.
+        """
+        return {module for module in imports if module != "Init"} == set(self.preload_imports)
+
+    def _spawn(self) -> Optional[LeanReplProcess]:
+        try:
+            return LeanReplProcess(self.preload_imports, repl_executable=self.repl_executable, project_dir=self.project_dir)
+        except Exception as e:
+            print(f"[compile_check] failed to start Lean REPL: {e}")
+            return None
+
+    def _spawn_async(self) -> None:
+        threading.Thread(target=lambda: self._idle.put(self._spawn()), daemon=True).start()
+
+    def check(self, body: str, timeout: Optional[float] = 60.0) -> List[Diagnostic]:
+        process = self._idle.get()
+        if process is None:
+            # Startup failed; keep the slot usable for the next caller and retry once.
+            process = self._spawn()
+            if process is None:
+                self._idle.put(None)
+                raise RuntimeError("no Lean REPL process available")
+        healthy = False
+        try:
+            diagnostics = process.check(body, timeout=timeout)
+            healthy = True
+            return diagnostics
+        finally:
+            if healthy and process.alive() and process.checks < self.max_checks_per_process and not self._closed:
+                self._idle.put(process)
+            else:
+                process.close()
+                if not self._closed:
+                    self._spawn_async()
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                process = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if process is not None:
+                process.close()
+
+
+class CompileCheckTool:
+    """
+    Compile a candidate Lean file and return structured diagnostics.
+
+    Snippets whose imports are exactly the pool's preloaded modules run in a
+    warm REPL; anything else falls back to a cold ``lake env lean`` on a temp
+    file. Results are cached by the hash of the source, and concurrent checks
+    of the same source wait for the first one instead of compiling twice.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[LeanReplPool] = None,
+        *,
+        project_dir: str = LEAN_PROJECT_DIR,
+        timeout: float = 60.0,
+        cache_size: int = 4096,
+    ):
+        self.pool = pool
+        self.project_dir = project_dir
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, CompileResult]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, source: str) -> CompileResult:
+        key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return _as_cached(cached)
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return _as_cached(pending.result())
+
+        try:
+            result = self._compile(source)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            if not result.timed_out:
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        pending.set_result(result)
+        return result
+
+    def _compile(self, source: str) -> CompileResult:
+        started = time.perf_counter()
+        imports, body = split_imports(source)
+        if self.pool is not None and self.pool.covers(imports):
+            try:
+                diagnostics = self.pool.check(body, timeout=self.timeout)
+                return _result(diagnostics, started, "repl")
+            except TimeoutError as e:
+                return _result([Diagnostic(0, 0, "error", str(e))], started, "repl", timed_out=True)
+        return self._compile_cold(source, started)
+
+    def _compile_cold(self, source: str, started: float) -> CompileResult:
+        fd, path = tempfile.mkstemp(suffix=".lean", prefix="compile_check_", dir=self.project_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(source)
+            # run_command kills the whole process group on timeout, lean included.
+            proc = run_command(
+                ["lake", "env", "lean", path],
+                label="compile_check",
+                cwd=self.project_dir,
+                timeout=self.timeout,
+                merge_stderr=True,
+            )
+        except subprocess.TimeoutExpired:
+            return _result([Diagnostic(0, 0, "error", f"lean did not finish within {self.timeout}s")], started, "lean", timed_out=True)
+        finally:
+            os.remove(path)
+        diagnostics = parse_lean_output(proc.stdout)
+        if proc.returncode != 0 and not any(d.severity == "error" for d in diagnostics):
+            diagnostics.append(Diagnostic(0, 0, "error", proc.stdout.strip() or f"lean exited with {proc.returncode}"))
+        return _result(diagnostics, started, "lean")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+
+
+def _result(diagnostics: List[Diagnostic], started: float, backend: str, timed_out: bool = False) -> CompileResult:
+    return CompileResult(
+        ok=not timed_out and not any(d.severity == "error" for d in diagnostics),
+        diagnostics=diagnostics,
+        elapsed_s=time.perf_counter() - started,
+        backend=backend,
+        timed_out=timed_out,
+    )
+
+
+def _as_cached(result: CompileResult) -> CompileResult:
+    return CompileResult(
+        ok=result.ok,
+        diagnostics=result.diagnostics,
+        elapsed_s=0.0,
+        backend=result.backend,
+        cached=True,
+        timed_out=result.timed_out,
+    )
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+
+NameTuple = Tuple[str, ...]
+DeclSpan = Tuple[str, int, int]
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class _CachedFile:
+    mtime_ns: int
+    size: int
+    data: bytes
+
+
+class FileStore:
+    """
+    Process-wide, thread-safe cache of source files shared by every lookup tool.
+
+    Contents are kept as raw bytes in an LRU bounded by ``max_bytes`` and are
+    re-read whenever the file's mtime or size changes. Declaration spans (the
+    UTF-8 byte offsets from jixia's ``ref.range``) can be registered so callers
+    can read a single declaration without pulling the whole file.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._files: "OrderedDict[str, _CachedFile]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._decl_spans: Dict[NameTuple, DeclSpan] = {}
+        self._decl_starts: Dict[str, List[Tuple[int, int, NameTuple]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- whole-file access -------------------------------------------------
+
+    def read_bytes(self, path: str) -> bytes:
+        path = os.path.normpath(path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                self._files.move_to_end(path)
+                self.hits += 1
+                return cached.data
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            self.misses += 1
+            self._insert(path, _CachedFile(stat.st_mtime_ns, stat.st_size, data))
+        return data
+
+    def read_text(self, path: str) -> str:
+        return self.read_bytes(path).decode("utf-8")
+
+    def read_range(self, path: str, start: int, stop: int) -> str:
+        """Read bytes ``[start, stop)``; served from cache if present, else by seeking."""
+        path = os.path.normpath(path)
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None:
+            stat = os.stat(path)
+            if cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                with self._lock:
+                    self.hits += 1
+                return cached.data[start:stop].decode("utf-8", errors="replace")
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(max(stop - start, 0)).decode("utf-8", errors="replace")
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        with self._lock:
+            if path is None:
+                self._files.clear()
+                self._bytes = 0
+                return
+            cached = self._files.pop(os.path.normpath(path), None)
+            if cached is not None:
+                self._bytes -= cached.size
+
+    def _insert(self, path: str, entry: _CachedFile) -> None:
+        previous = self._files.pop(path, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        if entry.size > self.max_bytes:
+            return  # never cache something that would evict everything else
+        self._files[path] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._files.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    # --- declaration index -------------------------------------------------
+
+    def register_declarations(self, spans: Mapping[NameTuple, DeclSpan]) -> None:
+        """Record ``name -> (path, start, stop)`` spans, e.g. from ``build_decl_span_index``."""
+        with self._lock:
+            for name, (path, start, stop) in spans.items():
+                path = os.path.normpath(path)
+                self._decl_spans[tuple(name)] = (path, start, stop)
+            by_path: Dict[str, List[Tuple[int, int, NameTuple]]] = {}
+            for name, (path, start, stop) in self._decl_spans.items():
+                by_path.setdefault(path, []).append((start, stop, name))
+            self._decl_starts = {path: sorted(items) for path, items in by_path.items()}
+
+    def declaration_span(self, name: Sequence[str]) -> Optional[DeclSpan]:
+        return self._decl_spans.get(tuple(name))
+
+    def declarations_in(self, path: str) -> List[Tuple[int, int, NameTuple]]:
+        """Sorted ``(start, stop, name)`` entries for the declarations in ``path``."""
+        return list(self._decl_starts.get(os.path.normpath(path), []))
+
+    def declaration_at(self, path: str, offset: int) -> Optional[Tuple[int, int, NameTuple]]:
+        """Find the declaration whose span contains byte ``offset``."""
+        entries = self._decl_starts.get(os.path.normpath(path), [])
+        pos = bisect.bisect_right(entries, (offset, float("inf"))) - 1
+        if pos >= 0 and entries[pos][0] <= offset < entries[pos][1]:
+            return entries[pos]
+        return None
+
+    def read_declaration(self, name: Sequence[str]) -> Optional[str]:
+        span = self.declaration_span(name)
+        if span is None:
+            return None
+        return self.read_range(*span)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_DEFAULT_STORE: Optional[FileStore] = None
+_DEFAULT_STORE_LOCK = threading.Lock()
+
+
+def get_file_store() -> FileStore:
+    """Return the process-wide store shared by all ``FileLookupTool`` instances."""
+    global _DEFAULT_STORE
+    with _DEFAULT_STORE_LOCK:
+        if _DEFAULT_STORE is None:
+            _DEFAULT_STORE = FileStore()
+        return _DEFAULT_STORE
@@ -0,0 +1,479 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+# Ensure the src root is importable when run as ``python src/agentic_jixia/runner.py``.
+SRC_ROOT = Path(__file__).resolve().parents[1]
+if str(SRC_ROOT) not in sys.path:
+    sys.path.append(str(SRC_ROOT))
+
+from agentic_jixia.compile_check import CompileCheckTool, LeanReplPool  # type: ignore
+from agentic_jixia.toolbox import _as_name_tuple  # type: ignore
+from agentic_jixia.workflow import AgenticJixiaWorkflow, AgenticTask, AgenticToolset, FailedTask  # type: ignore
+from run_api_queries import MODEL, REASONING_EFFORT, SYSTEM_PROMPT, extract_code_block, summarize_usage  # type: ignore
+
+
+AGENT_SYSTEM_PROMPT = "\n".join([
+    "You are repairing Lean 4 theorem statements so that they compile against the Analysis textbook.",
+    "Use the provided tools to look up dependency files, declarations, symbols and references instead of guessing.",
+    "Do not solve the theorem and do not change its name.",
+    "If the compile_check tool is available, check your candidate file before answering; 'sorry' warnings are expected.",
+    SYSTEM_PROMPT,
+])
+
+TOOL_SPECS: List[Dict[str, Any]] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "list_files",
+            "description": "List the dependency Lean files available for this theorem.",
+            "parameters": {"type": "object", "properties": {}},
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "list_declarations",
+            "description": "List the declarations (name and byte span) in one dependency file.",
+            "parameters": {
+                "type": "object",
+                "properties": {"path": {"type": "string"}},
+                "required": ["path"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_file",
+            "description": "Read a whole dependency file.",
+            "parameters": {
+                "type": "object",
+                "properties": {"path": {"type": "string"}},
+                "required": ["path"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_declaration",
+            "description": "Read the verbatim source of one declaration by its dotted name.",
+            "parameters": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "lookup_symbol",
+            "description": "Kind, type and type/value references of a symbol by dotted name. Partial names are resolved fuzzily.",
+            "parameters": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_names",
+            "description": "List declared names starting with a dotted prefix, e.g. 'Chapter3.SetTheory.Set.union'.",
+            "parameters": {
+                "type": "object",
+                "properties": {"prefix": {"type": "string"}, "limit": {"type": "integer"}},
+                "required": ["prefix"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "collect_references",
+            "description": "Source of the most relevant declarations a name depends on, within a character budget.",
+            "parameters": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}, "max_chars": {"type": "integer"}},
+                "required": ["name"],
+            },
+        },
+    },
+]
+
+COMPILE_CHECK_SPEC: Dict[str, Any] = {
+    "type": "function",
+    "function": {
+        "name": "compile_check",
+        "description": "Compile a complete candidate Lean file and return its errors and warnings (line, column, severity, message).",
+        "parameters": {
+            "type": "object",
+            "properties": {"code": {"type": "string"}},
+            "required": ["code"],
+        },
+    },
+}
+
+
+class ToolDispatcher:
+    """Answers agent tool calls from the in-process lookups of an :class:`AgenticToolset`."""
+
+    def __init__(self, toolset: AgenticToolset, max_result_chars: int = 12_000):
+        self.toolset = toolset
+        self.max_result_chars = max_result_chars
+        self._handlers: Dict[str, Callable[..., Any]] = {
+            "list_files": self._list_files,
+            "list_declarations": self._list_declarations,
+            "read_file": self._read_file,
+            "read_declaration": self._read_declaration,
+            "lookup_symbol": self._lookup_symbol,
+            "search_names": self._search_names,
+            "collect_references": self._collect_references,
+        }
+        self.tool_specs = list(TOOL_SPECS)
+        if toolset.compile_check is not None:
+            self._handlers["compile_check"] = self._compile_check
+            self.tool_specs.append(COMPILE_CHECK_SPEC)
+
+    def __call__(self, tool_name: str, arguments: str) -> str:
+        handler = self._handlers.get(tool_name)
+        if handler is None:
+            return f"ERROR: unknown tool {tool_name}"
+        try:
+            kwargs = json.loads(arguments or "{}")
+            result = handler(**kwargs)
+        except Exception as e:
+            return f"ERROR: {e}"
+        text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+        if len(text) > self.max_result_chars:
+            text = text[: self.max_result_chars] + "\n...[truncated]..."
+        return text
+
+    def _resolve(self, name: str):
+        names = self.toolset.sym_lookup.fuzzy_lookup(name, limit=1) or self.toolset.decl_lookup.fuzzy_lookup(name, limit=1)
+        return names[0] if names else _as_name_tuple(name)
+
+    def _list_files(self):
+        return self.toolset.file_lookup.list_files()
+
+    def _list_declarations(self, path: str):
+        return [
+            {"name": ".".join(map(str, name)), "start": start, "stop": stop}
+            for name, start, stop in self.toolset.file_lookup.list_declarations(path)
+        ]
+
+    def _read_file(self, path: str):
+        return self.toolset.file_lookup.read_file(path)
+
+    def _read_declaration(self, name: str):
+        resolved = self._resolve(name)
+        text = self.toolset.file_lookup.read_declaration(resolved)
+        if text is None:
+            decl = self.toolset.decl_lookup.get(resolved)
+            text = decl["ref"].get("pp") if decl else None
+        return text if text is not None else f"No declaration found for {name}"
+
+    def _lookup_symbol(self, name: str):
+        resolved = self._resolve(name)
+        sym = self.toolset.sym_lookup.get(resolved)
+        if sym is None:
+            return f"No symbol found for {name}"
+        return {
+            "name": ".".join(map(str, resolved)),
+            "kind": sym.get("kind"),
+            "type": sym.get("type"),
+            "typeReferences": [".".join(map(str, r)) for r in sym.get("typeReferences") or []],
+            "valueReferences": [".".join(map(str, r)) for r in sym.get("valueReferences") or []],
+        }
+
+    def _search_names(self, prefix: str, limit: int = 50):
+        return [".".join(map(str, name)) for name in self.toolset.decl_lookup.search_prefix(prefix, limit=limit)]
+
+    def _collect_references(self, name: str, max_chars: int = 8_000):
+        reference_lookup = self.toolset.reference_lookup
+        result = reference_lookup.collect(self._resolve(name), budget=None, max_chars=max_chars)
+        return "\n\n".join(reference_lookup.decl_text(ref) for ref in result.order[1:])
+
+    def _compile_check(self, code: str):
+        return self.toolset.compile_check.check(code).to_dict()
+
+
+@dataclass
+class AgentRunResult:
+    position: int
+    task: AgenticTask | FailedTask
+    content: str
+    status: str
+    messages: List[Dict[str, Any]]
+    tool_calls: int
+    turns: int
+    usage: Dict[str, int] = field(default_factory=dict)
+    wall_time_s: float = 0.0
+    error: Optional[str] = None
+
+
+def initial_prompt(task: AgenticTask) -> str:
+    references = [".".join(map(str, name)) for name in task.reference_summary.order[1:]]
+    return "\n".join([
+        f"Theorem {'.'.join(task.fqn)} from {task.section}:",
+        task.content,
+        "",
+        "Dependency files: " + ", ".join(task.toolset.file_lookup.list_files()),
+        "Likely relevant declarations: " + (", ".join(references) if references else "(none found)"),
+        "Construct a minimal, compilable Lean file for this theorem (imports, namespaces and required definitions).",
+    ])
+
+
+class AgentRunner:
+    """
+    Drives many :class:`AgenticTask` s concurrently through an LLM tool-use
+    loop. Tool calls are answered in-process from each task's shared toolset;
+    transcripts are streamed to JSONL as tasks finish.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        model: str = MODEL,
+        concurrency: int = 8,
+        max_turns: int = 12,
+        max_result_chars: int = 12_000,
+    ):
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.max_turns = max_turns
+        self.max_result_chars = max_result_chars
+
+    async def run_task(self, position: int, task: AgenticTask) -> AgentRunResult:
+        dispatcher = ToolDispatcher(task.toolset, max_result_chars=self.max_result_chars)
+        messages: List[Dict[str, Any]] = [
+            {"role": "system", "content": AGENT_SYSTEM_PROMPT},
+            {"role": "user", "content": initial_prompt(task)},
+        ]
+        usage_totals: Dict[str, int] = {}
+        tool_calls = 0
+        started = time.perf_counter()
+        final_text = ""
+        status = "max_turns"
+        error = None
+        turn = 0
+
+        try:
+            for turn in range(1, self.max_turns + 1):
+                completion = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    tools=dispatcher.tool_specs,
+                    reasoning_effort=REASONING_EFFORT,
+                )
+                for key, value in summarize_usage(getattr(completion, "usage", None)).items():
+                    usage_totals[key] = usage_totals.get(key, 0) + (value or 0)
+                message = completion.choices[0].message
+                calls = message.tool_calls or []
+                messages.append({
+                    "role": "assistant",
+                    "content": message.content or "",
+                    **({"tool_calls": [
+                        {
+                            "id": call.id,
+                            "type": "function",
+                            "function": {"name": call.function.name, "arguments": call.function.arguments},
+                        }
+                        for call in calls
+                    ]} if calls else {}),
+                })
+                if not calls:
+                    final_text = message.content or ""
+                    status = "answered"
+                    break
+                for call in calls:
+                    tool_calls += 1
+                    # Lookups touch the file store; keep them off the event loop.
+                    result = await asyncio.to_thread(dispatcher, call.function.name, call.function.arguments)
+                    messages.append({"role": "tool", "tool_call_id": call.id, "content": result})
+        except Exception as e:
+            status = "error"
+            error = str(e)
+
+        return AgentRunResult(
+            position=position,
+            task=task,
+            content=extract_code_block(final_text) if final_text else "",
+            status=status,
+            messages=messages,
+            tool_calls=tool_calls,
+            turns=turn,
+            usage=usage_totals,
+            wall_time_s=time.perf_counter() - started,
+            error=error,
+        )
+
+    async def run(self, tasks: Iterable[AgenticTask | FailedTask], output_dir: str, name: str) -> List[AgentRunResult]:
+        """
+        Run ``tasks`` with at most ``concurrency`` in flight. ``tasks`` may be a
+        lazy iterator (e.g. a prefetching ``iter_tasks``); the next task is only
+        pulled once a slot is free. Each result is appended to
+        ``{name}_transcripts.jsonl`` and, in ``verify.py`` input format, to
+        ``{name}.jsonl`` as soon as it finishes, so an interrupted run keeps
+        what it has done; ``{name}.jsonl`` is rewritten in task order at the end.
+        A :class:`FailedTask` (or a task that raises) is recorded as an error
+        result; if ``tasks`` itself raises, no further tasks are pulled but the
+        ones in flight still finish and are written.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        transcript_path = os.path.join(output_dir, f"{name}_transcripts.jsonl")
+        output_path = os.path.join(output_dir, f"{name}.jsonl")
+        results: List[AgentRunResult] = []
+
+        with open(transcript_path, "a") as transcript_f, open(output_path, "w") as output_f:
+
+            async def guarded(position: int, task: AgenticTask) -> None:
+                started = time.perf_counter()
+                try:
+                    if isinstance(task, FailedTask):
+                        result = failed_result(position, task, task.error)
+                    else:
+                        result = await self.run_task(position, task)
+                except Exception as e:
+                    # run_task handles API errors itself; this catches everything
+                    # else so one bad task does not abort the whole gather.
+                    result = failed_result(position, task, f"{type(e).__name__}: {e}", time.perf_counter() - started)
+                finally:
+                    semaphore.release()
+                results.append(result)
+                output_f.write(json.dumps(verify_entry(result), ensure_ascii=False) + "\n")
+                output_f.flush()
+                transcript_f.write(json.dumps(transcript_entry(result), ensure_ascii=False) + "\n")
+                transcript_f.flush()
+                print(f"[{position:04d}] {result.status} turns={result.turns} tools={result.tool_calls} {result.wall_time_s:.1f}s")
+
+            running = []
+            iterator = iter(tasks)
+            position = 0
+            while True:
+                await semaphore.acquire()
+                # Preparing a task can block (reference collection, jixia), so pull it off the loop.
+                try:
+                    task = await asyncio.to_thread(next, iterator, None)
+                except Exception as e:
+                    # A generator that raised is finished; keep what is in flight.
+                    print(f"[{position:04d}] task preparation failed, no further tasks: {type(e).__name__}: {e}")
+                    task = None
+                if task is None:
+                    semaphore.release()
+                    break
+                running.append(asyncio.create_task(guarded(position, task)))
+                position += 1
+            await asyncio.gather(*running)
+
+        results.sort(key=lambda r: r.position)
+        with open(output_path, "w") as f:
+            for result in results:
+                f.write(json.dumps(verify_entry(result), ensure_ascii=False) + "\n")
+        return results
+
+
+def failed_result(position: int, task: AgenticTask | FailedTask, error: str, wall_time_s: float = 0.0) -> AgentRunResult:
+    return AgentRunResult(
+        position=position,
+        task=task,
+        content="",
+        status="error",
+        messages=[],
+        tool_calls=0,
+        turns=0,
+        wall_time_s=wall_time_s,
+        error=error,
+    )
+
+
+def verify_entry(result: AgentRunResult) -> Dict[str, Any]:
+    """
+    Row shape consumed by ``verify.py`` (same fields as the baseline runner's
+    output). ``index`` is the baseline index, so runs over different
+    ``--section``/``--limit`` selections line up; ``position`` is the order
+    within this run.
+    """
+    return {
+        "index": result.task.index,
+        "position": result.position,
+        "chapter_name": result.task.section,
+        "FQN": ".".join(result.task.fqn),
+        "content": result.content,
+    }
+
+
+def transcript_entry(result: AgentRunResult) -> Dict[str, Any]:
+    return {
+        "timestamp": time.time(),
+        **verify_entry(result),
+        "status": result.status,
+        "error": result.error,
+        "turns": result.turns,
+        "tool_calls": result.tool_calls,
+        "usage": result.usage,
+        "wall_time_s": result.wall_time_s,
+        "messages": result.messages,
+    }
+
+
+def _build_cli() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run agentic tasks concurrently through an LLM tool-use loop.")
+    parser.add_argument("output_dir", type=str)
+    parser.add_argument("name", type=str)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--section", action="append", help="Restrict to specific Section_* identifiers (can be repeated).")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--prefetch", type=int, default=None, help="Tasks prepared ahead of the agents (default: 2 x concurrency).")
+    parser.add_argument("--max-turns", type=int, default=12)
+    parser.add_argument("--model", type=str, default=MODEL)
+    parser.add_argument("--lazy", action="store_true", help="Only load the --section sections (plus their imports).")
+    parser.add_argument("--compile-workers", type=int, default=0, help="Warm Lean REPL processes backing the compile_check tool (0 disables it).")
+    parser.add_argument("--compile-timeout", type=float, default=60.0)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from dotenv import load_dotenv
+    from openai import AsyncOpenAI
+
+    load_dotenv()
+    args = _build_cli().parse_args(argv)
+    compile_check = None
+    if args.compile_workers > 0:
+        compile_check = CompileCheckTool(LeanReplPool(size=args.compile_workers), timeout=args.compile_timeout)
+    workflow = AgenticJixiaWorkflow(compile_check=compile_check, lazy=args.lazy, sections=args.section if args.lazy else None)
+    prefetch = args.prefetch if args.prefetch is not None else 2 * args.concurrency
+    tasks = workflow.iter_tasks(sections=args.section, limit=args.limit, prefetch=prefetch, keep_going=True)
+    runner = AgentRunner(
+        AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=1000),
+        model=args.model,
+        concurrency=args.concurrency,
+        max_turns=args.max_turns,
+    )
+    try:
+        results = asyncio.run(runner.run(tasks, args.output_dir, args.name))
+    finally:
+        if compile_check is not None:
+            print(f"compile_check cache: {compile_check.stats()}")
+            compile_check.close()
+    answered = sum(1 for r in results if r.status == "answered")
+    print(f"Answered {answered}/{len(results)} tasks. Verify with: python verify.py --jsonl {os.path.join(args.output_dir, args.name + '.jsonl')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 from __future__ import annotations
 
-from collections import deque
-from dataclasses import dataclass
+import bisect
+import difflib
+import heapq
+import itertools
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from agentic_jixia.file_store import FileStore, get_file_store
+from prompt_budget import count_tokens
+from jixia_json import clean_decl_text
 
 
 NameTuple = Tuple[str, ...]
@@ -13,26 +21,54 @@ def _to_name_tuple(name: Sequence[str]) -> NameTuple:
     return tuple(name)
 
 
+def _as_name_tuple(name: Union[str, Sequence[str]]) -> NameTuple:
+    if isinstance(name, str):
+        return tuple(part for part in name.split(".") if part)
+    return tuple(name)
+
+
 class FileLookupTool:
     """
     Lightweight helper that exposes both the dependency list and file bodies
-    for the Analysis textbook modules relevant to a section.
+    for the Analysis textbook modules relevant to a section. Reads go through
+    the process-wide :class:`FileStore`, so tools for different sections share
+    one cache.
     """
 
-    def __init__(self, dependency_paths: Iterable[str]):
+    def __init__(self, dependency_paths: Iterable[str], store: Optional[FileStore] = None):
         unique_paths = {str(Path(p)) for p in dependency_paths}
         self._paths: List[str] = sorted(unique_paths)
+        self._store = store or get_file_store()
 
     def list_files(self) -> List[str]:
         """Return the deterministic list of dependency files backing this task."""
         return list(self._paths)
 
-    def read_file(self, path: str) -> str:
-        """Read a specific dependency file on demand."""
+    def _check_registered(self, path: str) -> str:
         norm = str(Path(path))
         if norm not in self._paths:
             raise FileNotFoundError(f"{norm} is not registered for this task")
-        return Path(norm).read_text(encoding="utf-8")
+        return norm
+
+    def read_file(self, path: str) -> str:
+        """Read a specific dependency file on demand."""
+        return self._store.read_text(self._check_registered(path))
+
+    def read_range(self, path: str, start: int, stop: int) -> str:
+        """Read the UTF-8 byte range ``[start, stop)`` of a dependency file."""
+        return self._store.read_range(self._check_registered(path), start, stop)
+
+    def list_declarations(self, path: str) -> List[Tuple[NameTuple, int, int]]:
+        """Declarations in a dependency file as ``(name, start, stop)`` byte spans."""
+        entries = self._store.declarations_in(self._check_registered(path))
+        return [(name, start, stop) for start, stop, name in entries]
+
+    def read_declaration(self, name: Sequence[str]) -> Optional[str]:
+        """Source of a single declaration, if it lives in one of this task's files."""
+        span = self._store.declaration_span(name)
+        if span is None or str(Path(span[0])) not in self._paths:
+            return None
+        return self._store.read_range(*span)
 
     def snapshot(self, max_chars: int = -1) -> str:
         """
@@ -42,7 +78,7 @@ class FileLookupTool:
         chunks: List[str] = []
         remaining = max_chars if max_chars != -1 else float("inf")
         for dep_path in self._paths:
-            text = Path(dep_path).read_text(encoding="utf-8")
+            text = self._store.read_text(dep_path)
             if len(text) > remaining:
                 chunks.append(text[:remaining])
                 break
@@ -53,38 +89,143 @@ class FileLookupTool:
         return "\n".join(chunks)
 
 
-class DeclarationLookupTool:
-    """Wrapper around the global declaration table returned by ``preprocess_lean_analysis``."""
+class SymbolIndex:
+    """
+    Single read-only index over the ``global_symbol_table`` returned by
+    ``preprocess_lean_analysis``. Lookup tools are views over one instance,
+    so no per-kind copies of the table are made. The name orderings used for
+    prefix and fuzzy search are built lazily, on first use.
+    """
 
     def __init__(self, global_symbol_table: Mapping[NameTuple, Mapping[str, object]]):
-        self._decls: Dict[NameTuple, Mapping[str, object]] = {
-            name: entry["decl"]
-            for name, entry in global_symbol_table.items()
-            if "decl" in entry
-        }
+        self._table = global_symbol_table
+        self._lock = threading.Lock()
+        self._sorted_names: Optional[List[Tuple[str, NameTuple]]] = None
+        self._by_last: Optional[Dict[str, List[NameTuple]]] = None
+        self._last_components: List[str] = []
 
-    def get(self, name: Sequence[str]) -> Optional[Mapping[str, object]]:
-        return self._decls.get(_to_name_tuple(name))
+    def entry(self, name: Sequence[str]) -> Optional[Mapping[str, object]]:
+        return self._table.get(_to_name_tuple(name))
 
-    def contains(self, name: Sequence[str]) -> bool:
-        return _to_name_tuple(name) in self._decls
+    def _ensure_orderings(self) -> None:
+        if self._sorted_names is not None:
+            return
+        with self._lock:
+            if self._sorted_names is not None:
+                return
+            by_last: Dict[str, List[NameTuple]] = {}
+            for name in self._table:
+                if name:
+                    # jixia emits numeric components for some macro-scoped names
+                    by_last.setdefault(str(name[-1]), []).append(name)
+            self._by_last = by_last
+            self._last_components = list(by_last)
+            self._sorted_names = sorted(
+                ((".".join(map(str, name)), name) for name in self._table), key=lambda item: item[0]
+            )
 
+    def search_prefix(self, prefix: Union[str, Sequence[str]], kind: Optional[str] = None, limit: int = 50) -> List[NameTuple]:
+        """
+        Names starting with ``prefix``. A string is matched on the dotted name
+        (``"Chapter3.SetTheory.Set.union"``); a tuple is treated as a namespace.
+        """
+        self._ensure_orderings()
+        if isinstance(prefix, str):
+            key = prefix
+        else:
+            key = ".".join(prefix) + "."
+        results: List[NameTuple] = []
+        pos = bisect.bisect_left(self._sorted_names, key, key=lambda item: item[0])
+        for dotted, name in itertools.islice(self._sorted_names, pos, None):
+            if not dotted.startswith(key):
+                break
+            if kind is None or kind in self._table[name]:
+                results.append(name)
+                if len(results) >= limit:
+                    break
+        return results
 
-class SymbolLookupTool:
-    """Convenience accessor for the symbol (``sym``) entries."""
+    def fuzzy_lookup(self, name: Union[str, Sequence[str]], kind: Optional[str] = None, limit: int = 5) -> List[NameTuple]:
+        """
+        Resolve a possibly partial or misspelled name: an exact hit first, then
+        names ending in the given components (e.g. a missing
+        ``Chapter3.SetTheory.Set.`` prefix), then close matches on the last
+        component.
+        """
+        self._ensure_orderings()
+        query = _as_name_tuple(name)
+        if not query:
+            return []
 
-    def __init__(self, global_symbol_table: Mapping[NameTuple, Mapping[str, object]]):
-        self._symbols: Dict[NameTuple, Mapping[str, object]] = {
-            name: entry["sym"]
-            for name, entry in global_symbol_table.items()
-            if "sym" in entry
-        }
+        def keep(candidate: NameTuple) -> bool:
+            return kind is None or kind in self._table[candidate]
+
+        if query in self._table and keep(query):
+            return [query]
+
+        suffix_hits = [
+            candidate
+            for candidate in self._by_last.get(query[-1], [])
+            if candidate[-len(query):] == query and keep(candidate)
+        ]
+        if suffix_hits:
+            return sorted(suffix_hits, key=len)[:limit]
+
+        namespace = query[:-1]
+        results: List[NameTuple] = []
+        for last in difflib.get_close_matches(query[-1], self._last_components, n=limit * 4):
+            for candidate in self._by_last[last]:
+                if not keep(candidate):
+                    continue
+                if namespace and candidate[:-1][-len(namespace):] != namespace:
+                    continue
+                results.append(candidate)
+        return results[:limit]
+
+
+class _SymbolIndexView:
+    """Read-only, copy-free view over the ``_kind`` entries of a :class:`SymbolIndex`."""
+
+    _kind = ""
+
+    def __init__(self, source: Union[SymbolIndex, Mapping[NameTuple, Mapping[str, object]]]):
+        self.index = source if isinstance(source, SymbolIndex) else SymbolIndex(source)
 
     def get(self, name: Sequence[str]) -> Optional[Mapping[str, object]]:
-        return self._symbols.get(_to_name_tuple(name))
+        entry = self.index.entry(name)
+        if entry is None:
+            return None
+        return entry.get(self._kind)
 
     def contains(self, name: Sequence[str]) -> bool:
-        return _to_name_tuple(name) in self._symbols
+        return self.get(name) is not None
+
+    def get_many(self, names: Iterable[Sequence[str]]) -> Dict[NameTuple, Mapping[str, object]]:
+        """Batched lookup; names that are missing are simply absent from the result."""
+        found: Dict[NameTuple, Mapping[str, object]] = {}
+        for name in names:
+            value = self.get(name)
+            if value is not None:
+                found[_to_name_tuple(name)] = value
+        return found
+
+    def search_prefix(self, prefix: Union[str, Sequence[str]], limit: int = 50) -> List[NameTuple]:
+        return self.index.search_prefix(prefix, kind=self._kind, limit=limit)
+
+    def fuzzy_lookup(self, name: Union[str, Sequence[str]], limit: int = 5) -> List[NameTuple]:
+        return self.index.fuzzy_lookup(name, kind=self._kind, limit=limit)
+
+
+class DeclarationLookupTool(_SymbolIndexView):
+    """View over the declaration (``decl``) entries of the shared symbol index."""
+
+    _kind = "decl"
+
+
+class SymbolLookupTool(_SymbolIndexView):
+    """Convenience accessor for the symbol (``sym``) entries."""
+
+    _kind = "sym"
 
 
 @dataclass
@@ -93,6 +234,51 @@ class ReferenceResult:
 
     seeds: List[NameTuple]
     resolved: Dict[NameTuple, Mapping[str, object]]
+    order: List[NameTuple] = field(default_factory=list)
+    skipped: List[NameTuple] = field(default_factory=list)
+    chars_used: int = 0
+    tokens_used: int = 0
+
+
+@dataclass
+class ReferenceCandidate:
+    """What a scorer sees about a name waiting to be expanded."""
+
+    name: NameTuple
+    depth: int
+    via: str  # "root", "type" or "value"
+    frequency: int  # how many resolved names reference it so far
+    text_size: int  # characters of declaration text it would add
+
+
+@dataclass
+class ReferenceScoring:
+    """
+    Default best-first priority (lower expands first): type references before
+    value references, local ``Chapter*``/``Finset`` names before external
+    ones, names referenced from many resolved items first, small declarations
+    before large ones, shallow before deep.
+    """
+
+    value_ref_penalty: float = 1.0
+    external_penalty: float = 4.0
+    depth_weight: float = 1.0
+    frequency_bonus: float = 0.5
+    chars_per_point: float = 2000.0
+    local_prefixes: Tuple[str, ...] = ("Chapter", "Finset")
+
+    def __call__(self, candidate: ReferenceCandidate) -> float:
+        score = self.depth_weight * candidate.depth
+        if candidate.via == "value":
+            score += self.value_ref_penalty
+        if not candidate.name or not str(candidate.name[0]).startswith(self.local_prefixes):
+            score += self.external_penalty
+        score -= self.frequency_bonus * max(candidate.frequency - 1, 0)
+        score += candidate.text_size / self.chars_per_point
+        return score
+
+
+ReferenceScorer = Callable[[ReferenceCandidate], float]
 
 
 class ReferenceLookupTool:
@@ -102,43 +288,100 @@ class ReferenceLookupTool:
     agent request only the minimal supporting items it needs.
     """
 
-    def __init__(self, symbol_lookup: SymbolLookupTool):
+    def __init__(
+        self,
+        symbol_lookup: SymbolLookupTool,
+        decl_lookup: Optional[DeclarationLookupTool] = None,
+        scorer: Optional[ReferenceScorer] = None,
+    ):
         self._sym_lookup = symbol_lookup
+        self._decl_lookup = decl_lookup or DeclarationLookupTool(symbol_lookup.index)
+        self.scorer: ReferenceScorer = scorer or ReferenceScoring()
+
+    def decl_text(self, name: Sequence[str]) -> str:
+        decl = self._decl_lookup.get(name)
+        if not decl:
+            return ""
+        return clean_decl_text(decl)
 
     def collect(
         self,
         root: Sequence[str],
         *,
         max_depth: int = 2,
-        budget: int = 24,
+        budget: Optional[int] = 24,
+        max_chars: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        scorer: Optional[ReferenceScorer] = None,
     ) -> ReferenceResult:
         """
-        Perform a BFS over the type/value reference graph starting at ``root``.
-        ``budget`` caps the total number of unique names returned.
+        Best-first expansion of the type/value reference graph from ``root``.
+
+        Candidates are expanded in ``scorer`` order. ``max_chars``/``max_tokens``
+        cap the declaration text of the resolved names (the root is free); a
+        candidate that would overflow is skipped, and smaller ones may still
+        fit. ``budget`` optionally caps the number of resolved names. Names
+        without symbol data never count against either budget.
         """
+        scorer = scorer or self.scorer
         root_name = _to_name_tuple(root)
-        seen = {root_name}
-        queue = deque([(root_name, 0)])
+        candidates: Dict[NameTuple, ReferenceCandidate] = {
+            root_name: ReferenceCandidate(root_name, 0, "root", 0, 0)
+        }
+        versions: Dict[NameTuple, int] = {root_name: 0}
+        tiebreak = itertools.count()
+        heap = [(0.0, next(tiebreak), 0, root_name)]
+        done = set()
         resolved: Dict[NameTuple, Mapping[str, object]] = {}
+        result = ReferenceResult(seeds=[root_name], resolved=resolved)
 
-        while queue and len(seen) < budget:
-            current, depth = queue.popleft()
+        while heap:
+            _, _, version, current = heapq.heappop(heap)
+            if current in done or version != versions[current]:
+                continue  # already handled, or superseded by a better push
+            done.add(current)
             sym_entry = self._sym_lookup.get(current)
             if not sym_entry:
                 continue
+
+            candidate = candidates[current]
+            if current != root_name:
+                text = self.decl_text(current)
+                tokens = count_tokens(text) if max_tokens is not None else 0
+                if (max_chars is not None and result.chars_used + len(text) > max_chars) or (
+                    max_tokens is not None and result.tokens_used + tokens > max_tokens
+                ):
+                    result.skipped.append(current)
+                    continue
+                result.chars_used += len(text)
+                result.tokens_used += tokens
             resolved[current] = sym_entry
-            if depth >= max_depth:
+            result.order.append(current)
+            if budget is not None and len(resolved) >= budget:
+                break
+            if candidate.depth >= max_depth:
                 continue
-            neighbor_lists = sym_entry.get("typeReferences", []) + sym_entry.get(
-                "valueReferences", []
-            )
-            for neighbor in neighbor_lists:
-                neighbor_name = _to_name_tuple(neighbor)
-                if neighbor_name in seen:
-                    continue
-                seen.add(neighbor_name)
-                queue.append((neighbor_name, depth + 1))
-                if len(seen) >= budget:
-                    break
 
-        return ReferenceResult(seeds=list(seen), resolved=resolved)
+            for via, key in (("type", "typeReferences"), ("value", "valueReferences")):
+                for neighbor in sym_entry.get(key) or []:
+                    neighbor_name = _to_name_tuple(neighbor)
+                    if neighbor_name in done:
+                        continue
+                    existing = candidates.get(neighbor_name)
+                    if existing is None:
+                        existing = ReferenceCandidate(
+                            neighbor_name, candidate.depth + 1, via, 0, len(self.decl_text(neighbor_name))
+                        )
+                        candidates[neighbor_name] = existing
+                        result.seeds.append(neighbor_name)
+                    else:
+                        existing.depth = min(existing.depth, candidate.depth + 1)
+                        if via == "type":
+                            existing.via = "type"
+                    existing.frequency += 1
+                    versions[neighbor_name] = versions.get(neighbor_name, 0) + 1
+                    heapq.heappush(
+                        heap, (scorer(existing), next(tiebreak), versions[neighbor_name], neighbor_name)
+                    )
+
+        return result
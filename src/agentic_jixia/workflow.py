@@ -1,9 +1,15 @@
 from __future__ import annotations
 
 import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from dataclasses import dataclass
+import os
 from pathlib import Path
 import sys
+import threading
+import time
 from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
 from agentic_jixia.toolbox import (
@@ -11,10 +17,20 @@ from agentic_jixia.toolbox import (
     FileLookupTool,
     ReferenceLookupTool,
     ReferenceResult,
+    SymbolIndex,
     SymbolLookupTool,
 )
-from jixia_lean_utils import preprocess_lean_analysis, process_snippet
-from utils import load_json, sort_by_section
+from agentic_jixia.compile_check import CompileCheckTool
+from agentic_jixia.file_store import FileStore, get_file_store
+from dependency_slices import build_decl_span_index
+from globals import BASELINE_DATA_PATH, CACHE_DIR
+from jixia_lean_utils import (
+    load_analysis_sections,
+    preprocess_lean_analysis,
+    process_snippet,
+    section_import_closure,
+)
+from utils import filter_baseline, load_json, load_jsonl, sort_by_section
 
 # Ensure the src root (where ``main.py`` lives) is importable when this module
 # is executed directly via ``python src/agentic_jixia/workflow.py``.
@@ -34,6 +50,7 @@ class AgenticToolset:
     decl_lookup: DeclarationLookupTool
     sym_lookup: SymbolLookupTool
     reference_lookup: ReferenceLookupTool
+    compile_check: Optional[CompileCheckTool] = None
 
 
 @dataclass
@@ -61,10 +78,27 @@ class AgenticTask:
         }
 
 
+@dataclass
+class FailedTask:
+    """Stands in for a baseline item whose preparation raised (see ``iter_tasks(keep_going=True)``)."""
+    section: str
+    index: int
+    fqn: NameTuple
+    content: str
+    error: str
+
+
 class AgenticJixiaWorkflow:
     """
     Orchestrates the exact preprocessing pipeline from ``src/main.py`` but exposes every
     per-theorem task as a bundle of lookup tools that can be consumed by an agent loop.
+
+    With ``lazy=True`` nothing is loaded until first use: the jixia table, the
+    analysis data, the baseline data, the symbol index and the declaration
+    spans are each built the first time something needs them, and missing
+    theorem names are resolved per task instead of for the whole textbook.
+    ``sections`` restricts loading to those sections and the sections they
+    import. ``timings`` records the seconds spent in each startup stage.
     """
 
     def __init__(
@@ -73,30 +107,187 @@ class AgenticJixiaWorkflow:
         force_reprocess: bool = False,
         reference_depth: int = 2,
         reference_budget: int = 24,
+        reference_max_chars: Optional[int] = 16_000,
+        compile_check: Optional[CompileCheckTool] = None,
+        lazy: bool = False,
+        sections: Optional[Sequence[str]] = None,
     ):
+        self.force_reprocess = force_reprocess
         self.reference_depth = reference_depth
         self.reference_budget = reference_budget
-
-        jixia_table = construct_jixia_table()
-        (
-            self.mapped_lean_analysis_data,
-            global_symbol_table,
-            self.global_dependency_table,
-        ) = preprocess_lean_analysis(jixia_table, force_reprocess=force_reprocess)
-        self.aggregated_baseline_data = preprocess_baseline_data(force_reprocess=force_reprocess)
-
-        self._decl_lookup = DeclarationLookupTool(global_symbol_table)
-        self._sym_lookup = SymbolLookupTool(global_symbol_table)
-        self._reference_lookup = ReferenceLookupTool(self._sym_lookup)
+        self.reference_max_chars = reference_max_chars
+        self.compile_check = compile_check
+        self.lazy = lazy
+        self.sections = list(sections) if sections else None
+        self.timings: Dict[str, float] = {}
+
+        self._lock = threading.RLock()
+        self._timings_lock = threading.Lock()
+        self._jixia_table: Optional[dict] = None
+        self._lean_analysis: Optional[tuple] = None
+        self._baseline: Optional[dict] = None
+        self._lookups: Optional[tuple] = None
+        self._file_store = None
+
+        if not lazy:
+            self._get_lean_analysis()
+            self._baseline = self.aggregated_baseline_data
+            self._get_lookups()
+            self._file_store = self.file_store
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._timings_lock:
+                self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+    @property
+    def jixia_table(self) -> dict:
+        with self._lock:
+            if self._jixia_table is None:
+                with self._timed("jixia_table"):
+                    self._jixia_table = construct_jixia_table()
+            return self._jixia_table
+
+    def _get_lean_analysis(self) -> tuple:
+        with self._lock:
+            if self._lean_analysis is None:
+                jixia_table = self.jixia_table
+                with self._timed("lean_analysis"):
+                    if self.sections:
+                        # Pickles hold the whole textbook; reading just the
+                        # import closure of the requested sections is cheaper.
+                        closure = section_import_closure(jixia_table, self.sections)
+                        self._lean_analysis = load_analysis_sections(jixia_table, closure)
+                    else:
+                        self._lean_analysis = preprocess_lean_analysis(jixia_table, force_reprocess=self.force_reprocess)
+            return self._lean_analysis
+
+    @property
+    def mapped_lean_analysis_data(self) -> dict:
+        return self._get_lean_analysis()[0]
+
+    @property
+    def global_dependency_table(self) -> dict:
+        return self._get_lean_analysis()[2]
+
+    @property
+    def aggregated_baseline_data(self) -> dict:
+        with self._lock:
+            if self._baseline is None:
+                with self._timed("baseline_data"):
+                    if self.lazy or self.sections:
+                        self._baseline = self._load_baseline_sections()
+                    else:
+                        self._baseline = preprocess_baseline_data(force_reprocess=self.force_reprocess)
+            return self._baseline
+
+    def _load_baseline_sections(self) -> dict:
+        """
+        Baseline items for ``self.sections`` (all if unset). Uses the named cache
+        when present; otherwise names are left for ``_ensure_name`` to resolve
+        when each task is produced.
+        """
+        cache_path = os.path.join(CACHE_DIR, "aggregated_baseline_data_cache.json")
+        if os.path.exists(cache_path) and not self.force_reprocess:
+            baseline = load_json(cache_path)
+        else:
+            baseline = filter_baseline(load_jsonl(BASELINE_DATA_PATH))
+        if self.sections:
+            baseline = {section: items for section, items in baseline.items() if section in self.sections}
+        return baseline
+
+    def _get_lookups(self) -> tuple:
+        with self._lock:
+            if self._lookups is None:
+                global_symbol_table = self._get_lean_analysis()[1]
+                with self._timed("symbol_index"):
+                    symbol_index = SymbolIndex(global_symbol_table)
+                    decl_lookup = DeclarationLookupTool(symbol_index)
+                    sym_lookup = SymbolLookupTool(symbol_index)
+                    reference_lookup = ReferenceLookupTool(sym_lookup, decl_lookup)
+                self._lookups = (symbol_index, decl_lookup, sym_lookup, reference_lookup)
+            return self._lookups
+
+    @property
+    def symbol_index(self) -> SymbolIndex:
+        return self._get_lookups()[0]
+
+    @property
+    def file_store(self) -> FileStore:
+        with self._lock:
+            if self._file_store is None:
+                mapped = self.mapped_lean_analysis_data
+                with self._timed("decl_spans"):
+                    store = get_file_store()
+                    store.register_declarations(build_decl_span_index(mapped))
+                self._file_store = store
+            return self._file_store
 
     def iter_tasks(
         self,
         *,
         sections: Optional[Sequence[str]] = None,
         limit: Optional[int] = None,
-    ) -> Iterator[AgenticTask]:
+        prefetch: int = 0,
+        workers: int = 4,
+        ordered: bool = True,
+        keep_going: bool = False,
+    ) -> Iterator[AgenticTask | FailedTask]:
+        """
+        Yield one :class:`AgenticTask` per baseline theorem.
+
+        With ``prefetch > 0`` the next ``prefetch`` tasks are prepared (name
+        resolution and reference collection) on a pool of ``workers`` threads
+        while the caller handles the current one. No more than ``prefetch``
+        tasks are in flight or buffered at once. ``ordered=False`` yields tasks
+        as soon as they are ready instead of in section order. With
+        ``keep_going`` an item whose preparation raises is yielded as a
+        :class:`FailedTask` instead of ending the iteration.
+        """
+        pending = self._iter_pending(sections, limit)
+        prepare = self._prepare_or_fail if keep_going else self._prepare_task
+        if prefetch <= 0:
+            for section, content, toolset in pending:
+                yield prepare(section, content, toolset)
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="task-prep") as pool:
+            in_flight: "deque[Future]" = deque()
+            try:
+                for item in pending:
+                    in_flight.append(pool.submit(prepare, *item))
+                    if len(in_flight) >= prefetch:
+                        yield self._next_ready(in_flight, ordered)
+                while in_flight:
+                    yield self._next_ready(in_flight, ordered)
+            finally:
+                # The consumer stopped early (or a task failed): drop queued work.
+                for future in in_flight:
+                    future.cancel()
+
+    @staticmethod
+    def _next_ready(in_flight: "deque[Future]", ordered: bool) -> AgenticTask:
+        if ordered:
+            return in_flight.popleft().result()
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        future = next(f for f in in_flight if f in done)
+        in_flight.remove(future)
+        return future.result()
+
+    def _iter_pending(
+        self,
+        sections: Optional[Sequence[str]],
+        limit: Optional[int],
+    ) -> Iterator[Tuple[str, Dict[str, object], AgenticToolset]]:
+        """Cheap pass over the selected baseline items; the expensive work is in ``_prepare_task``."""
         selected_sections = set(sections) if sections else None
         produced = 0
+        _, decl_lookup, sym_lookup, reference_lookup = self._get_lookups()
 
         for section in sort_by_section(self.aggregated_baseline_data.keys()):
             if selected_sections and section not in selected_sections:
@@ -107,42 +298,62 @@ class AgenticJixiaWorkflow:
                 continue
 
             dependency_paths = self.mapped_lean_analysis_data[section]["dependency_set"]
-            file_lookup = FileLookupTool(dependency_paths)
+            file_lookup = FileLookupTool(dependency_paths, store=self.file_store)
 
             toolset = AgenticToolset(
                 file_lookup=file_lookup,
-                decl_lookup=self._decl_lookup,
-                sym_lookup=self._sym_lookup,
-                reference_lookup=self._reference_lookup,
+                decl_lookup=decl_lookup,
+                sym_lookup=sym_lookup,
+                reference_lookup=reference_lookup,
+                compile_check=self.compile_check,
             )
 
             for content in section_payload:
-                idx = int(content["idx"])
-                fqn = self._ensure_name(section, idx, content)
-                reference_result = toolset.reference_lookup.collect(
-                    fqn, max_depth=self.reference_depth, budget=self.reference_budget
-                )
-
-                yield AgenticTask(
-                    section=section,
-                    index=idx,
-                    fqn=fqn,
-                    content=content["content"],
-                    toolset=toolset,
-                    reference_summary=reference_result,
-                )
+                yield section, content, toolset
 
                 produced += 1
                 if limit and produced >= limit:
                     return
 
+    def _prepare_task(self, section: str, content: Dict[str, object], toolset: AgenticToolset) -> AgenticTask:
+        idx = int(content["idx"])
+        fqn = self._ensure_name(section, idx, content)
+        reference_result = toolset.reference_lookup.collect(
+            fqn,
+            max_depth=self.reference_depth,
+            budget=self.reference_budget,
+            max_chars=self.reference_max_chars,
+        )
+        return AgenticTask(
+            section=section,
+            index=idx,
+            fqn=fqn,
+            content=content["content"],
+            toolset=toolset,
+            reference_summary=reference_result,
+        )
+
+    def _prepare_or_fail(self, section: str, content: Dict[str, object], toolset: AgenticToolset) -> AgenticTask | FailedTask:
+        try:
+            return self._prepare_task(section, content, toolset)
+        except Exception as e:
+            return FailedTask(
+                section=section,
+                index=int(content.get("idx", -1)),
+                fqn=tuple(content.get("name") or ()),
+                content=str(content.get("content", "")),
+                error=f"{type(e).__name__}: {e}",
+            )
+
     def collect_tasks(
         self,
         *,
         sections: Optional[Sequence[str]] = None,
         limit: Optional[int] = None,
+        prefetch: int = 0,
+        workers: int = 4,
     ) -> List[AgenticTask]:
-        return list(self.iter_tasks(sections=sections, limit=limit))
+        return list(self.iter_tasks(sections=sections, limit=limit, prefetch=prefetch, workers=workers))
 
     def _ensure_name(self, section: str, idx: int, content: Dict[str, object]) -> NameTuple:
         """
@@ -153,7 +364,8 @@ class AgenticJixiaWorkflow:
         if name:
             return tuple(name)
 
-        decl_path = process_snippet(content["content"], section, idx)
+        with self._timed("process_snippet"):
+            decl_path = process_snippet(content["content"], section, idx)
         decl_json = load_json(decl_path)
         resolved_name = tuple(decl_json[0]["name"])
         content["name"] = list(resolved_name)
@@ -171,8 +383,26 @@ def _build_cli() -> argparse.ArgumentParser:
         help="Restrict to specific Section_* identifiers (can be repeated).",
     )
     parser.add_argument("--force-reprocess", action="store_true", help="Bypass caches.")
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Defer loading to first use and only load the --section sections (plus their imports).",
+    )
     parser.add_argument("--reference-depth", type=int, default=2)
     parser.add_argument("--reference-budget", type=int, default=24)
+    parser.add_argument(
+        "--reference-max-chars",
+        type=int,
+        default=16_000,
+        help="Declaration-text budget for the reference expansion of each task.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Prepare up to this many upcoming tasks in the background (0 prepares them inline).",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Threads used with --prefetch.")
     parser.add_argument(
         "--max-file-chars",
         type=int,
@@ -182,16 +412,30 @@ def _build_cli() -> argparse.ArgumentParser:
     return parser
 
 
+def print_startup_timings(workflow: AgenticJixiaWorkflow, init_s: float, total_s: float) -> None:
+    print(f"--- Startup ({'lazy' if workflow.lazy else 'eager'}) ---")
+    for stage, seconds in workflow.timings.items():
+        print(f"{stage:>16}: {seconds:.2f}s")
+    print(f"{'constructor':>16}: {init_s:.2f}s")
+    print(f"{'total':>16}: {total_s:.2f}s")
+
+
 def main(argv: Optional[Sequence[str]] = None) -> None:
     parser = _build_cli()
     args = parser.parse_args(argv)
 
+    started = time.perf_counter()
     workflow = AgenticJixiaWorkflow(
         force_reprocess=bool(args.force_reprocess),
         reference_depth=args.reference_depth,
         reference_budget=args.reference_budget,
+        reference_max_chars=args.reference_max_chars,
+        lazy=bool(args.lazy),
+        sections=args.section if args.lazy else None,
     )
-    tasks = workflow.collect_tasks(sections=args.section, limit=args.limit)
+    init_s = time.perf_counter() - started
+    tasks = workflow.collect_tasks(sections=args.section, limit=args.limit, prefetch=args.prefetch, workers=args.workers)
+    print_startup_timings(workflow, init_s, time.perf_counter() - started)
 
     for task in tasks:
         seed = task.as_prompt_seed(max_file_chars=args.max_file_chars)
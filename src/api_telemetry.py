@@ -0,0 +1,106 @@
+import argparse
+import json
+from typing import Any, Dict, List, Optional
+
+from utils import percentile
+
+# USD per 1M tokens. Reasoning tokens are billed as output tokens.
+MODEL_PRICING = {
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.00},
+}
+BATCH_DISCOUNT = 0.5
+
+
+def estimate_cost(usage: Dict[str, Any], model: str, batch: bool = False) -> Optional[float]:
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None or not usage:
+        return None
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    cached_tokens = usage.get("cached_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    cost = (
+        (prompt_tokens - cached_tokens) * pricing["input"]
+        + cached_tokens * pricing["cached_input"]
+        + completion_tokens * pricing["output"]
+    ) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+def summarize_entries(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    telemetry = [e.get("telemetry") or {} for e in entries]
+    usage = [e.get("usage") or {} for e in entries]
+    latencies = [t["latency_s"] for t in telemetry if t.get("latency_s") is not None]
+    queue_waits = [t["queue_wait_s"] for t in telemetry if t.get("queue_wait_s") is not None]
+    starts = [t["started_at"] for t in telemetry if t.get("started_at") is not None]
+    ends = [t["finished_at"] for t in telemetry if t.get("finished_at") is not None]
+    wall_time = (max(ends) - min(starts)) if starts and ends else None
+    costs = [t["cost_usd"] for t in telemetry if t.get("cost_usd") is not None]
+
+    def total(key: str) -> int:
+        return sum(u.get(key) or 0 for u in usage)
+
+    return {
+        "calls": len(entries),
+        "errors": sum(1 for e in entries if e.get("status") == "error" or str(e.get("result", "")).startswith("API_ERROR")),
+        "retries": sum(t.get("retries") or 0 for t in telemetry),
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "queue_wait_p50_s": percentile(queue_waits, 50),
+        "queue_wait_p95_s": percentile(queue_waits, 95),
+        "wall_time_s": wall_time,
+        "throughput_per_min": (len(entries) / wall_time * 60) if wall_time else None,
+        "prompt_tokens": total("prompt_tokens"),
+        "cached_tokens": total("cached_tokens"),
+        "completion_tokens": total("completion_tokens"),
+        "reasoning_tokens": total("reasoning_tokens"),
+        "cost_usd": sum(costs) if costs else None,
+    }
+
+def summarize_stream_log(stream_log_path: str, run_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a run- and section-level report from a ``*_api_call_stream.jsonl`` log.
+    The log is appended to across runs, so only ``run_id`` (default: the last
+    run in the file) is summarized.
+    """
+    with open(stream_log_path, "r") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if run_id is None:
+        run_ids = [e["run_id"] for e in entries if e.get("run_id")]
+        run_id = run_ids[-1] if run_ids else None
+    entries = [e for e in entries if e.get("run_id") == run_id]
+
+    by_section: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        by_section.setdefault(entry.get("chapter_name", "unknown"), []).append(entry)
+
+    return {
+        "run_id": run_id,
+        "run": summarize_entries(entries),
+        "sections": {section: summarize_entries(items) for section, items in sorted(by_section.items())},
+    }
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    run = summary["run"]
+
+    def fmt(value: Optional[float], spec: str = ".2f") -> str:
+        return "n/a" if value is None else format(value, spec)
+
+    print(f"--- API telemetry ({summary['run_id']}) ---")
+    print(f"Calls: {run['calls']}  Errors: {run['errors']}  Retries: {run['retries']}")
+    print(f"Latency p50/p95 (s): {fmt(run['latency_p50_s'])} / {fmt(run['latency_p95_s'])}")
+    print(f"Queue wait p50/p95 (s): {fmt(run['queue_wait_p50_s'])} / {fmt(run['queue_wait_p95_s'])}")
+    print(f"Throughput (calls/min): {fmt(run['throughput_per_min'])}")
+    print(f"Tokens: prompt {run['prompt_tokens']} (cached {run['cached_tokens']}), completion {run['completion_tokens']} (reasoning {run['reasoning_tokens']})")
+    print(f"Cost (USD): {fmt(run['cost_usd'], '.4f')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize an *_api_call_stream.jsonl log.")
+    parser.add_argument("stream_log_path", type=str)
+    parser.add_argument("--run-id", type=str, default=None)
+    parser.add_argument("--out-json", type=str, default=None)
+    args = parser.parse_args()
+    summary = summarize_stream_log(args.stream_log_path, run_id=args.run_id)
+    print_summary(summary)
+    if args.out_json:
+        with open(args.out_json, "w") as f:
+            json.dump(summary, f, indent=4)
@@ -1,16 +1,11 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from tqdm import tqdm
 from utils import sort_by_section
+from prompt_budget import build_symbol_section_index, canonical_dependency_order, pack_dependency_set, pack_section_dependencies, rank_dependency_files
 
-def render_dependency_set(dependency_set: set[str]) -> str:
-    dependency_context = []
-    for dep in dependency_set:
-        with open(dep, "r") as f:
-            dependency_context.append(f.read())
-    return "\n".join(dependency_context)
-
-def build_gpt_context(aggregated_baseline_data: dict, mapped_lean_analysis_data: dict) -> List[Dict[str, Any]]:
+def build_gpt_context(aggregated_baseline_data: dict, mapped_lean_analysis_data: dict, token_budget: Optional[int] = None) -> List[Dict[str, Any]]:
     test_examples_with_context = []
+    symbol_section_index = build_symbol_section_index(mapped_lean_analysis_data)
 
 
     for section in tqdm(sort_by_section(aggregated_baseline_data.keys())):
@@ -21,14 +16,36 @@ def build_gpt_context(aggregated_baseline_data: dict, mapped_lean_analysis_data:
             query_name = tuple(content["name"])
             query_text = content["content"]
             
-            query_context = render_dependency_set(mapped_lean_analysis_data[section]["dependency_set"])
+            packed = pack_section_dependencies(section, query_name, mapped_lean_analysis_data, symbol_section_index, token_budget)
             
             test_examples_with_context.append(
                 {
                     "chapter_name": section,
                     "FQN": ".".join(query_name),
                     "content": query_text, # Use the sorted, namespaced context
-                    "dependency_set": query_context,
+                    **packed,
+                }
+            )
+    return test_examples_with_context
+
+def build_baseline_context(aggregated_baseline_data: dict, mapped_lean_analysis_data: dict, token_budget: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Context for the baseline approach: every file the section imports, with no
+    ranking by the theorem's references. Only the section's own file is
+    preferred when a token budget forces files to be dropped.
+    """
+    test_examples_with_context = []
+    for section in tqdm(sort_by_section(aggregated_baseline_data.keys())):
+        dependency_paths = canonical_dependency_order(mapped_lean_analysis_data[section]["dependency_set"])
+        ranked_paths = rank_dependency_files(dependency_paths, section, (), {})
+        for content in aggregated_baseline_data[section]:
+            test_examples_with_context.append(
+                {
+                    "chapter_name": section,
+                    "FQN": ".".join(content["name"]),
+                    "source_idx": content["idx"],
+                    "content": content["content"],
+                    **pack_dependency_set(dependency_paths, ranked_paths, token_budget),
                 }
             )
-    return test_examples_with_context
\ No newline at end of file
+    return test_examples_with_context
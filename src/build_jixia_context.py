@@ -1,13 +1,18 @@
 import os
-from globals import ANALYSIS_BOOK_DIRECTORY, MAX_DEPTH, COMMENT_PATTERN
-from typing import Set, Tuple, List, Dict, Optional
+from globals import ANALYSIS_BOOK_DIRECTORY, MAX_DEPTH
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from tqdm import tqdm
-import re
-from utils import load_json, sort_by_section
+from utils import sort_by_section
+from jixia_json import clean_decl_text, load_decls
+from profiling import count
+from prompt_budget import build_symbol_section_index, pack_section_dependencies, count_tokens, canonical_dependency_order
+from dependency_slices import build_decl_span_index, build_reverse_reference_index, neighbour_ring, render_dependency_slices
+
+CONTEXT_MODES = ("files", "slices")
 
 
 def build_lookup_table(decl_data_path: str) -> dict:
-    decl_data = load_json(decl_data_path)
+    decl_data = load_decls(decl_data_path)
     lookup_table = {}
     for decl in decl_data:
         if not decl["ref"]["original"]:
@@ -27,10 +32,6 @@ def load_external_lookup_table(module: tuple, path: str, mapped_lean_analysis_da
 
     return build_lookup_table(path)
 
-def extract_context(reference: dict):
-    # This function can return None if 'pp' is None
-    return reference['ref']['pp']
-
 def extract_references(syms: dict):
     return syms["typeReferences"], syms["valueReferences"]
 def load_textbook_section(section: str):
@@ -169,250 +170,286 @@ def _render_namespace(
 
     out.append(f"end {node.name}")
 
-def render_dependency_set(dependency_set: set[str]) -> str:
-    dependency_context = []
-    for dep in dependency_set:
-        with open(dep, "r") as f:
-            dependency_context.append(f.read())
-    return "\n".join(dependency_context)
-
-def build_jixia_context(aggregated_baseline_data: dict, mapped_lean_analysis_data: dict, global_symbol_table: dict, global_dependency_table: dict) -> list[dict]:
-    def check_imports(ref: list):
-        if ref[0] not in ["Analysis", "Init"]:
-            return True
+def build_context_dict(sorted_symbols: List[Tuple[str, ...]], global_symbol_table: dict) -> Dict[Tuple[str, ...], List[str]]:
+    """Group the comment-stripped text of each symbol's declaration by namespace, in ``sorted_symbols`` order."""
+    context_set: Set[str] = set()
+    context_dict: Dict[Tuple[str, ...], List[str]] = {}
+
+    for symbol_tuple in sorted_symbols:
+        # Callers only pass local symbols, which always have a "decl"
+        decl = global_symbol_table[symbol_tuple]["decl"]
+        # Comments are stripped once, when the tables are built.
+        def_text = clean_decl_text(decl)
+
+        if not def_text: # Skip empty definitions (no pp, or only comments)
+            continue
+
+        if def_text in context_set: # Dedupe
+            continue
+        context_set.add(def_text)
+        
+        namespace_tuple = tuple(decl["name"][:-1])
+        if namespace_tuple not in context_dict:
+            context_dict[namespace_tuple] = []
+        context_dict[namespace_tuple].append(def_text)
+    return context_dict
+
+def is_local_chapter_ref(symbol_tuple: Tuple[str, ...], global_symbol_table: dict, missed_references: Optional[dict] = None, section: Optional[str] = None) -> bool:
+    """
+    Checks if a symbol is from a local namespace and exists in our
+    global table *with a decl object*. Misses are recorded in
+    ``missed_references`` (symbol -> sections) when given.
+    """
+    if not symbol_tuple:
         return False
 
+    is_chapter = symbol_tuple[0].startswith("Chapter")
+    is_finset = symbol_tuple[0].startswith("Finset")
+
+    if not (is_chapter or is_finset): # If it's not in either namespace
+        return False
+
+    # Explicitly check for key and then for "decl" sub-key
+    # ("decl" can be missing if a symbol is in .sym but not .decl)
+    if symbol_tuple not in global_symbol_table or "decl" not in global_symbol_table[symbol_tuple]:
+        if missed_references is not None:
+            missed_references.setdefault(tuple(symbol_tuple), set()).add(section)
+        return False
+
+    return True
+
+def find_sym_data(symbol_tuple: Tuple[str, ...], global_symbol_table: dict) -> Optional[Dict]:
+    """
+    Finds the .sym.json data for any symbol from the unified
+    global_symbol_table. NO DEFAULTS.
+    """
+    entry = global_symbol_table.get(symbol_tuple)
+    if entry is None:
+        return None
+    return entry.get("sym")
+
+def query_initial_refs(syms: dict) -> Set[Tuple[str, ...]]:
+    """Type and value references of the query itself."""
+    initial_type_refs = [tuple(r) for r in syms.get("typeReferences") or []]
+    initial_value_refs = [tuple(r) for r in syms.get("valueReferences") or []]
+    return set(initial_type_refs + initial_value_refs)
+
+def collect_closure(initial_refs: Iterable[Tuple[str, ...]], global_symbol_table: dict, missed_references: Optional[dict] = None, section: Optional[str] = None) -> Set[Tuple[str, ...]]:
+    """
+    PHASE 1: Collect all local symbols reachable from ``initial_refs`` through
+    type references, and through value references up to ``MAX_DEPTH``.
+
+    Depth-first with an explicit stack (same visiting order as the recursive
+    walk), so long reference chains do not hit the recursion limit.
+    """
+    processed_symbols: Set[Tuple[str, ...]] = set()
+    for ref_tuple in initial_refs:
+        stack = [(ref_tuple, 0)]
+        while stack:
+            symbol_tuple, current_depth = stack.pop()
+            # 1. Base Cases: Stop if not local or already seen
+            if not is_local_chapter_ref(symbol_tuple, global_symbol_table, missed_references, section) or symbol_tuple in processed_symbols:
+                continue
+
+            # 2. Process this symbol
+            processed_symbols.add(symbol_tuple)
+            sym_data = find_sym_data(symbol_tuple, global_symbol_table)
+            if sym_data is None:
+                continue
+
+            # 3. Type dependencies are all followed; value dependencies only
+            # if depth allows. Pushed in reverse so type references are
+            # visited first, in order.
+            children = [(tuple(t_ref), current_depth) for t_ref in sym_data.get("typeReferences") or []]
+            if current_depth < MAX_DEPTH or MAX_DEPTH == -1:
+                children += [(tuple(v_ref), current_depth + 1) for v_ref in sym_data.get("valueReferences") or []]
+            stack.extend(reversed(children))
+    count("symbols_visited", len(processed_symbols))
+    return processed_symbols
+
+def topological_sort(symbols_to_sort: Set[Tuple], global_symbol_table: dict, query_name: Optional[Tuple[str, ...]] = None) -> List[Tuple]:
+    """
+    PHASE 2: Sort all collected symbols. NO DEFAULTS.
+    """
+    graph = {sym: set() for sym in symbols_to_sort}
+    in_degree = {sym: 0 for sym in symbols_to_sort}
+
+    for sym in symbols_to_sort:
+        sym_data = find_sym_data(sym, global_symbol_table)
+        if sym_data is None:
+            continue
+
+        for v_ref_list in sym_data.get("valueReferences") or []:
+            v_ref = tuple(v_ref_list)
+            if v_ref in symbols_to_sort:
+                if sym not in graph[v_ref]:
+                    graph[v_ref].add(sym)
+                    in_degree[sym] += 1
+
+    # Kahn's algorithm
+    queue = [sym for sym in symbols_to_sort if in_degree[sym] == 0]
+    sorted_list = []
+
+    while queue:
+        queue.sort(key=lambda x: str(x))
+        u = queue.pop(0)
+        sorted_list.append(u)
+
+        # Sort for deterministic output
+        sorted_neighbors = sorted(list(graph[u]), key=lambda x: str(x))
+        for v in sorted_neighbors:
+            in_degree[v] -= 1
+            if in_degree[v] == 0:
+                queue.append(v)
+
+    if len(sorted_list) != len(symbols_to_sort):
+        print(f"Warning: Cycle detected in dependencies for {query_name}.")
+        remaining = [s for s in symbols_to_sort if s not in sorted_list]
+        return sorted_list + remaining
+
+    return sorted_list
+
+def check_imports(ref: list):
+    if ref[0] not in ["Analysis", "Init"]:
+        return True
+    return False
+
+# Rendered in place of the proposition, so one rendering of a context serves
+# every query whose closure and proposition placement are the same.
+PROPOSITION_SLOT = "\0proposition\0"
+
+class RenderedContextCache:
+    """
+    Memoized ``build_context_dict`` -> ``build_context_tree`` -> ``render_lean``
+    for one ``global_symbol_table``. Renderings are keyed on the sorted
+    closure and the proposition placement and stored split at the
+    proposition, which is spliced in per query. Theorems of a section often
+    share their closure, so rendering cost scales with distinct contexts.
+    """
+
+    def __init__(self, global_symbol_table: dict):
+        self.global_symbol_table = global_symbol_table
+        self._renderings: Dict[tuple, Tuple[str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _render(self, sorted_symbols: List[Tuple[str, ...]], proposition: Optional[str], place_inside_top_level: bool, target_top_level: Optional[str]) -> str:
+        lines: List[str] = []
+        render_lean(
+            build_context_tree(build_context_dict(sorted_symbols, self.global_symbol_table)),
+            lines,
+            proposition=proposition,
+            place_inside_top_level=place_inside_top_level,
+            target_top_level=target_top_level,
+        )
+        return "\n".join(lines)
+
+    def render(self, sorted_symbols: List[Tuple[str, ...]], proposition: str, place_inside_top_level: bool = False, target_top_level: Optional[str] = None) -> str:
+        """``render_lean`` output for ``sorted_symbols`` with ``proposition``, joined into one string."""
+        if not proposition:
+            # render_lean leaves an empty proposition out entirely.
+            return self._render(sorted_symbols, None, place_inside_top_level, target_top_level)
+        # render_lean puts the proposition inside ``target_top_level`` whenever
+        # that namespace is rendered, even with ``place_inside_top_level`` off.
+        key = (tuple(sorted_symbols), place_inside_top_level, target_top_level)
+        rendering = self._renderings.get(key)
+        if rendering is None:
+            self.misses += 1
+            count("render_cache_misses")
+            before, _, after = self._render(sorted_symbols, PROPOSITION_SLOT, place_inside_top_level, target_top_level).partition(PROPOSITION_SLOT)
+            rendering = self._renderings[key] = (before, after)
+        else:
+            self.hits += 1
+            count("render_cache_hits")
+        return rendering[0] + proposition + rendering[1]
+
+def render_jixia_context(sorted_symbols: List[Tuple[str, ...]], global_symbol_table: dict, query_name: Tuple[str, ...], query_text: str, imports: list, cache: Optional[RenderedContextCache] = None) -> str:
+    """
+    The query placed after its namespaced, sorted context, behind the
+    section's external imports. Pass a ``RenderedContextCache`` to reuse
+    renderings across queries.
+    """
+    filtered_imports = ["import " + '.'.join(imp) for imp in imports if check_imports(imp)]
+    if "import Mathlib.Tactic" not in filtered_imports:
+         filtered_imports.insert(0, "import Mathlib.Tactic")
+
+    # --- Rendering Logic ---
+
+    target_ns = None
+    if query_name:
+        if query_name[0].startswith("Chapter"):
+            target_ns = query_name[0]
+        elif query_name[0].startswith("Finset"):
+            target_ns = query_name[0]
+
+    if cache is None:
+        cache = RenderedContextCache(global_symbol_table)
+    body = cache.render(sorted_symbols, query_text, place_inside_top_level=False, target_top_level=target_ns)
+
+    return "\n".join(filtered_imports + [""] + ([body] if body else []))
+
+def build_jixia_context(aggregated_baseline_data: dict, mapped_lean_analysis_data: dict, global_symbol_table: dict, global_dependency_table: dict, token_budget: Optional[int] = None, context_mode: str = "files") -> list[dict]:
+    """
+    ``context_mode`` controls the ``dependency_set`` field: "files" embeds whole
+    dependency files (packed up to ``token_budget``), "slices" embeds only the
+    source spans of the computed closure plus one ring of neighbours.
+    """
+    if context_mode not in CONTEXT_MODES:
+        raise ValueError(f"Invalid context mode: {context_mode}")
+
     test_examples_with_context = []
     missed_references = {}
+    symbol_section_index = build_symbol_section_index(mapped_lean_analysis_data)
+    render_cache = RenderedContextCache(global_symbol_table)
+    if context_mode == "slices":
+        span_index = build_decl_span_index(mapped_lean_analysis_data)
+        reverse_index = build_reverse_reference_index(global_symbol_table)
 
     for section in tqdm(sort_by_section(aggregated_baseline_data.keys())):
         contents = aggregated_baseline_data[section]
 
         for idx, content in enumerate(contents):
-  
-            # --- Context Collection Setup (per-query) ---
-            processed_symbols: Set[Tuple[str, ...]] = set()
-            
             query_name = tuple(content["name"])
             query_text = content["content"]
 
-            # --- Start: Nested Helper Functions ---
-
-            def is_local_chapter_ref(symbol_tuple: Tuple[str, ...]) -> bool:
-                """
-                Checks if a symbol is from a local namespace and exists in our 
-                global table *with a decl object*.
-                """
-                if not symbol_tuple:
-                        return False
-
-                is_chapter = symbol_tuple[0].startswith("Chapter")
-                is_finset = symbol_tuple[0].startswith("Finset")
-
-                if not (is_chapter or is_finset): # If it's not in either namespace
-                    return False
-                
-                # Explicitly check for key and then for "decl" sub-key
-                if symbol_tuple not in global_symbol_table:
-                    if symbol_tuple not in missed_references:
-                        missed_references[tuple(symbol_tuple)] = set()
-                    missed_references[tuple(symbol_tuple)].add(section)
-                    return False
-                
-                if "decl" not in global_symbol_table[symbol_tuple]:
-                    # This can happen if a symbol is in .sym but not .decl
-                    if symbol_tuple not in missed_references:
-                        missed_references[tuple(symbol_tuple)] = set()
-                    missed_references[tuple(symbol_tuple)].add(section)
-                    return False
-                    
-                return True
-
-            
-            def find_sym_data(symbol_tuple: Tuple[str, ...]) -> Optional[Dict]:
-                """
-                Finds the .sym.json data for any symbol from the unified
-                global_symbol_table. NO DEFAULTS.
-                """
-                if symbol_tuple not in global_symbol_table:
-                    return None
-                
-                # Explicit check for the "sym" key
-                if "sym" in global_symbol_table[symbol_tuple]:
-                    return global_symbol_table[symbol_tuple]["sym"]
-                
-                return None
-          
-
-            def collect_refs_recursive(symbol_tuple: Tuple[str, ...], current_depth: int):
-                """
-                PHASE 1: Collect all symbols. NO DEFAULTS.
-                """
-                # 1. Base Cases: Stop if not local or already seen
-                if not is_local_chapter_ref(symbol_tuple) or symbol_tuple in processed_symbols:
-                    return
-                
-                # 2. Process this symbol
-                processed_symbols.add(symbol_tuple)
-                sym_data = find_sym_data(symbol_tuple)
-                if sym_data is None:
-                    return
-
-                # 3. Recurse on *all* type dependencies.
-                # Explicit key and None check.
-                if "typeReferences" in sym_data:
-                    type_refs_list = sym_data["typeReferences"]
-                    if type_refs_list is not None:
-                        for t_ref in type_refs_list:
-                            collect_refs_recursive(tuple(t_ref), current_depth)
-
-                # 4. Recurse on value dependencies, *if* depth allows
-                if current_depth < MAX_DEPTH or MAX_DEPTH == -1:
-                    # Explicit key and None check.
-                    if "valueReferences" in sym_data:
-                        value_refs_list = sym_data["valueReferences"]
-                        if value_refs_list is not None:
-                            for v_ref in value_refs_list:
-                                collect_refs_recursive(tuple(v_ref), current_depth + 1)
-
-            def topological_sort(symbols_to_sort: Set[Tuple]) -> List[Tuple]:
-                """
-                PHASE 2: Sort all collected symbols. NO DEFAULTS.
-                """
-                graph = {sym: set() for sym in symbols_to_sort}
-                in_degree = {sym: 0 for sym in symbols_to_sort}
-
-                for sym in symbols_to_sort:
-                    sym_data = find_sym_data(sym)
-                    if sym_data is None:
-                        continue
-                    
-                    # Explicit key and None check
-                    if "valueReferences" in sym_data:
-                        val_refs_list = sym_data["valueReferences"]
-                        if val_refs_list is not None:
-                            for v_ref_list in val_refs_list:
-                                v_ref = tuple(v_ref_list)
-                                if v_ref in symbols_to_sort:
-                                    if sym not in graph[v_ref]:
-                                        graph[v_ref].add(sym)
-                                        in_degree[sym] += 1
-                
-                # Kahn's algorithm
-                queue = [sym for sym in symbols_to_sort if in_degree[sym] == 0]
-                sorted_list = []
-                
-                while queue:
-                    queue.sort(key=lambda x: str(x))
-                    u = queue.pop(0)
-                    sorted_list.append(u)
-                    
-                    # Sort for deterministic output
-                    sorted_neighbors = sorted(list(graph[u]), key=lambda x: str(x))
-                    for v in sorted_neighbors:
-                        in_degree[v] -= 1
-                        if in_degree[v] == 0:
-                            queue.append(v)
-                            
-                if len(sorted_list) != len(symbols_to_sort):
-                    print(f"Warning: Cycle detected in dependencies for {query_name}.")
-                    remaining = [s for s in symbols_to_sort if s not in sorted_list]
-                    return sorted_list + remaining
-                    
-                return sorted_list
-            
-            # --- End: Nested Helper Functions ---
-
-            
             # --- Main Collection Logic ---
-            
+
             # Get the query's initial references from the section-specific map
             if query_name not in mapped_lean_analysis_data[section]["sym"]:
                 print(f"Warning: Could not find symbol data for query {query_name} in {section}")
                 continue
-                
+
             syms = mapped_lean_analysis_data[section]["sym"][query_name]
             imports = mapped_lean_analysis_data[section]["imports"]
-            
-            filtered_imports = ["import " + '.'.join(imp) for imp in imports if check_imports(imp)]
-            if "import Mathlib.Tactic" not in filtered_imports:
-                 filtered_imports.insert(0, "import Mathlib.Tactic")
-
-            # Explicitly build initial reference lists
-            initial_type_refs = []
-            if "typeReferences" in syms and syms["typeReferences"] is not None:
-                initial_type_refs = [tuple(r) for r in syms["typeReferences"]]
-
-            initial_value_refs = []
-            if "valueReferences" in syms and syms["valueReferences"] is not None:
-                initial_value_refs = [tuple(r) for r in syms["valueReferences"]]
-            
-            all_initial_refs = set(initial_type_refs + initial_value_refs)
-            
-            for ref_tuple in all_initial_refs:
-                collect_refs_recursive(ref_tuple, current_depth=0)
-
-            sorted_symbols = topological_sort(processed_symbols)
-
-            context_set: Set[str] = set()
-            context_dict: Dict[Tuple[str, ...], List[str]] = {}
-
-            for symbol_tuple in sorted_symbols:
-                # We know "decl" exists because is_local_chapter_ref checked it
-                decl = global_symbol_table[symbol_tuple]["decl"]
-                
-                # --- [THIS IS THE FIX] ---
-                def_text = extract_context(decl) # This can return None
-
-                # Explicitly check if extract_context returned None
-                if def_text is None:
-                    continue # Skip this symbol, it has no printable context
-                
-                def_text = re.sub(COMMENT_PATTERN, "", def_text, flags=re.DOTALL).strip()
-                # --- [END FIX] ---
-
-                if not def_text: # Skip empty definitions (e.g., only comments)
-                    continue
-
-                if def_text in context_set: # Dedupe
-                    continue
-                context_set.add(def_text)
-                
-                namespace_tuple = tuple(decl["name"][:-1])
-                if namespace_tuple not in context_dict:
-                    context_dict[namespace_tuple] = []
-                context_dict[namespace_tuple].append(def_text)
-
-
-            # --- Rendering Logic ---
-            
-            context_tree = build_context_tree(context_dict)
-            lines = []
-            
-            target_ns = None
-            if query_name: 
-                if query_name[0].startswith("Chapter"):
-                    target_ns = query_name[0]
-                elif query_name[0].startswith("Finset"):
-                    target_ns = query_name[0]
-            
-            render_lean(
-                context_tree, 
-                lines, 
-                proposition=query_text, 
-                place_inside_top_level=False,
-                target_top_level=target_ns
-            )
-            
-            lean_context = "\n".join(filtered_imports + [""] + lines)
-            
+
+            processed_symbols = collect_closure(query_initial_refs(syms), global_symbol_table, missed_references, section)
+            sorted_symbols = topological_sort(processed_symbols, global_symbol_table, query_name)
+            lean_context = render_jixia_context(sorted_symbols, global_symbol_table, query_name, query_text, imports, cache=render_cache)
+
+            if context_mode == "slices":
+                dependency_paths = canonical_dependency_order(mapped_lean_analysis_data[section]["dependency_set"])
+                ring = neighbour_ring(sorted_symbols, global_symbol_table, reverse_index)
+                ring.discard(query_name)
+                sliced_context, sliced_paths = render_dependency_slices(
+                    sorted_symbols + sorted(ring), global_symbol_table, span_index, dependency_paths
+                )
+                dependency_fields = {
+                    "dependency_set": sliced_context,
+                    "dependency_tokens": count_tokens(sliced_context),
+                    "dependency_files": sliced_paths,
+                    "dropped_dependency_files": [],
+                }
+            else:
+                dependency_fields = pack_section_dependencies(section, query_name, mapped_lean_analysis_data, symbol_section_index, token_budget)
             
             test_examples_with_context.append(
                 {
                     "chapter_name": section,
                     "FQN": ".".join(query_name),
                     "content": lean_context, # Use the sorted, namespaced context
-                    "dependency_set": render_dependency_set(mapped_lean_analysis_data[section]["dependency_set"]),
+                    "context_names": [list(name) for name in sorted_symbols],
+                    **dependency_fields,
                 }
             )
+    print(f"Rendered {render_cache.misses} distinct contexts for {render_cache.hits + render_cache.misses} queries.")
     return test_examples_with_context
\ No newline at end of file
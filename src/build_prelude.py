@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from globals import CACHE_DIR, LEAN_PROJECT_DIR
+from build_jixia_context import build_context_dict, build_context_tree, build_jixia_context, render_lean
+from lean_diagnostics import parse_lean_output
+from lean_text import LeanDeclaration, iter_tokens, scan_declarations
+from utils import sort_by_section
+from subprocess_telemetry import run_command
+
+PRELUDE_DIR = os.path.join(CACHE_DIR, "prelude")
+PRELUDE_PACKAGE = "ContextPrelude"
+MANIFEST_NAME = "manifest.json"
+# Declarations with these modifiers are not visible to a module importing the prelude.
+MODULE_LOCAL_MODIFIERS = frozenset({"private", "local", "scoped"})
+DECLARATION_MODIFIERS = frozenset({"noncomputable", "private", "protected", "partial", "unsafe", "nonrec"})
+
+
+def prelude_name(section: str, closure: Sequence[Tuple[str, ...]]) -> str:
+    """File (and last module component) of the prelude for one closure of ``section``."""
+    digest = hashlib.sha256(json.dumps([list(name) for name in closure]).encode("utf-8")).hexdigest()
+    return f"{section}_{digest[:12]}"
+
+def prelude_module(name: str) -> str:
+    return f"{PRELUDE_PACKAGE}.{name}"
+
+def group_by_closure(records: List[Dict[str, Any]]) -> Dict[Tuple[Tuple[str, ...], ...], List[Dict[str, Any]]]:
+    """Theorems of one section that share the same context closure, in first-seen order."""
+    groups: Dict[Tuple[Tuple[str, ...], ...], List[Dict[str, Any]]] = {}
+    for record in records:
+        closure = tuple(tuple(name) for name in record["context_names"])
+        groups.setdefault(closure, []).append(record)
+    return groups
+
+def merge_context_names(records: List[Dict[str, Any]]) -> List[Tuple[str, ...]]:
+    """
+    Union of the per-theorem closures of one section in first-seen order. Each
+    closure is topologically sorted, so a symbol's dependencies still come
+    before it in the merged list.
+    """
+    seen = set()
+    merged = []
+    for record in records:
+        for name in record["context_names"]:
+            name = tuple(name)
+            if name not in seen:
+                seen.add(name)
+                merged.append(name)
+    return merged
+
+def render_prelude(records: List[Dict[str, Any]], global_symbol_table: dict) -> Tuple[str, List[str]]:
+    """Lean source of a section's prelude module and the declaration texts it provides."""
+    context_dict = build_context_dict(merge_context_names(records), global_symbol_table)
+    imports = []
+    for line in records[0]["content"].split("\n"):
+        if not line.startswith("import "):
+            break
+        imports.append(line)
+    lines: List[str] = []
+    render_lean(build_context_tree(context_dict), lines, proposition=None)
+    declarations = [text for texts in context_dict.values() for text in texts]
+    return "\n".join(imports + [""] + lines) + "\n", declarations
+
+def compile_prelude(source_path: str, olean_path: str, prelude_dir: str, timeout: Optional[int] = None) -> subprocess.CompletedProcess:
+    # ``-R`` makes the module name ContextPrelude.<section>, matching the .olean path under prelude_dir.
+    return run_command(
+        ["lake", "env", "lean", "-R", prelude_dir, "-o", olean_path, source_path],
+        label="lean_prelude",
+        cwd=LEAN_PROJECT_DIR,
+        timeout=timeout,
+        merge_stderr=True,
+        section=os.path.splitext(os.path.basename(source_path))[0],
+    )
+
+def load_manifest(prelude_dir: str = PRELUDE_DIR) -> Dict[str, Any]:
+    path = os.path.join(prelude_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def build_preludes(
+    aggregated_baseline_data: dict,
+    mapped_lean_analysis_data: dict,
+    global_symbol_table: dict,
+    global_dependency_table: dict,
+    sections: Optional[Sequence[str]] = None,
+    prelude_dir: str = PRELUDE_DIR,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Compile one ``ContextPrelude.<section>_<hash>`` module per distinct context
+    closure into ``prelude_dir``, holding exactly the declarations that
+    ``build_jixia_context`` inlines for the theorems with that closure (see
+    ``apply_prelude`` for why a union per section would rarely apply). A
+    module is only rebuilt when its source changes (or with ``force``).
+    Returns the manifest, keyed by prelude name, which records the section,
+    module name, build status, theorems and provided declaration texts.
+    """
+    if sections:
+        aggregated_baseline_data = {s: aggregated_baseline_data[s] for s in sections if s in aggregated_baseline_data}
+    records = build_jixia_context(aggregated_baseline_data, mapped_lean_analysis_data, global_symbol_table, global_dependency_table)
+    by_section: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        by_section.setdefault(record["chapter_name"], []).append(record)
+
+    package_dir = os.path.join(prelude_dir, PRELUDE_PACKAGE)
+    os.makedirs(package_dir, exist_ok=True)
+    # Entries from the old one-prelude-per-section layout have no "section".
+    manifest = {name: entry for name, entry in load_manifest(prelude_dir).items() if "section" in entry}
+
+    for section in sort_by_section(by_section.keys()):
+        for closure, group in group_by_closure(by_section[section]).items():
+            if not closure:
+                continue
+            name = prelude_name(section, closure)
+            source, declarations = render_prelude(group, global_symbol_table)
+            digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+            source_path = os.path.join(package_dir, f"{name}.lean")
+            olean_path = os.path.join(package_dir, f"{name}.olean")
+            theorems = [record["FQN"] for record in group]
+            previous = manifest.get(name, {})
+            if not force and previous.get("hash") == digest and previous.get("status") == "ok" and os.path.exists(olean_path):
+                previous["theorems"] = theorems
+                print(f"{name}: up to date")
+                continue
+
+            with open(source_path, "w") as f:
+                f.write(source)
+            proc = compile_prelude(source_path, olean_path, prelude_dir)
+            errors = [d for d in parse_lean_output(proc.stdout) if d.severity == "error"]
+            status = "ok" if proc.returncode == 0 else "error"
+            manifest[name] = {
+                "section": section,
+                "module": prelude_module(name),
+                "hash": digest,
+                "status": status,
+                "theorems": theorems,
+                "declarations": declarations,
+                "errors": [f"{d.line}:{d.col}: {d.message.splitlines()[0]}" for d in errors[:20]],
+            }
+            print(f"{name}: {status} ({len(declarations)} declarations, {len(theorems)} theorems)")
+
+    with open(os.path.join(prelude_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def preludes_by_section(manifest: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Built preludes per section, largest first, as ``select_prelude`` expects."""
+    by_section: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in manifest.values():
+        if entry.get("status") == "ok" and "section" in entry:
+            by_section.setdefault(entry["section"], []).append(entry)
+    for entries in by_section.values():
+        entries.sort(key=lambda entry: len(entry["declarations"]), reverse=True)
+    return by_section
+
+def select_prelude(code: str, entries: Sequence[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """The first of ``entries`` that ``apply_prelude`` accepts for ``code``, with the stripped code."""
+    for entry in entries:
+        stripped = apply_prelude(code, entry)
+        if stripped is not None:
+            return entry, stripped
+    return None, None
+
+def _ends_declaration(code: str, decl: LeanDeclaration, stop: int) -> bool:
+    """Whether ``code[stop:decl.stop]`` holds nothing but the next declaration's attributes or modifiers."""
+    for token in iter_tokens(code, stop, decl.stop):
+        return token.line_start and (token.value == "@[" or token.value in DECLARATION_MODIFIERS)
+    return True
+
+def apply_prelude(code: str, entry: Dict[str, Any]) -> Optional[str]:
+    """
+    Remove from ``code`` the declarations the prelude provides, so the snippet
+    can import the prelude instead of elaborating them again. Returns ``None``
+    unless every one of them appears in ``code`` verbatim as a whole
+    declaration starting its own line: only then does the snippet see exactly
+    the declarations it would see as written. Declarations that would not be
+    visible from another module (``private``, ``local``, ``scoped``) also rule
+    the prelude out. Removed declarations are blanked down to their newlines
+    so the remaining lines keep their numbers.
+    """
+    by_name: Dict[Tuple[str, Optional[str]], List[LeanDeclaration]] = {}
+    for decl in scan_declarations(code):
+        by_name.setdefault((decl.kind, decl.name), []).append(decl)
+    spans = []
+    for text in entry["declarations"]:
+        text = text.strip()
+        scanned = scan_declarations(text)
+        if len(scanned) != 1:
+            return None
+        provided = scanned[0]
+        # Attributes and modifiers in front of the keyword must match too;
+        # trailing comments are outside the scanned span on both sides.
+        prefix, body = text[:provided.start], text[provided.start:provided.stop]
+        if any(token.value in MODULE_LOCAL_MODIFIERS for token in iter_tokens(prefix)):
+            return None
+        for decl in by_name.get((provided.kind, provided.name), ()):
+            begin, stop = decl.start - len(prefix), decl.start + len(body)
+            if (
+                begin >= 0
+                and (begin == 0 or code[begin - 1] == "\n")
+                and code.startswith(prefix, begin)
+                and code.startswith(body, decl.start)
+                and _ends_declaration(code, decl, stop)
+            ):
+                spans.append((begin, stop))
+                break
+        else:
+            return None
+    pieces = []
+    last = 0
+    for begin, stop in sorted(set(spans)):
+        pieces.append(code[last:begin])
+        pieces.append("\n" * code.count("\n", begin, stop))
+        last = stop
+    pieces.append(code[last:])
+    return "".join(pieces)
+
+if __name__ == "__main__":
+    from main import construct_jixia_table, preprocess_baseline_data
+    from jixia_lean_utils import preprocess_lean_analysis
+    import subprocess_telemetry
+
+    parser = argparse.ArgumentParser(description="Precompile per-section context prelude modules for verify.py --prelude-dir.")
+    parser.add_argument("--section", action="append", help="Only build these sections (can be repeated).")
+    parser.add_argument("--prelude-dir", type=str, default=PRELUDE_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the module source is unchanged.")
+    parser.add_argument("--subprocess-metrics", type=str, default=None, help="Append wall/CPU time, peak RSS and exit code of every lean call to this JSONL.")
+    args = parser.parse_args()
+    subprocess_telemetry.configure(args.subprocess_metrics)
+
+    mapped, global_symbol_table, global_dependency_table = preprocess_lean_analysis(construct_jixia_table())
+    aggregated = preprocess_baseline_data()
+    manifest = build_preludes(aggregated, mapped, global_symbol_table, global_dependency_table, sections=args.section, prelude_dir=args.prelude_dir, force=args.force)
+    built = sum(1 for entry in manifest.values() if entry["status"] == "ok")
+    print(f"{built}/{len(manifest)} prelude modules available in {args.prelude_dir}")
@@ -1,10 +1,28 @@
 import json
 from typing import Dict, Any
 
-def construct_query_jixia_gpt(query: Dict[str, Any]) -> str:
+# "default" keeps the original prompts. "prefix" puts the static instructions
+# first, then the dependency files, then the theorem-specific tail. Every prompt
+# shares the instruction block; prompts of a section also share the dependency
+# files only when those are the section's whole files ("files" context mode
+# without a token budget), since slices and budgeted packing are per query.
+PROMPT_LAYOUTS = ("default", "prefix")
+
+def construct_query_jixia_gpt(query: Dict[str, Any], layout: str = "default") -> str:
     content = query["content"]
     dependency_set = query["dependency_set"]
     fqn = query["FQN"]
+    if layout == "prefix":
+        return "\n".join([
+            "Please use the lean files below to evaluate the context that follows them.",
+            "The context is a minimal context for a theorem that does not currently compile.",
+            "Please consider the source code and produce a version of the theorem with minimal updates that compiles.",
+            "Do not change the code of the theorem. Do not solve the theorem.",
+            dependency_set,
+            f"Theorem {fqn}:\n" + content
+        ])
+    if layout != "default":
+        raise ValueError(f"Invalid prompt layout: {layout}")
     message = "\n".join([
             dependency_set,
             "Please use the above lean files to evaluate the below context.",
@@ -13,14 +31,24 @@ def construct_query_jixia_gpt(query: Dict[str, Any]) -> str:
             "Do not change the code of the {fqn} theorem. Do not solve the theorem.",
             "Theorem:\n" + content
         ])
-    
+
     return message
 
-def construct_query_gpt(query: Dict[str, Any]) -> str:
+def construct_query_gpt(query: Dict[str, Any], layout: str = "default") -> str:
+    if layout == "prefix":
+        return ("We would like to construct a compilable version of a theorem from the Analysis textbook. "
+        "Please use the following relevant lean files to aggregate the minimum number of statements required to compile the theorem. Please include all necessary imports and properly construct the namespace(s) required for compilation."
+        "Do not change the theorem name and do not solve the theorem. You may include necessary external imports, but do not import sections provided below or others in the textbook.\n"
+        "Please return the compiled theorem in a valid lean code block wrapped in ```lean tags.\n"
+        "The relevant lean files are as follows:\n" + query['dependency_set'] + "\n"
+        f"The theorem is from {query['chapter_name']} and is as follows:\n{query['content']}"
+        )
+    if layout != "default":
+        raise ValueError(f"Invalid prompt layout: {layout}")
     message = (f"We would like to construct a compilable version of a theorem from {query['chapter_name']}. The theorem is as follows:\n{query['content']}\n"
     "Please use the following relevant lean files to aggregate the minimum number of statements required to compile the theorem. Please include all necessary imports and properly construct the namespace(s) required for compilation."
     "Do not change the theorem name and do not solve the theorem. You may include necessary external imports, but do not import sections provided below or others in the textbook.\n"
     "The relevant lean files are as follows:\n" + query['dependency_set'] + "\n"
     "Please return the compiled theorem in a valid lean code block wrapped in ```lean tags."
     )
-    return message
\ No newline at end of file
+    return message
@@ -0,0 +1,101 @@
+import os
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+from globals import ANALYSIS_BOOK_DIRECTORY
+from profiling import count
+
+# Reverse neighbours of these kinds are proofs about the closure rather than
+# anything the closure needs in order to elaborate, so they are not pulled in.
+REVERSE_RING_EXCLUDED_KINDS = ("theorem", "example")
+
+Span = Tuple[str, int, int]
+
+
+@lru_cache(maxsize=None)
+def read_source_bytes(path: str) -> bytes:
+    # jixia ranges are UTF-8 byte offsets, so slice the raw bytes
+    with open(path, "rb") as f:
+        data = f.read()
+    count("files_read")
+    count("bytes_read", len(data))
+    return data
+
+def build_decl_span_index(mapped_lean_analysis_data: dict, book_dir: str = ANALYSIS_BOOK_DIRECTORY) -> Dict[Tuple[str, ...], Span]:
+    """Map every original declaration to (source file, start, stop) using ``ref.range``."""
+    index = {}
+    for section, data in mapped_lean_analysis_data.items():
+        path = os.path.join(book_dir, f"{section}.lean")
+        for name, decl in data["decl"].items():
+            ref = decl["ref"]
+            if not ref["original"] or not ref.get("range"):
+                continue
+            index.setdefault(name, (path, ref["range"]["start"], ref["range"]["stop"]))
+    return index
+
+def build_reverse_reference_index(global_symbol_table: dict) -> Dict[Tuple[str, ...], Set[Tuple[str, ...]]]:
+    """Map each symbol to the symbols whose type or value references it."""
+    reverse = {}
+    for name, entry in global_symbol_table.items():
+        sym = entry.get("sym")
+        if sym is None:
+            continue
+        for key in ("typeReferences", "valueReferences"):
+            for ref in sym.get(key) or []:
+                reverse.setdefault(tuple(ref), set()).add(name)
+    return reverse
+
+def neighbour_ring(closure: Iterable[Tuple[str, ...]], global_symbol_table: dict, reverse_index: Dict[Tuple[str, ...], Set[Tuple[str, ...]]]) -> Set[Tuple[str, ...]]:
+    """
+    One hop around ``closure``: declarations it references directly, plus
+    non-proof declarations (instances, defs, ...) that reference it.
+    """
+    closure = set(closure)
+    ring = set()
+    for name in closure:
+        sym = global_symbol_table.get(name, {}).get("sym")
+        if sym is not None:
+            for key in ("typeReferences", "valueReferences"):
+                ring.update(tuple(ref) for ref in sym.get(key) or [])
+        for referrer in reverse_index.get(name, ()):
+            decl = global_symbol_table.get(referrer, {}).get("decl")
+            if decl is not None and decl["kind"] not in REVERSE_RING_EXCLUDED_KINDS:
+                ring.add(referrer)
+    return {name for name in ring - closure if "decl" in global_symbol_table.get(name, {})}
+
+def _decl_span(name: Tuple[str, ...], global_symbol_table: dict, span_index: Dict[Tuple[str, ...], Span]):
+    # constructors and fields resolve to the span of their parent declaration
+    decl = global_symbol_table[name]["decl"]
+    return span_index.get(tuple(decl["name"]))
+
+def render_dependency_slices(names: Iterable[Tuple[str, ...]], global_symbol_table: dict, span_index: Dict[Tuple[str, ...], Span], dependency_paths: List[str]) -> Tuple[str, List[str]]:
+    """
+    Render the verbatim source spans of ``names``, restricted to files in
+    ``dependency_paths``. Spans are merged and emitted in file order, with
+    files in ``dependency_paths`` order. Returns the text and the files used.
+    """
+    allowed = set(dependency_paths)
+    spans_by_path: Dict[str, Set[Tuple[int, int]]] = {}
+    for name in names:
+        if "decl" not in global_symbol_table.get(name, {}):
+            continue
+        span = _decl_span(name, global_symbol_table, span_index)
+        if span is None or span[0] not in allowed:
+            continue
+        spans_by_path.setdefault(span[0], set()).add((span[1], span[2]))
+
+    chunks = []
+    used_paths = []
+    for path in dependency_paths:
+        if path not in spans_by_path:
+            continue
+        source = read_source_bytes(path)
+        merged: List[List[int]] = []
+        for start, stop in sorted(spans_by_path[path]):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        used_paths.append(path)
+        chunks.append(f"-- {os.path.basename(path)}")
+        chunks.extend(source[start:stop].decode("utf-8", errors="replace") for start, stop in merged)
+    return "\n\n".join(chunks), used_paths
@@ -11,4 +11,8 @@ os.makedirs(JIXIA_WORKING_DIR, exist_ok=True)
 ANALYSIS_BOOK_DIRECTORY = "/Users/alextaylor/Desktop/lean_prover/analysis/analysis/Analysis"
 
 MAX_DEPTH = -1
-COMMENT_PATTERN = r"/\-[\-]?.*?\-\/"
+
+# Lake project used to compile candidates, and the leanprover-community REPL
+# binary (https://github.com/leanprover-community/repl) for warm compile checks.
+LEAN_PROJECT_DIR = "/Users/alextaylor/Desktop/lean_prover/analysis/analysis"
+LEAN_REPL_EXECUTABLE = "/Users/alextaylor/dev/repl/.lake/build/bin/repl"
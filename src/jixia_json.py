@@ -0,0 +1,95 @@
+"""
+Schema-projecting loaders for jixia's ``decl.json`` and ``sym.json``.
+
+jixia writes every declaration with its ``scopeInfo``, ``params``,
+``signature``/``value`` ranges and more, but the pipeline only reads a handful
+of fields. ``load_decls``/``load_syms`` keep just those (see ``DECL_SCHEMA`` and
+``SYM_SCHEMA``). With ijson's C backend installed the array is parsed one
+element at a time and projected as it goes, so the unprojected file is never
+resident; otherwise it falls back to ``json.load`` and projects the result,
+which still drops the unused fields from everything that is kept (and
+pickled) afterwards.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from profiling import count
+from lean_text import strip_comments
+
+try:
+    import ijson
+except ImportError:  # optional; json.load + projection is the fallback
+    ijson = None
+
+# ``True`` keeps a field as is, a dict projects a nested object and a
+# one-element list projects every object of an array.
+DECL_SCHEMA: Dict[str, Any] = {
+    "name": True,
+    "kind": True,
+    # ``range`` (UTF-8 byte offsets into the section file) is used by dependency_slices.
+    "ref": {"pp": True, "original": True, "range": True},
+    "constructors": [{"name": True}],
+    "fields": [{"name": True}],
+}
+SYM_SCHEMA: Dict[str, Any] = {
+    "name": True,
+    "kind": True,
+    # Shown by the agent's lookup_symbol tool.
+    "type": True,
+    "typeReferences": True,
+    "valueReferences": True,
+}
+
+
+def project(obj: Any, schema: Any) -> Any:
+    """Keep only the parts of ``obj`` described by ``schema``; absent keys stay absent."""
+    if schema is True or obj is None:
+        return obj
+    if isinstance(schema, list):
+        return [project(item, schema[0]) for item in obj]
+    return {key: project(obj[key], sub) for key, sub in schema.items() if key in obj}
+
+def streaming_available() -> bool:
+    # The pure-Python ijson backend is several times slower than json.load.
+    return ijson is not None and ijson.backend_name.startswith("yajl2_c")
+
+def load_projected(path: str, schema: Dict[str, Any], streaming: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """
+    Load the JSON array at ``path`` keeping only ``schema``. ``streaming``
+    defaults to using ijson when its C backend is available.
+    """
+    if streaming is None:
+        streaming = streaming_available()
+    with open(path, "rb") as f:
+        count("files_read")
+        count("bytes_read", f.seek(0, 2))
+        f.seek(0)
+        # ijson builds one array element at a time, so only a single
+        # unprojected declaration is alive at any point.
+        objs = ijson.items(f, "item", use_float=True) if streaming else json.load(f)
+        return [project(obj, schema) for obj in objs]
+
+def normalize_decls(decls: List[Dict[str, Any]]) -> None:
+    """
+    Store each declaration's comment-free text under ``"clean_text"``, so
+    it is computed once at load time rather than every time a declaration
+    is rendered.
+    """
+    for decl in decls:
+        pp = decl["ref"].get("pp")
+        decl["clean_text"] = strip_comments(pp).strip() if pp else ""
+
+def clean_decl_text(decl: Dict[str, Any]) -> str:
+    # Tables cached before "clean_text" existed are normalized on the fly.
+    text = decl.get("clean_text")
+    if text is None:
+        pp = decl["ref"].get("pp")
+        text = strip_comments(pp).strip() if pp else ""
+    return text
+
+def load_decls(path: str, streaming: Optional[bool] = None) -> List[Dict[str, Any]]:
+    return load_projected(path, DECL_SCHEMA, streaming)
+
+def load_syms(path: str, streaming: Optional[bool] = None) -> List[Dict[str, Any]]:
+    return load_projected(path, SYM_SCHEMA, streaming)
@@ -1,11 +1,18 @@
 import os
-import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from tqdm import tqdm
 from globals import JIXIA_WORKING_DIR, JIXIA_EXECUTABLE, CACHE_DIR, ANALYSIS_BOOK_DIRECTORY
 from utils import load_json, sort_by_section
+from jixia_json import load_decls, load_syms, normalize_decls
 import pickle
+from subprocess_telemetry import run_command
+from profiling import count
 
-def build_dependency_set(src_module: str, imports: list, g: dict) -> set:
+# Below this many sections starting worker processes costs more than it saves.
+PARALLEL_MIN_SECTIONS = 16
+
+def build_dependency_set(src_module: str, imports: list, g: dict, book_dir: str = ANALYSIS_BOOK_DIRECTORY) -> set:
     deps = {src_module}  # keep self
     for mod in imports:
         if mod[0] in ("Init", "Mathlib"):
@@ -31,7 +38,7 @@ def build_dependency_set(src_module: str, imports: list, g: dict) -> set:
 
     g[src_module] = deps
     
-    dep_file_paths = [os.path.join(ANALYSIS_BOOK_DIRECTORY, f"{dep}.lean") for dep in deps]
+    dep_file_paths = [os.path.join(book_dir, f"{dep}.lean") for dep in deps]
     return dep_file_paths
 
 def process_snippet(question_string: str, section: str, idx: int):
@@ -53,7 +60,7 @@ def process_snippet(question_string: str, section: str, idx: int):
         f.write(wrapper.replace("[QUERY_STRING]", question_string))
 
     # Run jixia
-    proc = subprocess.run(
+    proc = run_command(
         [
             "lake",
             "env",
@@ -63,10 +70,10 @@ def process_snippet(question_string: str, section: str, idx: int):
             os.path.join(section_workspace, f"question_{idx}.decl.json"),
             file_path,
         ],
+        label="jixia_snippet",
         cwd=JIXIA_WORKING_DIR,
-        capture_output=True,
-        text=True,
-        check=False,
+        section=section,
+        index=idx,
     )
 
     if proc.returncode != 0:
@@ -77,10 +84,145 @@ def process_snippet(question_string: str, section: str, idx: int):
 
     return os.path.join(section_workspace, f"question_{idx}.decl.json")
 
-def preprocess_lean_analysis(jixia_table, force_reprocess=False):
-    cache_path_map = os.path.join(CACHE_DIR, "jixia_name_map_cache.pkl")
-    cache_path_table = os.path.join(CACHE_DIR, "global_symbol_table_cache.pkl")
-    cache_path_dependency = os.path.join(CACHE_DIR, "global_dependency_table_cache.pkl")
+def section_import_closure(jixia_table, sections) -> list:
+    """``sections`` plus every textbook section they import, transitively, in section order."""
+    closure = set()
+    pending = [section for section in sections if section in jixia_table]
+    while pending:
+        section = pending.pop()
+        if section in closure:
+            continue
+        closure.add(section)
+        for mod in load_json(jixia_table[section]["mod"])["imports"]:
+            module = ".".join(mod[1:])
+            if mod[0] == "Analysis" and module in jixia_table and module not in closure:
+                pending.append(module)
+    return sort_by_section(closure)
+
+def load_section_tables(section, contents):
+    """
+    Pass 1 work for one section, independent of every other section so it
+    can run in a worker process: the projected decl/sym lists (decls with
+    their ``clean_text``), the imports,
+    and ``decl_keys``, the ``(global table key, index into decl_list)`` pairs
+    its original declarations (and their constructors/fields) define.
+    """
+    decl_list = load_decls(contents["decl"])
+    normalize_decls(decl_list)
+    sym_list = load_syms(contents["sym"])
+    imports = load_json(contents["mod"])["imports"]
+    decl_keys = []
+    for i, decl in enumerate(decl_list):
+        if not decl["ref"]["original"]:
+            continue
+        decl_keys.append((tuple(decl["name"]), i))
+        # Also map constructors/fields to the *parent* decl
+        if decl["kind"] == "inductive":
+            decl_keys.extend((tuple(constructor["name"][1:]), i) for constructor in decl["constructors"])
+        if decl["kind"] == "structure":
+            decl_keys.extend((tuple(field["name"]), i) for field in decl["fields"])
+    return {"section": section, "decl_list": decl_list, "sym_list": sym_list, "imports": imports, "decl_keys": decl_keys}
+
+def _load_section_tables(task):
+    return load_section_tables(*task)
+
+def merge_section_tables(tables, global_symbol_table, owners, conflicts):
+    """
+    Merge one section's tables into ``global_symbol_table``. Later sections
+    win, as in a serial load; ``owners`` remembers which section and
+    declaration set every key so that a name redefined by a different
+    declaration is appended to ``conflicts``. Anonymous ``example``s all
+    share the name ``_example`` and are not reported.
+    """
+    section = tables["section"]
+    decl_list = tables["decl_list"]
+    for key, i in tables["decl_keys"]:
+        owner = (section, i)
+        previous = owners.get(("decl", key))
+        if previous is not None and previous != owner and key[-1] != "_example":
+            conflicts.append({"table": "decl", "name": ".".join(key), "kept": section, "replaced": previous[0]})
+        owners[("decl", key)] = owner
+        global_symbol_table.setdefault(key, {})["decl"] = decl_list[i]
+    for i, sym in enumerate(tables["sym_list"]):
+        key = tuple(sym["name"])
+        previous = owners.get(("sym", key))
+        # A name repeated within one section's sym.json is not a cross-section redefinition.
+        if previous is not None and previous[0] != section and key[-1] != "_example":
+            conflicts.append({"table": "sym", "name": ".".join(key), "kept": section, "replaced": previous[0]})
+        owners[("sym", key)] = (section, i)
+        global_symbol_table.setdefault(key, {})["sym"] = sym
+
+def report_conflicts(conflicts, limit=10):
+    if not conflicts:
+        return
+    print(f"Pass 1: {len(conflicts)} names defined more than once; the later section wins:")
+    for conflict in conflicts[:limit]:
+        print(f"  {conflict['table']} {conflict['name']}: {conflict['kept']} replaces {conflict['replaced']}")
+    if len(conflicts) > limit:
+        print(f"  ... and {len(conflicts) - limit} more")
+
+def load_analysis_sections(jixia_table, sections, book_dir=ANALYSIS_BOOK_DIRECTORY, workers=None):
+    """
+    Run both passes over ``sections`` (in the given order) and return
+    ``(jixia_name_map, global_symbol_table, global_dependency_table)``. The
+    result for a section only depends on sections it imports, so an
+    import-closed subset (see ``section_import_closure``) matches a full load.
+
+    Pass 1 parses sections in ``workers`` processes (default: one per CPU
+    for at least ``PARALLEL_MIN_SECTIONS`` sections; 1 loads in this process)
+    and merges them in section order, so the result does not depend on the
+    number of workers.
+    """
+    jixia_name_map = {}
+    # This is the new unified table.
+    # It will map: Tuple[str, ...] -> {"decl": decl_obj, "sym": sym_obj}
+    global_symbol_table = {}
+    global_dependency_table = {}
+
+    # --- Pass 1: Build the full global_symbol_table ---
+    all_sections_data = {}
+    owners, conflicts = {}, []
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(sections) >= PARALLEL_MIN_SECTIONS else 1
+    workers = min(workers, len(sections))
+    tasks = [(section, jixia_table[section]) for section in sections]
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as ex:
+        if ex is None:
+            loaded = map(_load_section_tables, tasks)
+        else:
+            # Results come back in submission order; only the merge below is sequential.
+            loaded = ex.map(_load_section_tables, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+            for section, contents in tasks:
+                count("files_read", 3)
+                count("bytes_read", sum(os.path.getsize(contents[kind]) for kind in ("decl", "sym", "mod")))
+        for tables in tqdm(loaded, total=len(tasks), desc="Pass 1: Reading data"):
+            section = tables["section"]
+            dependency_set = build_dependency_set(section, tables["imports"], global_dependency_table, book_dir)
+            all_sections_data[section] = {
+                "decl_list": tables["decl_list"],
+                "sym_list": tables["sym_list"],
+                "imports": tables["imports"],
+                "dependency_set": dependency_set
+            }
+            merge_section_tables(tables, global_symbol_table, owners, conflicts)
+    report_conflicts(conflicts)
+
+    # --- Pass 2: Build the per-section jixia_name_map ---
+    print("Pass 2: Building section maps...")
+    for section, data in all_sections_data.items():
+        jixia_name_map[section] = {
+            "decl": {tuple(d["name"]): d for d in data["decl_list"] if "name" in d},
+            "sym": {tuple(s["name"]): s for s in data["sym_list"] if "name" in s},
+            "imports": data["imports"],
+            "dependency_set": data["dependency_set"]
+        }
+
+    return jixia_name_map, global_symbol_table, global_dependency_table
+
+def preprocess_lean_analysis(jixia_table, force_reprocess=False, cache_dir=CACHE_DIR, book_dir=ANALYSIS_BOOK_DIRECTORY, workers=None):
+    cache_path_map = os.path.join(cache_dir, "jixia_name_map_cache.pkl")
+    cache_path_table = os.path.join(cache_dir, "global_symbol_table_cache.pkl")
+    cache_path_dependency = os.path.join(cache_dir, "global_dependency_table_cache.pkl")
     if force_reprocess:
         print("Force reprocessing lean analysis data...")
         if os.path.exists(cache_path_map):
@@ -90,71 +232,13 @@ def preprocess_lean_analysis(jixia_table, force_reprocess=False):
             os.remove(cache_path_table)
             print("Removed cached lean analysis data (table).")
 
-    jixia_name_map = {}
-    # This is the new unified table.
-    # It will map: Tuple[str, ...] -> {"decl": decl_obj, "sym": sym_obj}
-    global_symbol_table = {}
-    global_dependency_table = {}
-    
     print("Preprocessing jixia analysis data...")
     if not os.path.exists(cache_path_map) or not os.path.exists(cache_path_table) or force_reprocess:
         print("No cache found. Preprocessing data...")
         
-        # --- Pass 1: Build the full global_symbol_table ---
-        all_sections_data = {}
-        for section in tqdm(sort_by_section(jixia_table.keys()), desc="Pass 1: Reading data"):
-            contents = jixia_table[section]
-            decl_list = load_json(contents["decl"])
-            sym_list = load_json(contents["sym"])
-            imports = load_json(contents["mod"])["imports"]
-            dependency_set = build_dependency_set(section, imports, global_dependency_table)
-            
-            all_sections_data[section] = {
-                "decl_list": decl_list,
-                "sym_list": sym_list,
-                "imports": imports,
-                "dependency_set": dependency_set
-            }
-            # Add all declarations to the global table
-            for decl in decl_list:
-                if not decl["ref"]["original"]:
-                    continue
-                
-                key = tuple(decl["name"])
-                if key not in global_symbol_table:
-                    global_symbol_table[key] = {}
-                global_symbol_table[key]["decl"] = decl
-                
-                # Also map constructors/fields to the *parent* decl
-                if decl["kind"] == "inductive":
-                    for constructor in decl["constructors"]:
-                        c_key = tuple(constructor["name"][1:])
-                        if c_key not in global_symbol_table:
-                             global_symbol_table[c_key] = {}
-                        global_symbol_table[c_key]["decl"] = decl
-                if decl["kind"] == "structure":
-                    for field in decl["fields"]:
-                        f_key = tuple(field["name"])
-                        if f_key not in global_symbol_table:
-                            global_symbol_table[f_key] = {}
-                        global_symbol_table[f_key]["decl"] = decl
-
-            # Add all symbol data to the global table
-            for sym in sym_list:
-                key = tuple(sym["name"])
-                if key not in global_symbol_table:
-                    global_symbol_table[key] = {}
-                global_symbol_table[key]["sym"] = sym
-
-        # --- Pass 2: Build the per-section jixia_name_map ---
-        print("Pass 2: Building section maps...")
-        for section, data in all_sections_data.items():
-            jixia_name_map[section] = {
-                "decl": {tuple(d["name"]): d for d in data["decl_list"] if "name" in d},
-                "sym": {tuple(s["name"]): s for s in data["sym_list"] if "name" in s},
-                "imports": data["imports"],
-                "dependency_set": data["dependency_set"]
-            }
+        jixia_name_map, global_symbol_table, global_dependency_table = load_analysis_sections(
+            jixia_table, sort_by_section(jixia_table.keys()), book_dir, workers=workers
+        )
 
         print(f"Caching lean analysis data at {cache_path_map}...")
         with open(cache_path_map, "wb") as f:
@@ -0,0 +1,88 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# ``<file>:<line>:<col>: <severity>: <message>`` as printed by ``lean``.
+LEAN_MESSAGE_PATTERN = re.compile(
+    r"^(?P<file>.*?):(?P<line>\d+):(?P<col>\d+): (?P<severity>error|warning|info)(?:\(\w+\))?: ?(?P<message>.*)$"
+)
+# Position-less errors from lake/lean itself, e.g. ``error: unknown package 'Foo'``.
+TOOL_ERROR_PATTERN = re.compile(r"^(?P<severity>error|warning): (?P<message>.*)$")
+
+# First match wins, so more specific patterns come before general ones.
+ERROR_CLASSES: Tuple[Tuple[str, re.Pattern], ...] = tuple(
+    (name, re.compile(pattern, re.IGNORECASE))
+    for name, pattern in (
+        ("sorry", r"declaration uses 'sorry'"),
+        ("unknown_identifier", r"^unknown identifier"),
+        ("unknown_constant", r"^unknown constant"),
+        ("unknown_namespace", r"^unknown namespace"),
+        ("unknown_module", r"unknown module prefix|object file .* does not exist|unknown package|file not found"),
+        ("application_type_mismatch", r"^application type mismatch"),
+        ("type_mismatch", r"^type mismatch"),
+        ("failed_to_synthesize", r"^failed to synthesize"),
+        ("unsolved_goals", r"^unsolved goals"),
+        ("already_declared", r"has already been declared"),
+        ("invalid_field", r"^invalid field"),
+        ("function_expected", r"^function expected"),
+        ("ambiguous", r"^ambiguous"),
+        ("timeout", r"deterministic\) timeout|maximum recursion depth"),
+        ("deprecated", r"has been deprecated"),
+        ("unused_variable", r"^unused variable"),
+        ("parse_error", r"^unexpected |^expected "),
+        ("linter", r"^(the )?linter|note: this linter"),
+    )
+)
+
+
+@dataclass
+class Diagnostic:
+    line: int
+    col: int
+    severity: str
+    message: str
+    end_line: Optional[int] = None
+    end_col: Optional[int] = None
+    file: Optional[str] = None
+    error_class: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.error_class:
+            self.error_class = classify_message(self.message)
+
+
+def classify_message(message: str) -> str:
+    """Coarse error class from the first line of a Lean message."""
+    head = message.strip().split("\n", 1)[0]
+    for name, pattern in ERROR_CLASSES:
+        if pattern.search(head):
+            return name
+    return "other"
+
+
+def parse_lean_output(output: str) -> List[Diagnostic]:
+    """
+    Parse ``lean`` output into one :class:`Diagnostic` per message. Lines that
+    do not start a new message (goals, expected/actual types) are appended to
+    the previous one.
+    """
+    diagnostics: List[Diagnostic] = []
+    for raw in output.splitlines():
+        match = LEAN_MESSAGE_PATTERN.match(raw)
+        if match:
+            diagnostics.append(Diagnostic(
+                line=int(match.group("line")),
+                col=int(match.group("col")),
+                severity=match.group("severity"),
+                message=match.group("message"),
+                file=match.group("file"),
+            ))
+            continue
+        match = TOOL_ERROR_PATTERN.match(raw)
+        if match:
+            diagnostics.append(Diagnostic(line=0, col=0, severity=match.group("severity"), message=match.group("message")))
+        elif diagnostics:
+            diagnostics[-1].message += "\n" + raw
+    for diagnostic in diagnostics:
+        diagnostic.message = diagnostic.message.rstrip()
+    return diagnostics
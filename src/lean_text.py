@@ -0,0 +1,254 @@
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+# Keywords that start a declaration. Modifiers, attributes and doc comments
+# in front of them are left to the previous span.
+DECLARATION_KEYWORDS = frozenset({
+    "theorem", "lemma", "def", "abbrev", "instance", "structure", "class",
+    "inductive", "example", "axiom", "opaque",
+})
+# Other commands that end the declaration before them when they start a line.
+COMMAND_KEYWORDS = frozenset({
+    "namespace", "end", "section", "open", "variable", "universe", "set_option",
+    "attribute", "export", "import", "noncomputable", "private", "protected",
+    "#check", "#eval", "#print", "#reduce", "notation", "infix", "infixl",
+    "infixr", "prefix", "postfix", "macro", "syntax", "macro_rules", "mutual",
+    "local", "scoped",
+})
+
+
+@dataclass
+class Token:
+    kind: str  # "ident", "number", "string", "char" or "symbol"
+    value: str
+    start: int
+    stop: int
+    line_start: bool  # first token on its line
+    column: int
+
+
+@dataclass
+class LeanDeclaration:
+    kind: str
+    name: Optional[str]
+    start: int
+    stop: int
+    name_start: Optional[int] = None
+    name_stop: Optional[int] = None
+
+    @property
+    def short_name(self) -> Optional[str]:
+        return self.name.rsplit(".", 1)[-1] if self.name else None
+
+
+# One alternative per token kind. Every alternative consumes input without
+# backtracking across tokens, so a scan is linear in the text length.
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<newline>\n)
+    |(?P<space>[^\S\n]+)
+    |(?P<line_comment>--[^\n]*)
+    |(?P<block_comment>/-)
+    |(?P<string>"(?:[^"\\]|\\.)*"?)
+    |(?P<char>'(?:\\.|[^\\'\n])')
+    |(?P<ident>(?:[^\W\d]|«[^»]*»)(?:[\w'!?₀-ₜ]|«[^»]*»|\.(?=[^\W\d]|«))*)
+    |(?P<number>\d[\w.]*)
+    |(?P<hash_command>\#[^\W\d][\w'!?]*)
+    |(?P<symbol>:=|@\[|.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+TOKEN_KINDS = {"ident": "ident", "hash_command": "ident", "number": "number", "string": "string", "char": "char", "symbol": "symbol"}
+
+
+def _skip_block_comment(text: str, i: int, n: int) -> int:
+    """Index just past the (nested) block comment opening at ``i``."""
+    depth = 0
+    while i < n:
+        opening = text.find("/-", i, n)
+        closing = text.find("-/", i, n)
+        if closing == -1:
+            return n
+        if opening != -1 and opening < closing:
+            depth += 1
+            i = opening + 2
+        else:
+            depth -= 1
+            i = closing + 2
+            if depth == 0:
+                return i
+    return n
+
+# Only comments and the literals that may contain comment markers.
+COMMENT_SCAN_PATTERN = re.compile(
+    r"""
+    (?P<line_comment>--[^\n]*)
+    |(?P<block_comment>/-)
+    |(?P<string>"(?:[^"\\]|\\.)*"?)
+    |(?<![\w'.])(?P<char>'(?:\\.|[^\\'\n])')
+    """,
+    re.VERBOSE,
+)
+
+
+def _ends_blank_line(pieces: List[str]) -> bool:
+    """Whether the last line of ``"".join(pieces)`` is empty or whitespace."""
+    for piece in reversed(pieces):
+        newline = piece.rfind("\n")
+        if newline != -1:
+            return not piece[newline + 1:].strip()
+        if piece.strip():
+            return False
+    return True
+
+def strip_comments(text: str) -> str:
+    """
+    ``text`` without its ``--`` and (nested) ``/- -/`` comments, doc comments
+    included, in one pass. A comment that ends its line takes the whitespace
+    before it along, and a line left blank is dropped, so commented-out
+    lines leave no gaps.
+    """
+    pieces: List[str] = []
+    search = COMMENT_SCAN_PATTERN.search
+    n = len(text)
+    last = i = 0
+    while True:
+        m = search(text, i)
+        if m is None:
+            break
+        if m.lastgroup in ("string", "char"):
+            i = m.end()
+            continue
+        start = m.start()
+        end = m.end() if m.lastgroup == "line_comment" else _skip_block_comment(text, start, n)
+        before = text[last:start]
+        after = end
+        while after < n and text[after] in " \t":
+            after += 1
+        if after == n or text[after] == "\n":
+            pieces.append(before.rstrip(" \t"))
+            if _ends_blank_line(pieces) and after < n:
+                after += 1
+            last = i = after
+            continue
+        pieces.append(before)
+        # A block comment inside a line separates tokens like whitespace does.
+        if before and not before[-1].isspace() and not text[end].isspace():
+            pieces.append(" ")
+        elif before and before[-1] in " \t":
+            end = after
+        last = i = end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+def iter_tokens(text: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Token]:
+    """
+    Single pass over ``text[start:stop]`` yielding tokens. Comments (``--``
+    and nested ``/- -/``) are skipped; strings and char literals are single
+    tokens, so keywords inside them are never seen.
+    """
+    n = len(text) if stop is None else stop
+    i = start
+    line_start = True
+    line_begin = text.rfind("\n", 0, start) + 1
+    match = TOKEN_PATTERN.match
+    while i < n:
+        m = match(text, i, n)
+        group = m.lastgroup
+        if group == "newline":
+            i = m.end()
+            line_start = True
+            line_begin = i
+        elif group == "space" or group == "line_comment":
+            i = m.end()
+        elif group == "block_comment":
+            end = _skip_block_comment(text, i, n)
+            newline = text.rfind("\n", i, end)
+            if newline != -1:
+                line_start = True
+                line_begin = newline + 1
+            i = end
+        else:
+            yield Token(TOKEN_KINDS[group], m.group(), i, m.end(), line_start, i - line_begin)
+            line_start = False
+            i = m.end()
+
+IDENT = r"(?:[^\W\d]|«[^»]*»)(?:[\w'!?₀-ₜ]|«[^»]*»|\.(?=[^\W\d]|«))*"
+# Only what matters for declaration boundaries; ``search`` skips the rest in C.
+BOUNDARY_PATTERN = re.compile(
+    r"""
+    (?P<line_comment>--[^\n]*)
+    |(?P<block_comment>/-)
+    |(?P<string>"(?:[^"\\]|\\.)*"?)
+    |(?<![\w'.])(?P<char>'(?:\\.|[^\\'\n])')
+    |^[ \t]*(?P<command>%s)(?![\w'!?.])
+    |(?<![\w'.!?])(?P<decl>%s)(?![\w'!?.])(?:\s+(?P<name>%s))?
+    """
+    % ("|".join(sorted(COMMAND_KEYWORDS, key=len, reverse=True)).replace("#", "\\#"),
+       "|".join(sorted(DECLARATION_KEYWORDS, key=len, reverse=True)),
+       IDENT),
+    re.VERBOSE | re.MULTILINE,
+)
+
+
+def scan_declarations(text: str) -> List[LeanDeclaration]:
+    """
+    Split ``text`` into declarations in one O(n) pass. A declaration runs from
+    its keyword to the end of its last code (not comment) before the next
+    declaration keyword, or before the next command that starts a line.
+    Keywords in attribute lists (``attribute [instance]``) do not count.
+    """
+    declarations: List[LeanDeclaration] = []
+    comments: List[Tuple[int, int]] = []
+    current: Optional[LeanDeclaration] = None
+    search = BOUNDARY_PATTERN.search
+    n = len(text)
+
+    def close(at: int) -> None:
+        # Trim trailing whitespace and comments (e.g. the next doc comment).
+        while True:
+            while at > current.start and text[at - 1].isspace():
+                at -= 1
+            while comments and comments[-1][1] > at:
+                comments.pop()
+            if comments and comments[-1][1] == at and comments[-1][0] > current.start:
+                at = comments.pop()[0]
+                continue
+            break
+        current.stop = at
+        declarations.append(current)
+
+    i = 0
+    while True:
+        m = search(text, i)
+        if m is None:
+            break
+        group = m.lastgroup if m.lastgroup != "name" else "decl"
+        if group == "block_comment":
+            end = _skip_block_comment(text, m.start(), n)
+            comments.append((m.start(), end))
+            i = end
+            continue
+        if group == "line_comment":
+            comments.append((m.start(), m.end()))
+        elif group == "command":
+            if current is not None:
+                close(m.start("command"))
+                current = None
+        elif group == "decl":
+            start = m.start("decl")
+            j = start - 1
+            while j >= 0 and text[j] in " \t\n":
+                j -= 1
+            if j < 0 or text[j] not in "[,":
+                if current is not None:
+                    close(start)
+                kind = m.group("decl")
+                current = LeanDeclaration(kind, None, start, n)
+                if m.group("name") and kind != "example":
+                    current.name, current.name_start, current.name_stop = m.group("name"), m.start("name"), m.end("name")
+        i = max(m.end(), i + 1)
+    if current is not None:
+        close(n)
+    return declarations
@@ -6,8 +6,11 @@ import json
 from utils import load_json, load_jsonl, filter_baseline, make_dir
 from jixia_lean_utils import process_snippet, preprocess_lean_analysis
 from build_jixia_context import build_jixia_context
-from build_gpt_context import build_gpt_context
+from build_gpt_context import build_baseline_context, build_gpt_context
 from construct_queries import construct_query_jixia_gpt, construct_query_gpt
+from prompt_budget import count_tokens
+import profiling
+import subprocess_telemetry
 
 def preprocess_baseline_data(force_reprocess: bool = False):
     if force_reprocess:
@@ -52,34 +55,68 @@ def construct_jixia_table():
             }
     return jixia_table
 
-def main(method: str, output_name: str):
+def main(method: str, output_name: str, token_budget: int | None = None, context_mode: str = "files", prompt_layout: str = "default", workers: int | None = None):
     output_path = os.path.join(OUTPUT_DIR, output_name)
-    jixia_table = construct_jixia_table()
-    mapped_lean_analysis_data, global_symbol_table, global_dependency_table = preprocess_lean_analysis(jixia_table, force_reprocess=False)
-    aggregated_baseline_data = preprocess_baseline_data(force_reprocess=False)
+    if prompt_layout == "prefix" and (context_mode == "slices" or token_budget is not None):
+        print("Warning: --prompt_layout prefix with --context_mode slices or --token_budget gives every query its own dependency files; prompts only share the instruction block.")
+    with profiling.span("construct_jixia_table", stage=True):
+        jixia_table = construct_jixia_table()
+    with profiling.span("preprocess_lean_analysis", stage=True):
+        mapped_lean_analysis_data, global_symbol_table, global_dependency_table = preprocess_lean_analysis(jixia_table, force_reprocess=False, workers=workers)
+    with profiling.span("preprocess_baseline_data", stage=True):
+        aggregated_baseline_data = preprocess_baseline_data(force_reprocess=False)
 
-    if method == "jixia_gpt":
-        print("global_dependency_table", global_dependency_table)
-        processed_data = build_jixia_context(aggregated_baseline_data, mapped_lean_analysis_data, global_symbol_table, global_dependency_table)
+    with profiling.span(f"build_context:{method}", stage=True):
+        if method == "jixia_gpt":
+            print("global_dependency_table", global_dependency_table)
+            processed_data = build_jixia_context(aggregated_baseline_data, mapped_lean_analysis_data, global_symbol_table, global_dependency_table, token_budget=token_budget, context_mode=context_mode)
+        elif method == "gpt":
+            processed_data = build_gpt_context(aggregated_baseline_data, mapped_lean_analysis_data, token_budget=token_budget)
+        elif method == "baseline":
+            # Whole import closure, same prompt as "gpt"; see baseline_approach/api_build_context.py.
+            processed_data = build_baseline_context(aggregated_baseline_data, mapped_lean_analysis_data, token_budget=token_budget)
+        else:
+            raise ValueError(f"Invalid method: {method}")
+
+    with profiling.span("construct_queries", stage=True):
+        construct_query = construct_query_jixia_gpt if method == "jixia_gpt" else construct_query_gpt
         for query in processed_data:
-            query["query"] = construct_query_jixia_gpt(query)
-    elif method == "gpt":
-        processed_data = build_gpt_context(aggregated_baseline_data, mapped_lean_analysis_data)
+            query["query"] = construct_query(query, layout=prompt_layout)
+
+    with profiling.span("count_tokens", stage=True):
         for query in processed_data:
-            query["query"] = construct_query_gpt(query)
-    else:
-        raise ValueError(f"Invalid method: {method}")
+            query["prompt_tokens"] = count_tokens(query["query"])
+    if processed_data:
+        prompt_tokens = [query["prompt_tokens"] for query in processed_data]
+        dropped = sum(1 for query in processed_data if query["dropped_dependency_files"])
+        print(f"Prompt tokens: total {sum(prompt_tokens)}, max {max(prompt_tokens)}, mean {sum(prompt_tokens) / len(prompt_tokens):.0f}")
+        print(f"Queries with dependency files dropped by the token budget: {dropped}/{len(processed_data)}")
     
-    with open(os.path.join(output_path, f"processed_data_{method}.jsonl"), "w") as f:
-        for query in processed_data:
-            f.write(json.dumps(query) + "\n")
+    with profiling.span("write_jsonl", stage=True):
+        with open(os.path.join(output_path, f"processed_data_{method}.jsonl"), "w") as f:
+            for query in processed_data:
+                f.write(json.dumps(query) + "\n")
     
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--method", type=str, required=True)
+    parser.add_argument("--method", type=str, required=True, choices=["jixia_gpt", "gpt", "baseline"])
     parser.add_argument("--output_name", type=str, required=True)
+    parser.add_argument("--token_budget", type=int, default=None, help="Maximum tokens of dependency files packed into each prompt.")
+    parser.add_argument("--context_mode", type=str, default="files", choices=["files", "slices"], help="jixia_gpt only: embed whole dependency files or only the closure's source spans.")
+    parser.add_argument("--prompt_layout", type=str, default="default", choices=["default", "prefix"], help="'prefix' puts section-level content first so prompts share a cacheable prefix.")
+    parser.add_argument("--profile", type=str, nargs="?", const="", default=None, help="Record stage spans, counters and per-stage profiles into this directory (default: <output>/profile) and write a Chrome trace.")
+    parser.add_argument("--profiler", type=str, default="cprofile", choices=list(profiling.PROFILERS), help="Per-stage profiler used with --profile.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to parse the jixia data on a cold cache (default: one per CPU, 1 = serial).")
+    parser.add_argument("--subprocess_metrics", type=str, default=None, help="Append wall/CPU time, peak RSS and exit code of every jixia call to this JSONL.")
+    parser.add_argument("--jixia_timeout", type=float, default=None, help="Kill a jixia snippet run after this many seconds.")
     args = parser.parse_args()
+    subprocess_telemetry.configure(args.subprocess_metrics, timeout=args.jixia_timeout)
     method = args.method
     output_name = args.output_name
-    main(method, output_name)
\ No newline at end of file
+    if args.profile is not None:
+        profiling.enable(args.profile or os.path.join(OUTPUT_DIR, output_name, "profile"), args.profiler)
+    try:
+        main(method, output_name, token_budget=args.token_budget, context_mode=args.context_mode, prompt_layout=args.prompt_layout, workers=args.workers)
+    finally:
+        profiling.finish()
@@ -0,0 +1,176 @@
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import pyinstrument
+except ImportError:  # only needed for --profiler pyinstrument
+    pyinstrument = None
+
+PROFILERS = ("cprofile", "pyinstrument", "none")
+
+
+class Profiler:
+    """
+    Spans, counters and optional per-stage profiles for one run.
+
+    Spans become complete ("X") events of a Chrome trace (chrome://tracing or
+    https://ui.perfetto.dev), with the counters sampled at the end of every
+    stage. Stages (``span(..., stage=True)``) can also be profiled with
+    cProfile or pyinstrument; only the outermost stage per thread is profiled,
+    since profilers do not nest.
+    """
+
+    def __init__(self, output_dir: Optional[str] = None, profiler: str = "cprofile"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Invalid profiler: {profiler}")
+        if profiler == "pyinstrument" and pyinstrument is None:
+            raise RuntimeError("--profiler pyinstrument needs the pyinstrument package")
+        self.enabled = output_dir is not None
+        self.output_dir = output_dir
+        self.profiler = profiler
+        self.events: List[Dict[str, Any]] = []
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = 0
+        self.pid = os.getpid()
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def add_event(self, name: str, started_at: float, finished_at: float, tid: Optional[int] = None, **args: Any) -> None:
+        """Record a span measured elsewhere (e.g. in a worker process) from ``time.time()`` stamps."""
+        if not self.enabled:
+            return
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": started_at * 1e6,
+            "dur": (finished_at - started_at) * 1e6,
+            "pid": self.pid,
+            "tid": tid if tid is not None else threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, stage: bool = False, **args: Any) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        profile = self._start_profile() if stage and self.profiler != "none" else None
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                self._stop_profile(profile, name)
+            self.add_event(name, started_at, started_at + elapsed, **args)
+            if stage:
+                with self._lock:
+                    self.events.append({
+                        "name": "counters",
+                        "ph": "C",
+                        "ts": (started_at + elapsed) * 1e6,
+                        "pid": self.pid,
+                        "args": dict(self.counters),
+                    })
+
+    def _start_profile(self):
+        if getattr(self._local, "profiling", False):
+            return None
+        self._local.profiling = True
+        if self.profiler == "pyinstrument":
+            profile = pyinstrument.Profiler()
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        return profile
+
+    def _stop_profile(self, profile, name: str) -> None:
+        self._local.profiling = False
+        with self._lock:
+            self._stages += 1
+            index = self._stages
+        stem = os.path.join(self.output_dir, f"{index:02d}_{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}")
+        if self.profiler == "pyinstrument":
+            profile.stop()
+            with open(stem + ".html", "w") as f:
+                f.write(profile.output_html())
+        else:
+            profile.disable()
+            profile.dump_stats(stem + ".prof")
+
+    def span_totals(self) -> Dict[str, Dict[str, float]]:
+        totals: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            if event["ph"] != "X":
+                continue
+            entry = totals.setdefault(event["name"], {"count": 0, "total_s": 0.0})
+            entry["count"] += 1
+            entry["total_s"] += event["dur"] / 1e6
+        return totals
+
+    def write_trace(self, path: Optional[str] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = path or os.path.join(self.output_dir, "trace.json")
+        with open(path, "w") as f:
+            json.dump({
+                "traceEvents": self.events,
+                "displayTimeUnit": "ms",
+                "otherData": {"counters": dict(self.counters), "spans": self.span_totals()},
+            }, f)
+        return path
+
+    def print_summary(self) -> None:
+        if not self.enabled:
+            return
+        print("\n--- Profile ---")
+        for name, entry in sorted(self.span_totals().items(), key=lambda item: -item[1]["total_s"]):
+            print(f"{name:<36}{entry['count']:>8}{entry['total_s']:>12.3f}s")
+        for name, value in sorted(self.counters.items()):
+            print(f"{name:<36}{value:>20}")
+
+    def finish(self) -> None:
+        """Write the trace and print a summary; a no-op when profiling is off."""
+        path = self.write_trace()
+        if path:
+            self.print_summary()
+            print(f"Chrome trace written to {path}")
+
+
+# Process-wide profiler; disabled (every hook a no-op) until ``enable`` is called.
+PROFILER = Profiler()
+
+def enable(output_dir: str, profiler: str = "cprofile") -> Profiler:
+    global PROFILER
+    PROFILER = Profiler(output_dir, profiler)
+    return PROFILER
+
+def span(name: str, stage: bool = False, **args: Any):
+    return PROFILER.span(name, stage=stage, **args)
+
+def count(name: str, n: int = 1) -> None:
+    PROFILER.count(name, n)
+
+def add_event(name: str, started_at: float, finished_at: float, tid: Optional[int] = None, **args: Any) -> None:
+    PROFILER.add_event(name, started_at, finished_at, tid=tid, **args)
+
+def finish() -> None:
+    PROFILER.finish()
@@ -0,0 +1,119 @@
+import os
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from profiling import count
+
+try:
+    import tiktoken
+except ImportError:  # tokenizer is optional, fall back to the char heuristic
+    tiktoken = None
+
+TOKENIZER_ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        # e.g. the encoding file cannot be fetched on an offline machine
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+@lru_cache(maxsize=None)
+def read_dependency_file(path: str) -> str:
+    with open(path, "r") as f:
+        text = f.read()
+    count("files_read")
+    count("bytes_read", len(text.encode("utf-8")))
+    return text
+
+@lru_cache(maxsize=None)
+def dependency_file_tokens(path: str) -> int:
+    return count_tokens(read_dependency_file(path))
+
+def _module_sort_key(path: str):
+    module = os.path.splitext(os.path.basename(path))[0]
+    parts = module.split("_")
+    if module.startswith("Section_") and len(parts) >= 3 and parts[1].isdigit():
+        return (1, int(parts[1]), "_".join(parts[2:]), path)
+    return (0, 0, "", path)
+
+def canonical_dependency_order(dependency_paths: Iterable[str]) -> List[str]:
+    """Deterministic order (non-section tools first, then sections by chapter) so prompts for a section share a prefix."""
+    return sorted(dependency_paths, key=_module_sort_key)
+
+def build_symbol_section_index(mapped_lean_analysis_data: dict) -> Dict[Tuple[str, ...], str]:
+    """Map every declared name to the section that declares it."""
+    index = {}
+    for section, data in mapped_lean_analysis_data.items():
+        for name in data["decl"]:
+            index.setdefault(name, section)
+    return index
+
+def query_references(section_data: dict, query_name: Tuple[str, ...]) -> List[Tuple[str, ...]]:
+    syms = section_data["sym"].get(query_name)
+    if syms is None:
+        return []
+    refs = []
+    for key in ("typeReferences", "valueReferences"):
+        if syms.get(key) is not None:
+            refs.extend(tuple(r) for r in syms[key])
+    return refs
+
+def rank_dependency_files(dependency_paths: Iterable[str], section: str, referenced_names: Iterable[Tuple[str, ...]], symbol_section_index: Dict[Tuple[str, ...], str]) -> List[str]:
+    """
+    Order dependency files by relevance: the query's own section first, then
+    sections declaring the most symbols referenced by the query, then the rest.
+    """
+    hits = Counter(symbol_section_index[name] for name in referenced_names if name in symbol_section_index)
+
+    def relevance(path: str):
+        module = os.path.splitext(os.path.basename(path))[0]
+        return (module != section, -hits.get(module, 0), path)
+
+    return sorted(dependency_paths, key=relevance)
+
+def pack_dependency_set(dependency_paths: List[str], ranked_paths: List[str], token_budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Greedily keep whole dependency files in ``ranked_paths`` order while they fit
+    in ``token_budget`` (no budget keeps everything). Files are never cut mid-way;
+    kept files are emitted in ``dependency_paths`` order.
+    """
+    kept = set()
+    used = 0
+    for path in ranked_paths:
+        tokens = dependency_file_tokens(path)
+        if token_budget is not None and used + tokens > token_budget:
+            continue
+        kept.add(path)
+        used += tokens
+
+    included = [path for path in dependency_paths if path in kept]
+    return {
+        "dependency_set": "\n".join(read_dependency_file(path) for path in included),
+        "dependency_tokens": used,
+        "dependency_files": included,
+        "dropped_dependency_files": [path for path in ranked_paths if path not in kept],
+    }
+
+def pack_section_dependencies(section: str, query_name: Tuple[str, ...], mapped_lean_analysis_data: dict, symbol_section_index: Dict[Tuple[str, ...], str], token_budget: Optional[int] = None) -> Dict[str, Any]:
+    section_data = mapped_lean_analysis_data[section]
+    dependency_paths = canonical_dependency_order(section_data["dependency_set"])
+    ranked_paths = rank_dependency_files(
+        dependency_paths,
+        section,
+        query_references(section_data, query_name),
+        symbol_section_index,
+    )
+    return pack_dependency_set(dependency_paths, ranked_paths, token_budget)
@@ -0,0 +1,147 @@
+import argparse
+import sqlite3
+import time
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from lean_diagnostics import Diagnostic
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    source TEXT,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    returncode INTEGER,
+    src_text TEXT,
+    stdout TEXT,
+    stderr TEXT,
+    PRIMARY KEY (run_id, idx)
+);
+CREATE TABLE IF NOT EXISTS diagnostics (
+    run_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    file TEXT,
+    line INTEGER,
+    col INTEGER,
+    severity TEXT,
+    error_class TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS diagnostics_by_result ON diagnostics (run_id, idx);
+CREATE INDEX IF NOT EXISTS diagnostics_by_class ON diagnostics (error_class, severity, run_id);
+CREATE INDEX IF NOT EXISTS results_by_status ON results (run_id, status);
+"""
+
+
+class ResultsStore:
+    """
+    SQLite store for ``verify.py`` results. Full compiler output is kept per
+    snippet and every Lean message is a row in ``diagnostics``, indexed by
+    snippet and by error class, so failures can be compared across runs with
+    plain SQL.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def start_run(self, run_id: str, source: str = "", replace: bool = True) -> None:
+        """Register ``run_id``. With ``replace`` any results it already has are dropped; otherwise they are kept for resuming."""
+        with self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM diagnostics WHERE run_id = ?", (run_id,))
+                self.conn.execute("DELETE FROM results WHERE run_id = ?", (run_id,))
+            self.conn.execute(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO runs (run_id, source, created_at) VALUES (?, ?, ?)",
+                (run_id, source, time.time()),
+            )
+
+    def completed_indices(self, run_id: str) -> Set[int]:
+        return {idx for (idx,) in self.conn.execute("SELECT idx FROM results WHERE run_id = ?", (run_id,))}
+
+    def add_result(self, run_id: str, result: Dict[str, Any], diagnostics: Iterable[Diagnostic]) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM diagnostics WHERE run_id = ? AND idx = ?", (run_id, result["index"]))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (run_id, idx, status, returncode, src_text, stdout, stderr) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    result["index"],
+                    result["status"],
+                    result.get("returncode"),
+                    result.get("src_text"),
+                    result.get("stdout"),
+                    result.get("stderr"),
+                ),
+            )
+            self.conn.executemany(
+                "INSERT INTO diagnostics (run_id, idx, file, line, col, severity, error_class, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (run_id, result["index"], d.file, d.line, d.col, d.severity, d.error_class, d.message)
+                    for d in diagnostics
+                ],
+            )
+
+    def diagnostics_for(self, run_id: str, idx: int) -> List[Diagnostic]:
+        rows = self.conn.execute(
+            "SELECT line, col, severity, message, file, error_class FROM diagnostics WHERE run_id = ? AND idx = ? ORDER BY line, col",
+            (run_id, idx),
+        )
+        return [
+            Diagnostic(line=line, col=col, severity=severity, message=message, file=file, error_class=error_class)
+            for line, col, severity, message, file, error_class in rows
+        ]
+
+    def error_class_counts(self, run_ids: Optional[List[str]] = None, severity: str = "error") -> Dict[str, Dict[str, int]]:
+        """``{error_class: {run_id: snippets with that class}}`` for the given runs (default: all)."""
+        query = "SELECT error_class, run_id, COUNT(DISTINCT idx) FROM diagnostics WHERE severity = ?"
+        params: List[Any] = [severity]
+        if run_ids:
+            query += f" AND run_id IN ({', '.join('?' for _ in run_ids)})"
+            params.extend(run_ids)
+        query += " GROUP BY error_class, run_id"
+        counts: Dict[str, Dict[str, int]] = {}
+        for error_class, run_id, count in self.conn.execute(query, params):
+            counts.setdefault(error_class, {})[run_id] = count
+        return counts
+
+    def run_summaries(self) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT r.run_id, r.source, COUNT(s.idx), SUM(s.status = 'ok') FROM runs r LEFT JOIN results s ON s.run_id = r.run_id GROUP BY r.run_id ORDER BY r.created_at"
+        )
+        return [
+            {"run_id": run_id, "source": source, "total": total, "ok": ok or 0}
+            for run_id, source, total, ok in rows
+        ]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def diagnostic_dicts(diagnostics: Iterable[Diagnostic]) -> List[Dict[str, Any]]:
+    return [asdict(d) for d in diagnostics]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize verification runs stored by verify.py --db.")
+    parser.add_argument("db", type=str)
+    parser.add_argument("--run", action="append", help="Restrict to these run ids (can be repeated).")
+    parser.add_argument("--severity", type=str, default="error")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    summaries = [s for s in store.run_summaries() if not args.run or s["run_id"] in args.run]
+    run_ids = [s["run_id"] for s in summaries]
+    for summary in summaries:
+        print(f"{summary['run_id']}: {summary['ok']}/{summary['total']} ok ({summary['source']})")
+    counts = store.error_class_counts(run_ids, severity=args.severity)
+    print(f"\n{'error_class':<28}" + "".join(f"{run_id:>16}" for run_id in run_ids))
+    for error_class, by_run in sorted(counts.items(), key=lambda item: -sum(item[1].values())):
+        print(f"{error_class:<28}" + "".join(f"{by_run.get(run_id, 0):>16}" for run_id in run_ids))
+    store.close()
@@ -1,14 +1,30 @@
 import os
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from openai import OpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+import itertools
+import random
+from types import SimpleNamespace
 from dotenv import load_dotenv
 import argparse
 from utils import load_jsonl, load_json
+from api_telemetry import estimate_cost, summarize_stream_log, print_summary
 load_dotenv()
+
+MODEL = "gpt-5"
+REASONING_EFFORT = "high"
+SYSTEM_PROMPT = "Please format your final response as a valid lean code block wrapped in ```lean tags."
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+MAX_RETRIES = 2
+RETRY_BACKOFF_S = 5.0
+# Transient failures worth retrying; anything else (bad request, context
+# length, auth) fails the same way again, so it is reported at once.
+RETRIABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
     
 def load_data(file_path: str) -> List[Dict[str, Any]]:
     if file_path.endswith(".jsonl"):
@@ -28,27 +44,69 @@ def extract_code_block(content: str) -> str:
     except Exception:
         return content.strip()
     
-def run_api_call(api_call: str, client: Any) -> str:
-    try:
-        
-        completion = client.chat.completions.create(
-            model="gpt-5",
-            messages=[
-                {"role": "system", "content": "Please format your final response as a valid lean code block wrapped in ```lean tags."},
-                {"role": "user", "content": api_call},
-            ],
-            reasoning_effort="high",
-        )
-        if completion.choices and completion.choices[0].message:
-            content = completion.choices[0].message.content or ""
-            return content.strip()
-        return ""
-    except Exception as e:
-        print("ERROR: " + str(e))
-        return f"API_ERROR: {e}"
-
-def process_single_query(index: int, query: Dict[str, Any], client: Any) -> Dict[str, Any]:
-    result = run_api_call(query["query"], client)
+def build_chat_request(api_call: str) -> Dict[str, Any]:
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": api_call},
+        ],
+        "reasoning_effort": REASONING_EFFORT,
+    }
+
+def summarize_usage(usage: Any) -> Dict[str, Any]:
+    """Flatten a ``usage`` payload (SDK object or batch JSON) into the fields we log."""
+    if usage is None:
+        return {}
+    if hasattr(usage, "model_dump"):
+        usage = usage.model_dump()
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    completion_details = usage.get("completion_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "cached_tokens": prompt_details.get("cached_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens"),
+        "reasoning_tokens": completion_details.get("reasoning_tokens") or 0,
+        "total_tokens": usage.get("total_tokens"),
+    }
+
+def run_api_call(api_call: str, client: Any, max_retries: int = MAX_RETRIES) -> Tuple[str, Dict[str, Any], int]:
+    """Returns the response text, its usage, and how many retries it took."""
+    retries = 0
+    while True:
+        try:
+            
+            completion = client.chat.completions.create(**build_chat_request(api_call))
+            usage = summarize_usage(getattr(completion, "usage", None))
+            if completion.choices and completion.choices[0].message:
+                content = completion.choices[0].message.content or ""
+                return content.strip(), usage, retries
+            return "", usage, retries
+        except RETRIABLE_ERRORS as e:
+            if retries >= max_retries:
+                print("ERROR: " + str(e))
+                return f"API_ERROR: {e}", {}, retries
+            retries += 1
+            time.sleep(RETRY_BACKOFF_S * 2 ** (retries - 1))
+        except Exception as e:
+            print("ERROR: " + str(e))
+            return f"API_ERROR: {e}", {}, retries
+
+def process_single_query(index: int, query: Dict[str, Any], client: Any, submitted_at: Optional[float] = None) -> Dict[str, Any]:
+    started_at = time.time()
+    result, usage, retries = run_api_call(query["query"], client)
+    finished_at = time.time()
+    telemetry = {
+        "queue_wait_s": started_at - submitted_at if submitted_at is not None else None,
+        "latency_s": finished_at - started_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "retries": retries,
+        "cost_usd": estimate_cost(usage, MODEL),
+    }
+    return build_result_entry(index, query, result, usage, telemetry)
+
+def build_result_entry(index: int, query: Dict[str, Any], result: str, usage: Optional[Dict[str, Any]] = None, telemetry: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     cleaned_result = extract_code_block(result)
     updated_entry = {
         "chapter_name": query["chapter_name"],
@@ -58,12 +116,16 @@ def process_single_query(index: int, query: Dict[str, Any], client: Any) -> Dict
     log_entry = {
         "query": {**query, "content": cleaned_result},
         "result": result,
+        "usage": usage or {},
+        "telemetry": telemetry or {},
     }
     return {"index": index, "updated_entry": updated_entry, "log_entry": log_entry}
 
 def main(data: List[Dict[str, Any]], output_dir: str, name: str):
     max_workers = 75
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=1000)
+    # Retries are handled (and counted) by run_api_call rather than the SDK.
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=1000, max_retries=0)
+    run_id = f"{name}-{int(time.time())}"
     results_by_index: Dict[int, Dict[str, Any]] = {}
     updated_by_index: Dict[int, Dict[str, Any]] = {}
 
@@ -74,7 +136,7 @@ def main(data: List[Dict[str, Any]], output_dir: str, name: str):
          open(stream_log_path, "a") as stream_log_f, \
          open(stream_cleaned_path, "a") as stream_cleaned_f:
         futures = {
-            executor.submit(process_single_query, i, q, client): i
+            executor.submit(process_single_query, i, q, client, time.time()): i
             for i, q in enumerate(data)
         }
         for future in tqdm(as_completed(futures), total=len(futures)):
@@ -83,33 +145,52 @@ def main(data: List[Dict[str, Any]], output_dir: str, name: str):
                 res = future.result()
                 updated_by_index[idx] = res["updated_entry"]
                 results_by_index[idx] = res["log_entry"]
-                # Stream full log line
-                stream_log_f.write(json.dumps({
-                    "timestamp": time.time(),
-                    "index": idx,
-                    "status": "updated",
-                    "FQN": res["updated_entry"]["FQN"],
-                    "chapter_name": res["updated_entry"]["chapter_name"],
-                    "result": res["log_entry"]["result"],
-                }) + "\n")
-                stream_log_f.flush()
-                # Stream cleaned content line
-                stream_cleaned_f.write(json.dumps({
-                    "timestamp": time.time(),
-                    "index": idx,
-                    **res["updated_entry"],
-                }) + "\n")
-                stream_cleaned_f.flush()
+                write_stream_entries(res, stream_log_f, stream_cleaned_f, run_id)
             except Exception as e:
                 results_by_index[idx] = {"error": f"PROCESSING_ERROR: {e}"}
                 stream_log_f.write(json.dumps({
                     "timestamp": time.time(),
+                    "run_id": run_id,
                     "index": idx,
                     "status": "error",
                     "error": str(e),
                 }) + "\n")
                 stream_log_f.flush()
 
+    write_outputs(output_dir, name, updated_by_index, results_by_index)
+    write_telemetry_summary(output_dir, name, stream_log_path, run_id)
+    return updated_by_index
+
+def write_telemetry_summary(output_dir: str, name: str, stream_log_path: str, run_id: str) -> None:
+    summary = summarize_stream_log(stream_log_path, run_id=run_id)
+    with open(os.path.join(output_dir, f"{name}_telemetry_summary.json"), "w") as f:
+        json.dump(summary, f, indent=4)
+    print_summary(summary)
+
+def write_stream_entries(res: Dict[str, Any], stream_log_f, stream_cleaned_f, run_id: str) -> None:
+    idx = res["index"]
+    # Stream full log line
+    stream_log_f.write(json.dumps({
+        "timestamp": time.time(),
+        "run_id": run_id,
+        "index": idx,
+        "status": "updated",
+        "FQN": res["updated_entry"]["FQN"],
+        "chapter_name": res["updated_entry"]["chapter_name"],
+        "result": res["log_entry"]["result"],
+        "usage": res["log_entry"]["usage"],
+        "telemetry": res["log_entry"]["telemetry"],
+    }) + "\n")
+    stream_log_f.flush()
+    # Stream cleaned content line
+    stream_cleaned_f.write(json.dumps({
+        "timestamp": time.time(),
+        "index": idx,
+        **res["updated_entry"],
+    }) + "\n")
+    stream_cleaned_f.flush()
+
+def write_outputs(output_dir: str, name: str, updated_by_index: Dict[int, Dict[str, Any]], results_by_index: Dict[int, Dict[str, Any]]) -> None:
     # Preserve input order in outputs
     ordered_indices = sorted(updated_by_index.keys())
     updated_data = [updated_by_index[i] for i in ordered_indices]
@@ -125,6 +206,225 @@ def main(data: List[Dict[str, Any]], output_dir: str, name: str):
         for example in updated_data:
             f.write(example["chapter_name"] + ": " + example["FQN"] + "\n\n" + example["content"] + "\n\n")
             f.write("-----------------------------------\n\n")
+
+def write_batch_requests(data: List[Dict[str, Any]], requests_path: str) -> Dict[str, int]:
+    """Write one chat-completion request per query and return the custom_id -> index map."""
+    custom_ids: Dict[str, int] = {}
+    with open(requests_path, "w") as f:
+        for i, query in enumerate(data):
+            custom_id = f"query-{i}"
+            custom_ids[custom_id] = i
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": build_chat_request(query["query"]),
+            }) + "\n")
+    return custom_ids
+
+def submit_batch(requests_path: str, client: Any) -> Any:
+    with open(requests_path, "rb") as f:
+        batch_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+
+def poll_batch(batch_id: str, client: Any, poll_interval: float = 30.0) -> Any:
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in BATCH_TERMINAL_STATUSES:
+            return batch
+        print(f"Batch {batch_id}: {batch.status}")
+        time.sleep(poll_interval)
+
+def read_batch_output(batch: Any, client: Any) -> Dict[str, Dict[str, Any]]:
+    """Collect output and error records of a finished batch keyed by custom_id."""
+    records: Dict[str, Dict[str, Any]] = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            records[record["custom_id"]] = record
+    return records
+
+def batch_record_usage(record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if record is None:
+        return {}
+    body = (record.get("response") or {}).get("body") or {}
+    return summarize_usage(body.get("usage"))
+
+def batch_record_content(record: Optional[Dict[str, Any]]) -> str:
+    if record is None:
+        return "API_ERROR: missing from batch output"
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        return f"API_ERROR: {record.get('error') or response.get('body')}"
+    choices = response.get("body", {}).get("choices") or []
+    if choices and choices[0].get("message"):
+        return (choices[0]["message"].get("content") or "").strip()
+    return ""
+
+def run_batch(data: List[Dict[str, Any]], requests_path: str, client: Any, poll_interval: float = 30.0, batch_id: Optional[str] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    Submit every ``query`` prompt as a single batch job (or resume polling ``batch_id``)
+    and return the raw response text and usage per input index.
+    """
+    custom_ids = write_batch_requests(data, requests_path)
+    if batch_id is None:
+        batch_id = submit_batch(requests_path, client).id
+        print(f"Submitted batch {batch_id} with {len(custom_ids)} requests")
+    batch = poll_batch(batch_id, client, poll_interval)
+    if batch.status != "completed":
+        print(f"Batch {batch_id} finished with status {batch.status}")
+    records = read_batch_output(batch, client)
+    results = {
+        idx: {
+            "result": batch_record_content(records.get(custom_id)),
+            "usage": batch_record_usage(records.get(custom_id)),
+            "started_at": getattr(batch, "created_at", None),
+            "finished_at": getattr(batch, "completed_at", None),
+        }
+        for custom_id, idx in custom_ids.items()
+    }
+    # Failed and unprocessed (e.g. expired) requests keep an API_ERROR result,
+    # like failed calls in the concurrent runner.
+    failed = sorted(idx for idx, result in results.items() if result["result"].startswith("API_ERROR"))
+    if failed:
+        print(f"Batch {batch_id}: {len(failed)}/{len(results)} requests failed or were not processed, e.g. indices {failed[:10]}")
+    return results
+
+def main_batch(data: List[Dict[str, Any]], output_dir: str, name: str, client: Any, poll_interval: float = 30.0, batch_id: Optional[str] = None):
+    requests_path = os.path.join(output_dir, f"{name}_batch_requests.jsonl")
+    results = run_batch(data, requests_path, client, poll_interval=poll_interval, batch_id=batch_id)
+    run_id = f"{name}-{int(time.time())}"
+
+    results_by_index: Dict[int, Dict[str, Any]] = {}
+    updated_by_index: Dict[int, Dict[str, Any]] = {}
+    stream_log_path = os.path.join(output_dir, f"{name}_api_call_stream.jsonl")
+    stream_cleaned_path = os.path.join(output_dir, f"{name}_cleaned_stream.jsonl")
+    with open(stream_log_path, "a") as stream_log_f, open(stream_cleaned_path, "a") as stream_cleaned_f:
+        for idx in sorted(results.keys()):
+            result = results[idx]
+            # Per-request latency is not observable in batch mode; started/finished span the whole batch.
+            telemetry = {
+                "batch": True,
+                "started_at": result["started_at"],
+                "finished_at": result["finished_at"],
+                "retries": 0,
+                "cost_usd": estimate_cost(result["usage"], MODEL, batch=True),
+            }
+            res = build_result_entry(idx, data[idx], result["result"], result["usage"], telemetry)
+            updated_by_index[idx] = res["updated_entry"]
+            results_by_index[idx] = res["log_entry"]
+            write_stream_entries(res, stream_log_f, stream_cleaned_f, run_id)
+
+    write_outputs(output_dir, name, updated_by_index, results_by_index)
+    write_telemetry_summary(output_dir, name, stream_log_path, run_id)
+    return updated_by_index
+
+
+class LocalBatchClient:
+    """
+    In-process stand-in for the files/batches endpoints. Every request is answered
+    by ``responder`` (echoes the user prompt by default), which makes the batch
+    plumbing runnable without network access or API cost.
+
+    A responder that raises produces an error-file line for that request, and
+    one that returns ``None`` leaves the request out of both files (as in an
+    expired batch). ``status`` is the batch's final status, reached after
+    ``pending_polls`` ``in_progress`` retrievals; ``shuffle`` writes the output
+    out of input order, as the API is allowed to.
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None,
+        status: str = "completed",
+        pending_polls: int = 0,
+        shuffle: bool = False,
+    ):
+        self._responder = responder or (lambda body: body["messages"][-1]["content"])
+        self._status = status
+        self._pending_polls = pending_polls
+        self._shuffle = shuffle
+        self._files: Dict[str, str] = {}
+        self._batches: Dict[str, Any] = {}
+        self._polls: Dict[str, int] = {}
+        self._ids = itertools.count()
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _create_file(self, file: Any, purpose: str) -> Any:
+        file_id = f"file-local-{next(self._ids)}"
+        payload = file.read()
+        self._files[file_id] = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id: str) -> Any:
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _add_file(self, lines: List[str]) -> Optional[str]:
+        if not lines:
+            return None
+        file_id = f"file-local-{next(self._ids)}"
+        self._files[file_id] = "\n".join(lines)
+        return file_id
+
+    def _create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> Any:
+        output_lines = []
+        error_lines = []
+        for line in self._files[input_file_id].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                content = self._responder(request["body"])
+            except Exception as e:
+                error_lines.append(json.dumps({
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 500, "body": {"error": {"message": str(e)}}},
+                    "error": {"code": "server_error", "message": str(e)},
+                }))
+                continue
+            if content is None:
+                continue
+            output_lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"role": "assistant", "content": content}}]},
+                },
+                "error": None,
+            }))
+        if self._shuffle:
+            random.Random(0).shuffle(output_lines)
+        now = int(time.time())
+        batch = SimpleNamespace(
+            id=f"batch-local-{next(self._ids)}",
+            status="in_progress",
+            created_at=now,
+            completed_at=None,
+            endpoint=endpoint,
+            input_file_id=input_file_id,
+            output_file_id=self._add_file(output_lines),
+            error_file_id=self._add_file(error_lines),
+        )
+        self._batches[batch.id] = batch
+        self._polls[batch.id] = 0
+        return batch
+
+    def _retrieve_batch(self, batch_id: str) -> Any:
+        batch = self._batches[batch_id]
+        self._polls[batch_id] += 1
+        if self._polls[batch_id] > self._pending_polls and batch.status not in BATCH_TERMINAL_STATUSES:
+            batch.status = self._status
+            batch.completed_at = int(time.time())
+        return batch
     
 
 if __name__ == "__main__":
@@ -132,10 +432,18 @@ if __name__ == "__main__":
     parser.add_argument("data_path", type=str)
     parser.add_argument("output_dir", type=str)
     parser.add_argument("name", type=str)
+    parser.add_argument("--batch", action="store_true", help="Submit all queries as one batch job instead of concurrent calls.")
+    parser.add_argument("--batch-id", type=str, default=None, help="Resume polling an already submitted batch.")
+    parser.add_argument("--poll-interval", type=float, default=30.0)
+    parser.add_argument("--local-batch", action="store_true", help="Use the in-process LocalBatchClient instead of the API.")
     args = parser.parse_args()
     data_path = args.data_path
     output_dir = args.output_dir
     name = args.name
     os.makedirs(output_dir, exist_ok=True)
     data = load_data(data_path)
-    main(data, output_dir, name)
+    if args.batch or args.local_batch:
+        client = LocalBatchClient() if args.local_batch else OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=1000)
+        main_batch(data, output_dir, name, client, poll_interval=args.poll_interval, batch_id=args.batch_id)
+    else:
+        main(data, output_dir, name)
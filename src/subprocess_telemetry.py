@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import profiling
+from utils import percentile
+
+try:
+    import resource
+except ImportError:  # Windows: no wait4/rusage, only wall time is recorded
+    resource = None
+
+# Metrics JSONL appended to by ``run_command``; ``None`` records nothing.
+# Set per process with ``configure`` (worker processes need their own call).
+METRICS_PATH: Optional[str] = None
+DEFAULT_TIMEOUT: Optional[float] = None
+_write_lock = threading.Lock()
+
+
+def configure(metrics_path: Optional[str] = None, timeout: Optional[float] = None) -> None:
+    global METRICS_PATH, DEFAULT_TIMEOUT
+    METRICS_PATH = metrics_path
+    DEFAULT_TIMEOUT = timeout
+    if metrics_path:
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+
+def _max_rss_mb(rusage) -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    return rusage.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else rusage.ru_maxrss / 1024
+
+def _read_all(stream, chunks: List[bytes]) -> None:
+    chunks.append(stream.read())
+    stream.close()
+
+def _wait_with_rusage(proc: subprocess.Popen, timeout: Optional[float]):
+    """Reap ``proc`` with ``os.wait4``; on timeout kill its whole process group. Returns ``(status, rusage, timed_out)``."""
+    reaped = threading.Event()
+    timed_out = threading.Event()
+    lock = threading.Lock()
+
+    def kill() -> None:
+        with lock:
+            if reaped.is_set():
+                return
+            timed_out.set()
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    try:
+        while True:
+            try:
+                _, status, rusage = os.wait4(proc.pid, 0)
+                break
+            except InterruptedError:
+                continue
+    finally:
+        with lock:
+            reaped.set()
+        if timer is not None:
+            timer.cancel()
+    # Popen must not try to reap the pid again.
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return status, rusage, timed_out.is_set()
+
+def run_command(
+    cmd: Sequence[str],
+    label: str,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    merge_stderr: bool = False,
+    metrics_path: Optional[str] = None,
+    **context: Any,
+) -> subprocess.CompletedProcess:
+    """
+    ``subprocess.run(cmd, capture_output=True, text=True)`` that also records
+    wall time, CPU time, peak RSS, exit code and output sizes.
+
+    ``label`` names the tool call (e.g. ``"jixia_snippet"``) and ``context``
+    (section, index, ...) is stored with the metrics, which are appended to
+    ``metrics_path`` (default: the ``configure``d path). The child runs in its
+    own session so a timeout (default: the ``configure``d one) kills ``lake``
+    together with the ``lean``/``jixia`` process it started; as with
+    ``subprocess.run``, ``subprocess.TimeoutExpired`` is then raised, carrying
+    the output read so far.
+    """
+    timeout = timeout if timeout is not None else DEFAULT_TIMEOUT
+    timeout = timeout if timeout and timeout > 0 else None
+    profiling.count("subprocesses")
+    started_at = time.time()
+    start = time.perf_counter()
+
+    if resource is None or not hasattr(os, "wait4"):
+        try:
+            proc = subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE, timeout=timeout)
+            stdout, stderr, returncode, timed_out = proc.stdout, proc.stderr, proc.returncode, False
+        except subprocess.TimeoutExpired as e:
+            stdout, stderr, returncode, timed_out = e.stdout or b"", e.stderr or b"", None, True
+        rusage = None
+    else:
+        proc = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+            start_new_session=True,
+        )
+        # Drain both pipes in threads so a chatty child cannot block on a full pipe while we wait.
+        out_chunks: List[bytes] = []
+        err_chunks: List[bytes] = []
+        readers = [threading.Thread(target=_read_all, args=(proc.stdout, out_chunks), daemon=True)]
+        if not merge_stderr:
+            readers.append(threading.Thread(target=_read_all, args=(proc.stderr, err_chunks), daemon=True))
+        for reader in readers:
+            reader.start()
+        _, rusage, timed_out = _wait_with_rusage(proc, timeout)
+        for reader in readers:
+            reader.join()
+        stdout = b"".join(out_chunks)
+        stderr = None if merge_stderr else b"".join(err_chunks)
+        returncode = None if timed_out else proc.returncode
+
+    wall = time.perf_counter() - start
+    metrics: Dict[str, Any] = {
+        "timestamp": started_at,
+        "label": label,
+        **context,
+        "cmd": [str(c) for c in cmd],
+        "cwd": cwd,
+        "returncode": returncode,
+        "timed_out": timed_out,
+        "timeout_s": timeout,
+        "wall_s": round(wall, 4),
+        "user_s": round(rusage.ru_utime, 4) if rusage else None,
+        "sys_s": round(rusage.ru_stime, 4) if rusage else None,
+        "cpu_s": round(rusage.ru_utime + rusage.ru_stime, 4) if rusage else None,
+        "peak_rss_mb": round(_max_rss_mb(rusage), 1) if rusage else None,
+        "stdout_bytes": len(stdout or b""),
+        "stderr_bytes": len(stderr or b""),
+    }
+    record_metrics(metrics, metrics_path)
+    profiling.add_event(f"subprocess:{label}", started_at, started_at + wall, **context)
+
+    stdout_text = (stdout or b"").decode("utf-8", errors="replace")
+    stderr_text = None if stderr is None else stderr.decode("utf-8", errors="replace")
+    if timed_out:
+        raise subprocess.TimeoutExpired(list(cmd), timeout, output=stdout_text, stderr=stderr_text)
+    return subprocess.CompletedProcess(list(cmd), returncode, stdout=stdout_text, stderr=stderr_text)
+
+def record_metrics(metrics: Dict[str, Any], metrics_path: Optional[str] = None) -> None:
+    path = metrics_path or METRICS_PATH
+    if not path:
+        return
+    # One short line per append, so concurrent worker processes do not interleave.
+    with _write_lock, open(path, "a") as f:
+        f.write(json.dumps(metrics) + "\n")
+
+def load_metrics(metrics_path: str) -> List[Dict[str, Any]]:
+    with open(metrics_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summarize_metrics(entries: List[Dict[str, Any]], group_by: str = "label") -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        groups.setdefault(str(entry.get(group_by)), []).append(entry)
+    summary = {}
+    for key, items in sorted(groups.items()):
+        wall = [e["wall_s"] for e in items]
+        rss = [e["peak_rss_mb"] for e in items if e.get("peak_rss_mb") is not None]
+        summary[key] = {
+            "calls": len(items),
+            "failures": sum(1 for e in items if e.get("returncode") != 0),
+            "timeouts": sum(1 for e in items if e.get("timed_out")),
+            "wall_total_s": round(sum(wall), 2),
+            "wall_p50_s": percentile(wall, 50),
+            "wall_p95_s": percentile(wall, 95),
+            "cpu_total_s": round(sum(e.get("cpu_s") or 0 for e in items), 2),
+            "peak_rss_max_mb": max(rss) if rss else None,
+        }
+    return summary
+
+def print_metrics_summary(entries: List[Dict[str, Any]], group_by: str = "label", top: int = 10) -> None:
+    print(f"--- Subprocess telemetry ({len(entries)} calls, by {group_by}) ---")
+    print(f"{group_by:<28}{'calls':>7}{'fail':>6}{'t/o':>5}{'wall s':>10}{'p95 s':>9}{'cpu s':>10}{'rss MB':>9}")
+    for key, s in sorted(summarize_metrics(entries, group_by).items(), key=lambda item: -item[1]["wall_total_s"]):
+        rss = "n/a" if s["peak_rss_max_mb"] is None else f"{s['peak_rss_max_mb']:.0f}"
+        print(f"{key:<28}{s['calls']:>7}{s['failures']:>6}{s['timeouts']:>5}{s['wall_total_s']:>10.1f}{s['wall_p95_s']:>9.1f}{s['cpu_total_s']:>10.1f}{rss:>9}")
+    if top:
+        print(f"Slowest {top} calls:")
+        for e in sorted(entries, key=lambda e: -e["wall_s"])[:top]:
+            where = " ".join(f"{k}={e[k]}" for k in ("section", "index") if k in e)
+            print(f"  {e['wall_s']:>8.1f}s  {e['label']:<16} {where}  exit={e.get('returncode')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a subprocess metrics JSONL.")
+    parser.add_argument("metrics_path", type=str)
+    parser.add_argument("--group-by", type=str, default="label", help="Metrics field to group by, e.g. label or section.")
+    parser.add_argument("--top", type=int, default=10, help="List the N slowest calls.")
+    args = parser.parse_args()
+    print_metrics_summary(load_metrics(args.metrics_path), group_by=args.group_by, top=args.top)
@@ -1,16 +1,24 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
+import math
 import os
+from profiling import count
 
 def make_dir(output_dir: str, dir_path: str) -> str:
     os.makedirs(os.path.join(output_dir, dir_path), exist_ok=True)
     return os.path.join(output_dir, dir_path)
+def _count_read(f) -> None:
+    count("files_read")
+    count("bytes_read", os.fstat(f.fileno()).st_size)
+
 def load_jsonl(file_path: str) -> List[Dict[str, Any]]:
     with open(file_path, "r") as f:
+        _count_read(f)
         return [json.loads(line) for line in f]  
     
 def load_json(file_path: str) -> Dict[str, Any]:
     with open(file_path, "r") as f:
+        _count_read(f)
         return json.load(f)  
     
 def filter_baseline(baseline_data):
@@ -25,4 +33,12 @@ def filter_baseline(baseline_data):
     return aggregated_data 
 
 def sort_by_section(sections: list) -> list:
-    return sorted(sections, key=lambda x: (int(x.split("_")[1]), x.split("_")[2].split(".")[0]))
\ No newline at end of file
+    return sorted(sections, key=lambda x: (int(x.split("_")[1]), x.split("_")[2].split(".")[0]))
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, ``q`` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
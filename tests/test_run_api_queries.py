@@ -0,0 +1,93 @@
+"""
+End-to-end tests of batch mode (``main_batch``) against ``LocalBatchClient``.
+
+Run from the repository root with ``python -m pytest tests`` (or
+``python -m unittest discover tests``); needs the packages ``src`` imports.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from run_api_queries import LocalBatchClient, main_batch, submit_batch, write_batch_requests
+
+
+def make_queries(count):
+    return [
+        {"chapter_name": f"Section_2_{i}", "FQN": f"Chapter2.thm_{i}", "query": f"prompt {i}"}
+        for i in range(count)
+    ]
+
+def lean_answer(body):
+    return f"```lean\n-- {body['messages'][-1]['content']}\n```"
+
+
+class MainBatchTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.output_dir = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def read_output(self, name):
+        with open(os.path.join(self.output_dir, f"{name}.json")) as f:
+            return json.load(f)
+
+    def test_results_follow_query_index(self):
+        data = make_queries(12)
+        client = LocalBatchClient(lean_answer, pending_polls=2, shuffle=True)
+        updated = main_batch(data, self.output_dir, "run", client, poll_interval=0)
+
+        self.assertEqual(sorted(updated), list(range(12)))
+        for i, entry in updated.items():
+            self.assertEqual(entry["FQN"], data[i]["FQN"])
+            self.assertEqual(entry["content"], f"-- prompt {i}")
+        self.assertEqual([e["FQN"] for e in self.read_output("run")], [q["FQN"] for q in data])
+
+    def test_failed_and_expired_requests_are_reported(self):
+        data = make_queries(5)
+
+        def responder(body):
+            prompt = body["messages"][-1]["content"]
+            if prompt == "prompt 1":
+                raise RuntimeError("overloaded")
+            if prompt == "prompt 3":
+                return None  # never processed before the batch expired
+            return lean_answer(body)
+
+        client = LocalBatchClient(responder, status="expired")
+        main_batch(data, self.output_dir, "run", client, poll_interval=0)
+
+        with open(os.path.join(self.output_dir, "run_api_call_logging.json")) as f:
+            logged = json.load(f)
+        self.assertEqual(len(logged), 5)
+        self.assertIn("overloaded", logged[1]["result"])
+        self.assertTrue(logged[1]["result"].startswith("API_ERROR"))
+        self.assertEqual(logged[3]["result"], "API_ERROR: missing from batch output")
+        for i in (0, 2, 4):
+            self.assertEqual(logged[i]["query"]["content"], f"-- prompt {i}")
+
+    def test_resume_polls_the_existing_batch(self):
+        data = make_queries(4)
+        client = LocalBatchClient(lean_answer, pending_polls=1)
+        requests_path = os.path.join(self.output_dir, "submitted.jsonl")
+        write_batch_requests(data, requests_path)
+        batch_id = submit_batch(requests_path, client).id
+
+        def no_new_batch(**kwargs):
+            raise AssertionError("a resumed run must not submit another batch")
+
+        client.batches.create = no_new_batch
+        updated = main_batch(data, self.output_dir, "resumed", client, poll_interval=0, batch_id=batch_id)
+
+        self.assertEqual([updated[i]["content"] for i in range(4)], [f"-- prompt {i}" for i in range(4)])
+        self.assertEqual(len(self.read_output("resumed")), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Compare any number of verification runs at once.
+
+Every run (a verification_results.json, or a verify.py --out-jsonl file) is one
+column of a boolean problem x run matrix. Solved counts, unique solves,
+pairwise overlaps, McNemar tests and per-section pass rates are computed on
+that matrix, so five variants need one invocation instead of ten pairwise
+ones of compare_trans_performance.py.
+
+Requires numpy (``pip install numpy``); .parquet outputs also need pandas
+and pyarrow.
+
+Example:
+    python compare_runs.py gpt=../src/output/gpt/verification_results.json \
+        jixia_gpt=../src/output/jixia_gpt/verification_results.json \
+        baseline=../baseline_approach/baseline_results/verification_results.json \
+        --sections ../baseline_data/tao_analysis_baseline.jsonl \
+        --csv-output runs.csv --pairwise-output pairs.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    raise SystemExit("compare_runs.py needs numpy: pip install numpy")
+
+from compare_trans_performance import compiled_ok, load_results
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from utils import sort_by_section
+
+
+@dataclass
+class RunTable:
+    """Results of several runs aligned on problem index."""
+
+    labels: List[str]
+    indices: np.ndarray  # (problems,) sorted problem indices
+    status: np.ndarray  # (problems, runs) status string, "missing" when a run has no entry
+    solved: np.ndarray  # (problems, runs) bool, see compiled_ok
+    sections: Optional[np.ndarray] = None  # (problems,) section name, "" when unknown
+
+
+def load_run(path: Path) -> Dict[int, dict]:
+    """Like ``load_results`` but also reads verify.py ``--out-jsonl`` files (last entry per index wins)."""
+    if path.suffix != ".jsonl":
+        return load_results(path, verbose=False)
+    results: Dict[int, dict] = {}
+    with path.open() as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                results[entry["index"]] = entry
+    return results
+
+
+def load_sections(path: Path) -> Dict[int, str]:
+    """Problem index -> section from an input JSONL (``index`` field, else line position)."""
+    sections: Dict[int, str] = {}
+    with path.open() as f:
+        for position, line in enumerate(l for l in f if l.strip()):
+            row = json.loads(line)
+            sections[row.get("index", position)] = row.get("chapter_name", "")
+    return sections
+
+
+def build_table(runs: Sequence[Tuple[str, Path]], sections: Optional[Dict[int, str]] = None) -> RunTable:
+    loaded = [load_run(path) for _, path in runs]
+    indices = np.array(sorted(set().union(*loaded)), dtype=np.int64)
+    row_of = {idx: row for row, idx in enumerate(indices.tolist())}
+    status = np.full((len(indices), len(runs)), "missing", dtype=object)
+    solved = np.zeros((len(indices), len(runs)), dtype=bool)
+    for col, results in enumerate(loaded):
+        rows = np.fromiter((row_of[idx] for idx in results), dtype=np.int64, count=len(results))
+        entries = list(results.values())
+        status[rows, col] = [entry.get("status", "missing") for entry in entries]
+        solved[rows, col] = [compiled_ok(entry) for entry in entries]
+    table = RunTable([label for label, _ in runs], indices, status, solved)
+    if sections is not None:
+        table.sections = np.array([sections.get(idx, "") for idx in indices.tolist()], dtype=object)
+    return table
+
+
+def unique_solves(table: RunTable) -> np.ndarray:
+    """Per run, the number of problems no other run solved."""
+    solvers = table.solved.sum(axis=1, keepdims=True)
+    return (table.solved & (solvers == 1)).sum(axis=0)
+
+
+def pairwise_counts(table: RunTable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ``both[i, j]``: problems solved by runs i and j. ``only[i, j]``: solved by
+    i but not by j, so ``only[i, j]`` and ``only[j, i]`` are the discordant
+    pairs of a McNemar test between the two runs.
+    """
+    s = table.solved.astype(np.int64)
+    return s.T @ s, s.T @ (1 - s)
+
+
+def mcnemar_exact(b: int, c: int) -> float:
+    """Two-sided exact McNemar p-value for discordant counts ``b`` and ``c``."""
+    n = b + c
+    if n == 0:
+        return 1.0
+    tail = sum(math.comb(n, k) for k in range(min(b, c) + 1)) / 2 ** n
+    return min(1.0, 2 * tail)
+
+
+def mcnemar_matrix(only: np.ndarray) -> np.ndarray:
+    runs = only.shape[0]
+    p = np.ones((runs, runs))
+    for i in range(runs):
+        for j in range(i + 1, runs):
+            p[i, j] = p[j, i] = mcnemar_exact(int(only[i, j]), int(only[j, i]))
+    return p
+
+
+def section_pass_rates(table: RunTable) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Section names, problems per section and solved counts per (section, run)."""
+    if table.sections is None:
+        raise ValueError("table has no sections; pass --sections")
+    names, inverse = np.unique(table.sections.astype(str), return_inverse=True)
+    totals = np.bincount(inverse, minlength=len(names))
+    solved = np.zeros((len(names), len(table.labels)), dtype=np.int64)
+    np.add.at(solved, inverse, table.solved)
+    known = [name for name in names.tolist() if name]
+    order = [names.tolist().index(name) for name in sort_by_section(known) + ([""] if len(known) < len(names) else [])]
+    return [names[i] or "unknown" for i in order], totals[order], solved[order]
+
+
+def problem_rows(table: RunTable) -> Tuple[List[str], List[list]]:
+    headers = ["problem_index"] + (["section"] if table.sections is not None else [])
+    columns = [table.indices[:, None]] + ([table.sections[:, None]] if table.sections is not None else [])
+    for col, label in enumerate(table.labels):
+        headers += [f"{label}_status", f"{label}_compiled"]
+        columns += [table.status[:, col : col + 1], table.solved[:, col : col + 1]]
+    headers.append("solved_by")
+    columns.append(table.solved.sum(axis=1)[:, None])
+    return headers, np.concatenate([c.astype(object) for c in columns], axis=1).tolist()
+
+
+def pairwise_rows(table: RunTable) -> Tuple[List[str], List[list]]:
+    both, only = pairwise_counts(table)
+    p = mcnemar_matrix(only)
+    neither = len(table.indices) - both - only - only.T
+    headers = ["run_a", "run_b", "both", "a_only", "b_only", "neither", "delta", "mcnemar_p"]
+    rows = []
+    for i, j in zip(*np.triu_indices(len(table.labels), k=1)):
+        rows.append([
+            table.labels[i], table.labels[j], int(both[i, j]), int(only[i, j]), int(only[j, i]),
+            int(neither[i, j]), int(only[i, j] - only[j, i]), float(p[i, j]),
+        ])
+    return headers, rows
+
+
+def section_rows(table: RunTable) -> Tuple[List[str], List[list]]:
+    names, totals, solved = section_pass_rates(table)
+    headers = ["section", "problems"] + [f"{label}_solved" for label in table.labels] + [f"{label}_rate" for label in table.labels]
+    rates = solved / np.maximum(totals, 1)[:, None]
+    rows = [[name, int(total)] + counts + [round(r, 4) for r in rate] for name, total, counts, rate in zip(names, totals.tolist(), solved.tolist(), rates.tolist())]
+    return headers, rows
+
+
+def write_table(headers: List[str], rows: List[list], output_path: Path | None) -> None:
+    """Write ``rows`` as CSV (stdout if no path), or as Parquet for a ``.parquet`` path."""
+    if output_path is not None and output_path.suffix == ".parquet":
+        try:
+            import pandas as pd
+        except ImportError:
+            raise SystemExit("Parquet export needs pandas and pyarrow; use a .csv path instead.")
+        pd.DataFrame(rows, columns=headers).to_parquet(output_path, index=False)
+        return
+    f = output_path.open("w", newline="") if output_path else sys.stdout
+    try:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+    finally:
+        if output_path:
+            f.close()
+
+
+def print_summary(table: RunTable) -> None:
+    labels = table.labels
+    width = max(12, *(len(label) + 2 for label in labels))
+    solved = table.solved.sum(axis=0)
+    unique = unique_solves(table)
+    print(f"Compared {len(table.indices)} problems across {len(labels)} runs.")
+    print(f"Solved by any: {int(table.solved.any(axis=1).sum())}, by all: {int(table.solved.all(axis=1).sum())}")
+    print(f"\n{'run':<{width}}{'solved':>8}{'unique':>8}")
+    for label, s, u in zip(labels, solved.tolist(), unique.tolist()):
+        print(f"{label:<{width}}{s:>8}{u:>8}")
+
+    both, only = pairwise_counts(table)
+    print("\nSolved by both (row & column):")
+    print(" " * width + "".join(f"{label:>{width}}" for label in labels))
+    for i, label in enumerate(labels):
+        print(f"{label:<{width}}" + "".join(f"{int(v):>{width}}" for v in both[i]))
+
+    headers, rows = pairwise_rows(table)
+    print("\nPairwise (a_only / b_only are the McNemar discordant counts):")
+    for row in rows:
+        a, b, _, a_only, b_only, _, delta, p = row
+        print(f"  {a} vs {b}: {a_only} / {b_only}, delta {delta:+d}, p={p:.4g}")
+
+    if table.sections is not None:
+        names, totals, per_section = section_pass_rates(table)
+        print("\nPass rate by section:")
+        print(f"{'section':<16}{'n':>5}" + "".join(f"{label:>{width}}" for label in labels))
+        for name, total, counts in zip(names, totals.tolist(), per_section.tolist()):
+            print(f"{name:<16}{total:>5}" + "".join(f"{c / max(total, 1):>{width}.0%}" for c in counts))
+
+
+def parse_run(spec: str) -> Tuple[str, Path]:
+    """``label=path``, or a bare path labelled by its directory name."""
+    label, sep, path = spec.partition("=")
+    if not sep:
+        return Path(spec).parent.name or Path(spec).stem, Path(spec)
+    return label, Path(path)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare any number of verification result files (requires numpy)."
+    )
+    parser.add_argument("runs", nargs="+", help="Result files as label=path (label defaults to the parent directory name)")
+    parser.add_argument(
+        "--sections",
+        type=Path,
+        default=None,
+        help="Input JSONL giving each problem's chapter_name, for per-section pass rates",
+    )
+    parser.add_argument("--csv-output", type=Path, default=None, help="Per-problem table (.csv or .parquet)")
+    parser.add_argument("--pairwise-output", type=Path, default=None, help="Pairwise overlap / McNemar table (.csv or .parquet)")
+    parser.add_argument("--sections-output", type=Path, default=None, help="Per-section pass rates (.csv or .parquet)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    runs = [parse_run(spec) for spec in args.runs]
+    labels = [label for label, _ in runs]
+    if len(set(labels)) != len(labels):
+        raise SystemExit(f"Run labels must be unique, got {labels}; use label=path.")
+    table = build_table(runs, load_sections(args.sections) if args.sections else None)
+
+    print_summary(table)
+    if args.csv_output:
+        write_table(*problem_rows(table), args.csv_output)
+    if args.pairwise_output:
+        write_table(*pairwise_rows(table), args.pairwise_output)
+    if args.sections_output:
+        if table.sections is None:
+            raise SystemExit("--sections-output needs --sections")
+        write_table(*section_rows(table), args.sections_output)
+
+
+if __name__ == "__main__":
+    main()
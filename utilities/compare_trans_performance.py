@@ -16,8 +16,8 @@ from pathlib import Path
 from typing import Dict, List, Tuple
 
 
-def load_results(path: Path) -> Dict[int, dict]:
-    """Return a mapping from problem index to result entry."""
+def load_results(path: Path, verbose: bool = True) -> Dict[int, dict]:
+    """Return a mapping from problem index to result entry; ``verbose`` prints the entry counts."""
     with path.open() as f:
         data = json.load(f)
     if not isinstance(data, list):
@@ -30,7 +30,8 @@ def load_results(path: Path) -> Dict[int, dict]:
         if idx is None:
             raise ValueError(f"Entry without index in {path}: {entry}")
         results[idx] = entry
-    print(len(data), len(results))
+    if verbose:
+        print(len(data), len(results))
     return results
 
 
@@ -1,26 +1,53 @@
 import argparse
 import json
-import re
+import os
+import sys
 
-pattern = r'(?s)(theorem\b(?:(?!\btheorem\b).)*?:=\s*by(?:(?!\btheorem\b).)*?\bsorry\b)'
-fqn_pattern = r"(?m)^(\s*theorem\s+)(?:[A-Za-z0-9_]+\.)+([A-Za-z0-9_']+)"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
 
-replacement = r'\1\2'
+from lean_text import LeanDeclaration, iter_tokens, scan_declarations
 
 BASELINE_PATH = "../baseline_data/tao_analysis_baseline.jsonl"
 
 def remove_whitespace(text: str) -> str:
     return text.strip().replace(" ", "").replace("\n", "")
 
+def sorry_block_end(text: str, decl: LeanDeclaration) -> int | None:
+    """End of the first ``sorry`` after ``:= by`` in ``decl``, or None."""
+    previous = None
+    armed = False
+    for token in iter_tokens(text, decl.start, decl.stop):
+        if armed and token.value == "sorry":
+            return token.stop
+        if previous == ":=" and token.value == "by":
+            armed = True
+        previous = token.value
+    return None
+
+def last_theorem_block(text: str) -> tuple[LeanDeclaration, str] | None:
+    """The last ``theorem ... := by ... sorry`` block, found with one scan of ``text``."""
+    for decl in reversed(scan_declarations(text)):
+        if decl.kind != "theorem":
+            continue
+        end = sorry_block_end(text, decl)
+        if end is not None:
+            return decl, text[decl.start:end]
+    return None
+
 def extract_last_theorem_block(text: str) -> str | None:
-    matches = list(re.finditer(pattern, text))
-    return matches[-1].group(1) if matches else None
+    found = last_theorem_block(text)
+    return found[1] if found else None
 
-def strip_fqn_in_theorem_name(text: str) -> str:
-    try:
-        return re.sub(fqn_pattern, replacement, text)
-    except Exception as e:
+def strip_fqn_in_theorem_name(text: str | None) -> str:
+    """Last theorem block of ``text`` with its name reduced to the last component."""
+    found = last_theorem_block(text) if text else None
+    if found is None:
         return ""
+    decl, block = found
+    if decl.name is None:
+        return block
+    offset = decl.start
+    return block[:decl.name_start - offset] + decl.short_name + block[decl.name_stop - offset:]
 
 def load_jsonl(jsonl_path: str) -> list[dict]:
     with open(jsonl_path, "r") as f:
@@ -36,8 +63,8 @@ def verify_theorem_presence(jsonl_path: str, baseline_data: list[dict]):
     missing = []
     for idx, item in enumerate(baseline_data):
         content = item["content"].strip()
-        ground_truth = strip_fqn_in_theorem_name(extract_last_theorem_block(content))
-        extracted_theorem = strip_fqn_in_theorem_name(extract_last_theorem_block(data[idx]["content"]))
+        ground_truth = strip_fqn_in_theorem_name(content)
+        extracted_theorem = strip_fqn_in_theorem_name(data[idx]["content"])
         
         removed_whitespace_extracted_theorem = remove_whitespace(extracted_theorem)
         removed_whitespace_content = remove_whitespace(ground_truth)
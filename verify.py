@@ -15,26 +15,69 @@ e.g., --force-imports "Init,Mathlib.Tactic".
 
 import argparse
 import json
+import os
 import sys
 import tempfile
 import shutil
 from pathlib import Path
 import subprocess
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Set
 import time
 import math
 
+# Shared helpers live in src/.
+sys.path.append(str(Path(__file__).resolve().parent / "src"))
+
+from lean_diagnostics import parse_lean_output
+from results_store import ResultsStore, diagnostic_dicts
+import profiling
+import subprocess_telemetry
+from subprocess_telemetry import run_command
+
 LAKE_PROJECT = Path("/Users/alextaylor/Desktop/lean_prover/analysis/analysis")
 
-def load_jsonl(path: str) -> List[Any]:
-    rows: List[Any] = []
+def iter_jsonl(path: str) -> Iterator[Any]:
+    """Stream rows one at a time instead of loading the whole file."""
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
-            if not line:
+            if line:
+                yield json.loads(line)
+
+def completed_indices(results_jsonl: str) -> Set[Any]:
+    """Indices already recorded in an ``--out-jsonl`` file; unreadable lines are ignored."""
+    done: Set[Any] = set()
+    if not os.path.exists(results_jsonl):
+        return done
+    with open(results_jsonl, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["index"])
+            except (ValueError, KeyError):
                 continue
-            rows.append(json.loads(line))
-    return rows
+    return done
+
+def open_results_jsonl(path: str, resume: bool = False):
+    """
+    Open ``path`` for a fresh run, or with ``resume`` for appending after
+    dropping a torn last line left by a crash mid-write.
+    """
+    if not resume:
+        return open(path, "w", encoding="utf-8")
+    if os.path.exists(path):
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+    return open(path, "a", encoding="utf-8")
+
+def redact(result: Dict[str, Any], limit: int = 5000) -> Dict[str, Any]:
+    # Redact gigantic outputs a bit; the full text is kept in --db.
+    ro = dict(result)
+    for key in ("stdout", "stderr"):
+        if isinstance(ro.get(key), str) and len(ro[key]) > limit:
+            ro[key] = ro[key][:limit] + "\n...[truncated]..."
+    return ro
 
 def extract_code(entry: Any) -> str:
     if isinstance(entry, dict):
@@ -55,7 +98,7 @@ def build_source(body: str, imports: List[str]) -> str:
     # Do NOT try to keep existing imports above header; we want ours at file start if requested.
     return header + body
 
-def compile_with_lean(lean_exe: str, src_path: Path, timeout: int) -> subprocess.CompletedProcess:
+def compile_with_lean(lean_exe: str, src_path: Path, timeout: int, env: Dict[str, str] | None = None) -> subprocess.CompletedProcess:
     # Prefer `lean --make` so transitive imports (on LEAN_PATH) get built/checked.
     # Run from the snippet directory to improve relative import resolution.
     # Use Lake environment so Mathlib and other deps resolve.
@@ -63,25 +106,11 @@ def compile_with_lean(lean_exe: str, src_path: Path, timeout: int) -> subprocess
     cmd_plain = ["lake", "env", lean_exe, str(src_path)]
     run_cwd = str(LAKE_PROJECT)
     try:
-        proc = subprocess.run(
-            cmd_make,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=run_cwd,
-            timeout=timeout if timeout > 0 else None,
-        )
+        proc = run_command(cmd_make, "lean_make", cwd=run_cwd, env=env, timeout=timeout, file=str(src_path))
         if proc.returncode == 0:
             return proc
         # Fallback: try plain `lean` (no --make) which can be more permissive for standalone files
-        proc2 = subprocess.run(
-            cmd_plain,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=run_cwd,
-            timeout=timeout if timeout > 0 else None,
-        )
+        proc2 = run_command(cmd_plain, "lean", cwd=run_cwd, env=env, timeout=timeout, file=str(src_path))
         return proc2
     except subprocess.TimeoutExpired as e:
         # Synthesize a CompletedProcess-like object
@@ -99,14 +128,57 @@ def main():
         help="Comma-separated imports to force at file top, e.g. 'Init,Mathlib.Tactic'."
     )
     ap.add_argument("--out-json", default="", help="Optional path to write a JSON results report.")
+    ap.add_argument("--out-jsonl", default="", help="Optional append-only JSONL of results, flushed after every snippet.")
+    ap.add_argument("--prelude-dir", default="", help="Directory built by src/build_prelude.py; a snippet imports the precompiled prelude of its context closure when it contains that closure unchanged.")
+    ap.add_argument("--resume", action="store_true", help="Skip indices already present in --out-jsonl (or in --db for --run-id).")
     ap.add_argument("--keep-tmp", action="store_true", help="Keep temporary directories on disk for inspection.")
+    ap.add_argument("--db", default="", help="Optional SQLite results store; full output and parsed diagnostics are indexed there.")
+    ap.add_argument("--run-id", default="", help="Run id in --db (default: the input file name without extension).")
+    ap.add_argument("--subprocess-metrics", default="", help="Optional JSONL to append wall/CPU time, peak RSS and exit code of every lean call to.")
+    ap.add_argument("--profile", nargs="?", const="", default=None, help="Record per-snippet spans and counters into this directory (default: ./profile_<run-id>) and write a Chrome trace.")
+    ap.add_argument("--profiler", default="cprofile", choices=list(profiling.PROFILERS), help="Profiler for the whole verification loop with --profile.")
     args = ap.parse_args()
+    if args.resume and not (args.out_jsonl or args.db):
+        ap.error("--resume needs --out-jsonl or --db to know what is already done")
 
-    rows = load_jsonl(args.jsonl)
+    rows = iter_jsonl(args.jsonl)
     imports = [s.strip() for s in args.force_imports.split(",")] if args.force_imports else []
 
-    # Prepare output structure
+    # Prepare output structure. Results are only held in memory when a
+    # one-shot --out-json report is wanted without an --out-jsonl to rebuild it from.
     results: List[Dict[str, Any]] = []
+    keep_results = bool(args.out_json) and not args.out_jsonl
+    store = None
+    run_id = args.run_id or Path(args.jsonl).stem
+    if args.profile is not None:
+        profiling.enable(args.profile or f"profile_{run_id}", args.profiler)
+    if args.subprocess_metrics:
+        subprocess_telemetry.configure(args.subprocess_metrics)
+    done: Set[Any] = set()
+    if args.db:
+        store = ResultsStore(args.db)
+        store.start_run(run_id, source=args.jsonl, replace=not args.resume)
+        if args.resume:
+            done |= store.completed_indices(run_id)
+    if args.resume and args.out_jsonl:
+        done |= completed_indices(args.out_jsonl)
+    out_f = open_results_jsonl(args.out_jsonl, resume=args.resume) if args.out_jsonl else None
+
+    preludes: Dict[str, Any] = {}
+    prelude_env = None
+    prelude_hits = 0
+    if args.prelude_dir:
+        from build_prelude import load_manifest, preludes_by_section, select_prelude
+        preludes = preludes_by_section(load_manifest(args.prelude_dir))
+        prelude_env = dict(os.environ)
+        prelude_env["LEAN_PATH"] = os.pathsep.join(p for p in (str(Path(args.prelude_dir).resolve()), os.environ.get("LEAN_PATH", "")) if p)
+
+    def record(result: Dict[str, Any]) -> None:
+        if keep_results:
+            results.append(result)
+        if out_f is not None:
+            out_f.write(json.dumps(redact(result), ensure_ascii=False) + "\n")
+            out_f.flush()
 
     # We can reuse one temp dir for speed unless --keep-tmp
     time_prefix = math.floor(time.time())
@@ -114,68 +186,115 @@ def main():
     base_tmp_path = Path(base_tmp)
 
     try:
-        total = len(rows)
+        total = 0
         ok = 0
+        skipped = 0
 
-        for i, entry in enumerate(rows):
-            try:
-                code = extract_code(entry)
-                index = entry["index"]
-            except Exception as e:
-                results.append({
-                    "index": index,
-                    "status": "extract_failed",
-                    "error": str(e),
-                })
-                continue
+        with profiling.span("verify", stage=True):
+            for i, entry in enumerate(rows):
+                index = entry.get("index", i) if isinstance(entry, dict) else i
+                if index in done:
+                    skipped += 1
+                    continue
+                total += 1
+                try:
+                    code = extract_code(entry)
+                    index = entry["index"]
+                except Exception as e:
+                    failed = {
+                        "index": index,
+                        "status": "extract_failed",
+                        "error": str(e),
+                    }
+                    record(failed)
+                    if store is not None:
+                        store.add_result(run_id, failed, [])
+                    continue
 
-            # Create a per-snippet directory with a Main.lean
-            snip_dir = base_tmp_path / f"snippet_{index}"
-            snip_dir.mkdir(parents=True, exist_ok=True)
-            main_lean = snip_dir / "Main.lean"
+                # Create a per-snippet directory with a Main.lean
+                snip_dir = base_tmp_path / f"snippet_{index}"
+                snip_dir.mkdir(parents=True, exist_ok=True)
+                main_lean = snip_dir / "Main.lean"
 
-            src_text = build_source(code, imports)
-            main_lean.write_text(src_text, encoding="utf-8")
+                src_text = build_source(code, imports)
+                main_lean.write_text(src_text, encoding="utf-8")
 
-            proc = compile_with_lean(args.lean, main_lean, args.timeout)
+                candidates = preludes.get(entry.get("chapter_name"), ()) if isinstance(entry, dict) else ()
+                prelude, stripped = select_prelude(code, candidates)
+                prelude_text = None
+                if prelude is not None:
+                    prelude_hits += 1
+                    # The snippet contains every prelude declaration unchanged, so
+                    # this compile is as good as the snippet's own: a failure (or
+                    # timeout) is recorded as is rather than compiled again.
+                    prelude_text = build_source(stripped, imports + [prelude["module"]])
+                    prelude_lean = snip_dir / "Prelude.lean"
+                    prelude_lean.write_text(prelude_text, encoding="utf-8")
+                    with profiling.span("compile", index=index, prelude=True):
+                        proc = compile_with_lean(args.lean, prelude_lean, args.timeout, env=prelude_env)
+                else:
+                    with profiling.span("compile", index=index, prelude=False):
+                        proc = compile_with_lean(args.lean, main_lean, args.timeout)
 
-            status = "ok" if proc.returncode == 0 else "error"
-            if status == "ok":
-                ok += 1
+                status = "ok" if proc.returncode == 0 else "error"
+                if status == "ok":
+                    ok += 1
 
-            results.append({
-                "index": index,
-                "src_text": src_text,
-                "status": status,
-                "returncode": proc.returncode,
-                "stdout": proc.stdout,
-                "stderr": proc.stderr,
-                "tmp_dir": str(snip_dir) if args.keep_tmp else None,
-            })
+                with profiling.span("parse_diagnostics", index=index):
+                    diagnostics = parse_lean_output((proc.stdout or "") + "\n" + (proc.stderr or ""))
+                result = {
+                    "index": index,
+                    "src_text": src_text,
+                    "status": status,
+                    "returncode": proc.returncode,
+                    "stdout": proc.stdout,
+                    "stderr": proc.stderr,
+                    "diagnostics": diagnostic_dicts(diagnostics),
+                    "error_classes": sorted({d.error_class for d in diagnostics if d.severity == "error"}),
+                    "prelude": prelude["module"] if prelude_text is not None else None,
+                    # Diagnostics refer to this file when the prelude was used.
+                    "prelude_src_text": prelude_text,
+                    "tmp_dir": str(snip_dir) if args.keep_tmp else None,
+                }
+                with profiling.span("record", index=index):
+                    record(result)
+                    if store is not None:
+                        store.add_result(run_id, result, diagnostics)
 
-            # Print a compact line to console
-            tag = "PASS" if status == "ok" else f"FAIL({proc.returncode})"
-            print(f"[{i:04d}] {tag}")
+                # Print a compact line to console
+                tag = "PASS" if status == "ok" else f"FAIL({proc.returncode})"
+                print(f"[{i:04d}] {tag}")
 
         # Summary
         print("\n--- Summary ---")
         print(f"Total: {total}")
         print(f"Pass : {ok}")
         print(f"Fail : {total - ok}")
+        if skipped:
+            print(f"Skipped (already done): {skipped}")
+        if args.prelude_dir:
+            # Snippets that changed or dropped a context declaration cannot use a prelude.
+            print(f"Prelude: {prelude_hits}/{total} snippets ({prelude_hits / max(total, 1):.0%})")
 
         if args.out_json:
-            # Redact gigantic outputs a bit
-            out = []
-            for r in results:
-                ro = dict(r)
-                if isinstance(ro.get("stdout"), str) and len(ro["stdout"]) > 5000:
-                    ro["stdout"] = ro["stdout"][:5000] + "\n...[truncated]..."
-                if isinstance(ro.get("stderr"), str) and len(ro["stderr"]) > 5000:
-                    ro["stderr"] = ro["stderr"][:5000] + "\n...[truncated]..."
-                out.append(ro)
+            if out_f is not None:
+                # Report over everything this run recorded, including what an
+                # interrupted run recorded before --resume; the last row per index wins.
+                out_f.flush()
+                latest: Dict[Any, Any] = {}
+                for row in iter_jsonl(args.out_jsonl):
+                    latest[row.get("index")] = row
+                out = list(latest.values())
+            else:
+                out = [redact(r) for r in results]
             Path(args.out_json).write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
 
     finally:
+        if out_f is not None:
+            out_f.close()
+        if store is not None:
+            store.close()
+        profiling.finish()
         if not args.keep_tmp:
             try:
                 shutil.rmtree(base_tmp_path, ignore_errors=True)